@@ -1,12 +1,13 @@
 from flask import Flask
 from pymongo import MongoClient
+import os
 
 app = Flask(__name__, template_folder='templates')
 app.config['SECRET_KEY'] = '3f34d03d85aacf85899832be427defb2'
 
-# Database configuration
-client = MongoClient('mongodb://localhost:27017') 
-db = client['Uniberg']
+# Database configuration (MONGO_URI / MONGO_DB let scripts point the app at a scratch database)
+client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017'))
+db = client[os.environ.get('MONGO_DB', 'Uniberg')]
 
 staff_collection = db['Staff Collection']
 courses_collection = db['Courses Collection']
@@ -21,7 +22,14 @@ ca_collection = db['Continus Assessment']
 accounts_collection = db['Accounts']
 news_collection = db['News']
 users_collection = db ['Users']
+balances_collection = db['Student Balances']
+settings_collection = db['System Settings']
+standing_collection = db['Academic Standing']
+final_marks_collection = db['Final Marks']
+analytics_collection = db['Result Analytics']
+transcript_versions_collection = db['Transcript Versions']
 
+from app import commands
 from app.routes import home, staff, courses_program, student, grades, ca, accounts, news_feed, login, contact
 
 app.register_blueprint(home.bp)
@@ -38,13 +46,20 @@ app.register_blueprint(contact.bp)
 # Add this to your app initialization
 def create_grades_indexes():
     grades_collection.create_index([('student_id', 1), ('exam_type', 1), ('academic_year', 1), ('semester', 1)])
-    grades_collection.create_index([('course_id', 1)])
     grades_collection.create_index([('entered_at', -1)])
+    grades_collection.create_index([('last_write', 1)], sparse=True)
     
     # Create indexes for mock grades collection
     mock_grades_collection.create_index([('student_id', 1), ('academic_year', 1), ('semester', 1)])
-    mock_grades_collection.create_index([('course_id', 1)])
     mock_grades_collection.create_index([('entered_at', -1)])
+    mock_grades_collection.create_index([('last_write', 1)], sparse=True)
+    
+    # Course ids only live inside the embedded grades array: index that (multikey) for
+    # per-course reports, and drop the old top-level course_id index that nothing matched
+    for collection in (grades_collection, mock_grades_collection):
+        collection.create_index([('grades.course_id', 1), ('academic_year', 1), ('semester', 1)])
+        if 'course_id_1' in collection.index_information():
+            collection.drop_index('course_id_1')
     
 create_grades_indexes()
 
@@ -53,4 +68,35 @@ users_collection.create_index([('username', 1)], unique=True, sparse=True)
 users_collection.create_index([('student_number', 1)], unique=True, sparse=True)
 users_collection.create_index([('email', 1)], unique=True)
 users_collection.create_index([('student_id', 1)], unique=True, sparse=True)
-users_collection.create_index([('staff_id', 1)], unique=True, sparse=True)
\ No newline at end of file
+users_collection.create_index([('staff_id', 1)], unique=True, sparse=True)
+users_collection.create_index([('login_keys', 1)], unique=True, sparse=True)
+
+# Balance summaries: one overall document per student plus one per semester
+balances_collection.create_index([('student_id', 1), ('academic_year', 1), ('semester', 1)], unique=True)
+accounts_collection.create_index([('student_id', 1), ('created_at', 1), ('_id', 1)])
+accounts_collection.create_index([('created_at', -1), ('_id', -1)])
+
+# Prefix search keys for student lookup
+students_collection.create_index([('search_keys', 1), ('status', 1)])
+
+# Enrollments by term and course, for CA/grade searches filtered by course
+student_courses_collection.create_index([('academic_year', 1), ('semester', 1), ('course_id', 1), ('student_id', 1)])
+student_courses_collection.create_index([('student_id', 1), ('academic_year', 1), ('semester', 1)])
+
+# GPA/credit summaries: one per student, listed by program and standing
+standing_collection.create_index([('student_id', 1)], unique=True)
+standing_collection.create_index([('program_id', 1), ('standing', 1), ('cumulative_gpa', -1)])
+standing_collection.create_index([('standing', 1), ('cumulative_gpa', -1)])
+
+# Composite CA + exam marks, one per student, course and term
+final_marks_collection.create_index([('course_id', 1), ('academic_year', 1), ('semester', 1), ('student_id', 1)], unique=True)
+final_marks_collection.create_index([('student_id', 1), ('academic_year', 1), ('semester', 1)])
+ca_collection.create_index([('course_id', 1), ('academic_year', 1), ('semester', 1)])
+ca_collection.create_index([('student_id', 1), ('academic_year', -1), ('semester', -1)])
+
+# Precomputed result analytics: one document per course/program/school, term and exam type
+analytics_collection.create_index([('scope', 1), ('course_id', 1), ('program_id', 1), ('school_id', 1), ('academic_year', 1), ('semester', 1), ('exam_type', 1)], unique=True)
+analytics_collection.create_index([('scope', 1), ('academic_year', 1), ('semester', 1), ('exam_type', 1), ('pass_rate', 1)])
+
+# One-shot admin bootstrap at startup instead of on every /login request
+login.bootstrap_default_admin()
@@ -0,0 +1,193 @@
+from app import grades_collection, students_collection, standing_collection
+from app.catalog import catalog
+from app.config import SystemConfig
+from app.grading import GRADE_POINTS, PASSING_GRADES
+from app.stats import process_map
+from bson import ObjectId
+from pymongo import UpdateOne
+from datetime import datetime
+
+# GPA and credit summaries. `Academic Standing` holds one document per student with the
+# totals of every final-exam semester (keyed "<academic_year>_<semester>") plus the
+# cumulative GPA, attempted/earned credits and a standing label derived from them. When a
+# semester's grade document changes only that semester's totals are recomputed; the
+# cumulative figures are then re-summed from the stored semester totals inside the same
+# atomic update, so no grade history is read. Dean's list / probation lists are indexed
+# queries on (program_id, standing).
+
+# Grades that do not count as an attempt at the course
+NOT_ATTEMPTED_GRADES = frozenset(['WP', 'DC', 'INC', 'DEF'])
+
+def semester_key(academic_year, semester):
+    return f"{academic_year}_{semester}"
+
+def semester_totals(grade_entries, courses=None):
+    """Attempted/earned/graded credits, quality points and GPA for one semester's grade entries"""
+    courses = courses if courses is not None else catalog.by_id('courses')
+    totals = {'attempted_credits': 0, 'earned_credits': 0, 'graded_credits': 0, 'quality_points': 0.0}
+    for entry in grade_entries:
+        grade = entry.get('grade')
+        course = courses.get(str(entry.get('course_id')))
+        credits = (course.get('credits') or 0) if course else 0
+        if not grade or not credits:
+            continue
+        if grade not in NOT_ATTEMPTED_GRADES:
+            totals['attempted_credits'] += credits
+        if grade in PASSING_GRADES:
+            totals['earned_credits'] += credits
+        if grade in GRADE_POINTS:
+            totals['graded_credits'] += credits
+            totals['quality_points'] += GRADE_POINTS[grade] * credits
+    totals['quality_points'] = round(totals['quality_points'], 4)
+    totals['gpa'] = round(totals['quality_points'] / totals['graded_credits'], 2) if totals['graded_credits'] else None
+    return totals
+
+def _cumulative_stages():
+    """Pipeline stages re-summing the cumulative figures from the stored semester totals"""
+    semesters = {'$objectToArray': {'$ifNull': ['$semesters', {}]}}
+
+    def total(field):
+        return {'$sum': {'$map': {'input': semesters, 'as': 'semester', 'in': f'$$semester.v.{field}'}}}
+
+    return [
+        {'$set': {
+            'attempted_credits': total('attempted_credits'),
+            'earned_credits': total('earned_credits'),
+            'graded_credits': total('graded_credits'),
+            'quality_points': total('quality_points')
+        }},
+        {'$set': {
+            'cumulative_gpa': {'$cond': [
+                {'$gt': ['$graded_credits', 0]},
+                {'$round': [{'$divide': ['$quality_points', '$graded_credits']}, 2]},
+                None
+            ]}
+        }},
+        {'$set': {
+            'standing': {'$switch': {
+                'branches': [
+                    {'case': {'$eq': ['$cumulative_gpa', None]}, 'then': 'no_results'},
+                    {'case': {'$gte': ['$cumulative_gpa', SystemConfig.DEANS_LIST_GPA]}, 'then': 'deans_list'},
+                    {'case': {'$lt': ['$cumulative_gpa', SystemConfig.PROBATION_GPA]}, 'then': 'probation'}
+                ],
+                'default': 'good_standing'
+            }}
+        }}
+    ]
+
+def _semester_update(student_id, program_id, key, totals, now):
+    return UpdateOne(
+        {'student_id': student_id},
+        [{'$set': {
+            'program_id': program_id,
+            f'semesters.{key}': {'$literal': totals},
+            'updated_at': now
+        }}] + _cumulative_stages()
+    )
+
+def refresh_semesters(keys, batch_size=500):
+    """Recompute standing for the given (student_id, academic_year, semester) final-grade documents.
+
+    Reads just those semester documents and updates each student's summary in place.
+    Students without a summary yet get one rebuilt from all their grades, not just these
+    semesters.
+    """
+    keys = list({(ObjectId(student_id), academic_year, semester) for student_id, academic_year, semester in keys})
+    courses = catalog.by_id('courses')
+    updated = 0
+    for start in range(0, len(keys), batch_size):
+        chunk = keys[start:start + batch_size]
+        documents = {
+            (doc['student_id'], doc['academic_year'], doc['semester']): doc.get('grades', [])
+            for doc in grades_collection.find(
+                {'$or': [{'student_id': sid, 'academic_year': year, 'semester': sem} for sid, year, sem in chunk]},
+                {'student_id': 1, 'academic_year': 1, 'semester': 1, 'grades': 1}
+            )
+        }
+        programs = {
+            student['_id']: student.get('program_id')
+            for student in students_collection.find({'_id': {'$in': list({sid for sid, _, _ in chunk})}}, {'program_id': 1})
+        }
+
+        now = datetime.utcnow()
+        operations = [
+            _semester_update(sid, programs.get(sid), semester_key(year, sem), semester_totals(documents.get((sid, year, sem), []), courses), now)
+            for sid, year, sem in chunk
+        ]
+        result = standing_collection.bulk_write(operations, ordered=False)
+        if result.matched_count < len(operations):
+            # Never summarised - build from the full history, which already has this write
+            chunk_ids = list({sid for sid, _, _ in chunk})
+            summarised = set(standing_collection.distinct('student_id', {'student_id': {'$in': chunk_ids}}))
+            rebuild_students([sid for sid in chunk_ids if sid not in summarised], courses)
+        updated += len(operations)
+    return updated
+
+def refresh_semesters_safely(keys):
+    """refresh_semesters for write paths: a failure is logged, never raised to the caller"""
+    try:
+        refresh_semesters(keys)
+    except Exception as e:
+        print(f"Error refreshing academic standing: {str(e)}")
+
+def get_academic_standing(student_id):
+    """A student's GPA/credit summary, built from their grades the first time it is asked for"""
+    summary = standing_collection.find_one({'student_id': ObjectId(student_id)})
+    if summary is None:
+        rebuild_students([ObjectId(student_id)])
+        summary = standing_collection.find_one({'student_id': ObjectId(student_id)})
+    return summary
+
+def standing_list(standing, program_id=None, limit=500):
+    """Students with the given standing (e.g. 'deans_list', 'probation'), best GPA first"""
+    query = {'standing': standing}
+    if program_id:
+        query['program_id'] = ObjectId(program_id)
+    return list(standing_collection.find(query, {'semesters': 0}).sort('cumulative_gpa', -1).limit(limit))
+
+def rebuild_students(student_ids, courses=None):
+    """Rebuild the summaries of the given students from all their final grades; returns the count"""
+    courses = courses if courses is not None else catalog.by_id('courses')
+    student_ids = list(student_ids)
+    programs = {
+        student['_id']: student.get('program_id')
+        for student in students_collection.find({'_id': {'$in': student_ids}}, {'program_id': 1})
+    }
+    semesters = {sid: {} for sid in student_ids}
+    for doc in grades_collection.find(
+        {'student_id': {'$in': student_ids}},
+        {'student_id': 1, 'academic_year': 1, 'semester': 1, 'grades': 1}
+    ):
+        semesters[doc['student_id']][semester_key(doc['academic_year'], doc['semester'])] = semester_totals(doc.get('grades', []), courses)
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {'student_id': sid},
+            [{'$set': {'program_id': programs.get(sid), 'semesters': {'$literal': semesters[sid]}, 'updated_at': now}}]
+            + _cumulative_stages(),
+            upsert=True
+        )
+        for sid in student_ids
+    ]
+    if operations:
+        standing_collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+def rebuild_program(program_id, batch_size=500):
+    """Rebuild every summary for one program's students (program_id None = students without one)"""
+    courses = catalog.by_id('courses')
+    student_ids = [student['_id'] for student in students_collection.find({'program_id': program_id}, {'_id': 1})]
+    rebuilt = 0
+    for start in range(0, len(student_ids), batch_size):
+        rebuilt += rebuild_students(student_ids[start:start + batch_size], courses)
+    return rebuilt
+
+def rebuild_all(processes=None):
+    """Rebuild every summary, one program per worker process; returns {program_id: count}"""
+    program_ids = students_collection.distinct('program_id')
+    if None not in program_ids:
+        program_ids.append(None)
+
+    counts = process_map(rebuild_program, program_ids, processes)
+    return {str(program_id): count for program_id, count in zip(program_ids, counts)}
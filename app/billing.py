@@ -0,0 +1,115 @@
+from app import accounts_collection, students_collection, programs_collection, courses_collection, student_courses_collection
+from app.ledger import get_student_balances, record_transactions
+from app.utils import get_base_semester_fee
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+
+# Batch billing engine: prefetch every selected student in one $in query, compute each
+# balance_after in memory from the balance summaries, then write the whole batch with a
+# single ordered insert_many.
+
+def _parse_student_ids(student_ids, failures):
+    """Convert ids to ObjectIds (deduplicated, order kept), recording unparseable ones as failures"""
+    object_ids = []
+    seen = set()
+    for student_id in student_ids:
+        try:
+            object_id = ObjectId(student_id)
+        except (InvalidId, TypeError):
+            failures.append({'student_id': str(student_id), 'error': 'Invalid student ID'})
+            continue
+        if object_id not in seen:
+            seen.add(object_id)
+            object_ids.append(object_id)
+    return object_ids
+
+def get_semester_fees_for_students(students, semester, academic_year):
+    """Semester fees for many students at once, keyed by student ObjectId.
+
+    Uses one query each for programs, enrollments and courses instead of per-student, per-course lookups.
+    """
+    program_ids = list({s['program_id'] for s in students if s.get('program_id')})
+    programs = {p['_id']: p for p in programs_collection.find({'_id': {'$in': program_ids}}, {'level': 1})}
+
+    enrollments = list(student_courses_collection.find(
+        {
+            'student_id': {'$in': [s['_id'] for s in students]},
+            'semester': semester,
+            'academic_year': academic_year
+        },
+        {'student_id': 1, 'course_id': 1}
+    ))
+    course_ids = list({ec['course_id'] for ec in enrollments})
+    course_fees = {
+        c['_id']: c.get('course_fee', 0) or 0
+        for c in courses_collection.find({'_id': {'$in': course_ids}}, {'course_fee': 1})
+    }
+
+    enrolled_fees = {}
+    for ec in enrollments:
+        enrolled_fees[ec['student_id']] = enrolled_fees.get(ec['student_id'], 0) + course_fees.get(ec['course_id'], 0)
+
+    return {
+        s['_id']: get_base_semester_fee(programs.get(s.get('program_id'))) + enrolled_fees.get(s['_id'], 0)
+        for s in students
+    }
+
+def run_billing_batch(student_ids, build_transaction, amount_for=None):
+    """Create one transaction per student in a single round of reads and one bulk insert.
+
+    build_transaction(student, amount, current_balance) returns the transaction document
+    (balance_after is filled in here). amount_for(students) may return a dict of
+    per-student amounts keyed by ObjectId; a missing or non-positive amount skips the student.
+
+    Returns {'created': int, 'transactions': [...], 'failures': [{'student_id', 'error'}]}.
+    """
+    failures = []
+    object_ids = _parse_student_ids(student_ids, failures)
+
+    students = {
+        s['_id']: s
+        for s in students_collection.find({'_id': {'$in': object_ids}}, {'program_id': 1, 'school_id': 1})
+    }
+    for object_id in object_ids:
+        if object_id not in students:
+            failures.append({'student_id': str(object_id), 'error': 'Student not found'})
+
+    found = [students[oid] for oid in object_ids if oid in students]
+    amounts = amount_for(found) if amount_for else {}
+    balances = get_student_balances([s['_id'] for s in found])
+
+    transactions = []
+    for student in found:
+        amount = amounts.get(student['_id']) if amount_for else None
+        if amount_for and (not amount or amount <= 0):
+            failures.append({'student_id': str(student['_id']), 'error': 'No fees to bill'})
+            continue
+
+        current_balance = balances.get(str(student['_id']), 0)
+        transaction = build_transaction(student, amount, current_balance)
+        debit = transaction.get('debit', 0) or 0
+        credit = transaction.get('credit', 0) or 0
+        transaction['balance_after'] = current_balance + (debit if transaction['type'] == 'Billing' else -credit)
+        transactions.append(transaction)
+
+    inserted = transactions
+    if transactions:
+        try:
+            accounts_collection.insert_many(transactions, ordered=True)
+        except BulkWriteError as e:
+            # Ordered insert stops at the first error; everything after it was not written
+            inserted_count = e.details.get('nInserted', 0)
+            inserted = transactions[:inserted_count]
+            error_message = e.details.get('writeErrors', [{}])[0].get('errmsg', str(e))
+            for transaction in transactions[inserted_count:]:
+                failures.append({'student_id': str(transaction['student_id']), 'error': error_message})
+
+        if inserted:
+            record_transactions(inserted)
+
+    return {
+        'created': len(inserted),
+        'transactions': inserted,
+        'failures': failures
+    }
@@ -0,0 +1,171 @@
+from app import student_courses_collection, ca_collection
+from app.importing import (
+    build_student_number_map, build_course_code_map, resolve_student_course, iter_upload_rows, import_rows,
+    add_error, normalise_cell
+)
+from pymongo import UpdateOne
+from datetime import datetime
+
+# Bulk CA score import from CSV or XLSX. Each row is one assessment_breakdown item:
+#
+#   student_number, course_code, assessment_type, assessment_name, score, max_score
+#   [, academic_year, semester, assessment_date]
+#
+# Rows are read one at a time, validated against the maps built once per import and,
+# per batch, against enrollments with a single query; accepted items are then merged
+# into the CA records keyed like save_ca_scores (student, course, academic year,
+# semester) with one unordered bulk_write. Items are matched by name, and score /
+# total_score are recomputed from the breakdown, so importing the same sheet twice gives
+# the same records. If a write fails, the report says which row the import is committed
+# through and the upload can be resumed from the next row with start_row.
+
+CA_IMPORT_BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('student_number', 'course_code', 'score', 'max_score')
+
+def _parse_number(row, column):
+    value = normalise_cell(row.get(column))
+    if not value:
+        raise ValueError(f'{column} is required')
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{column} '{value}' is not a number")
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value
+    value = normalise_cell(value)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:10], '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"assessment_date '{value}' is not YYYY-MM-DD")
+
+def parse_ca_row(row, student_ids, course_ids, default_year, default_semester, item_counts):
+    """Validate one row; returns (key, breakdown_item, assessment_date) or raises ValueError"""
+    student_id, course_id = resolve_student_course(row, student_ids, course_ids)
+
+    score = _parse_number(row, 'score')
+    max_score = _parse_number(row, 'max_score')
+    if max_score <= 0:
+        raise ValueError('max_score must be greater than 0')
+    if not 0 <= score <= max_score:
+        raise ValueError(f'score {score:g} must be between 0 and max_score {max_score:g}')
+
+    academic_year = normalise_cell(row.get('academic_year')) or default_year
+    semester = normalise_cell(row.get('semester')) or default_semester
+    key = (student_id, course_id, academic_year, semester)
+
+    assessment_type = normalise_cell(row.get('assessment_type')).lower() or 'assignment'
+    name = normalise_cell(row.get('assessment_name'))
+    if not name:
+        # Number unnamed items per record the same way the CA entry form does (Quiz 1, Quiz 2, ...)
+        count_key = key + (assessment_type,)
+        item_counts[count_key] = item_counts.get(count_key, 0) + 1
+        name = f"{assessment_type.capitalize()} {item_counts[count_key]}"
+
+    item = {'type': assessment_type, 'name': name, 'score': score, 'max_score': max_score}
+    return key, item, _parse_date(row.get('assessment_date'))
+
+def _merge_update(records, now):
+    """Update pipeline merging breakdown items by name and recomputing the CA totals"""
+    items = list(records['items'].values())
+    names = [item['name'] for item in items]
+    return [
+        {'$set': {
+            'assessment_breakdown': {'$concatArrays': [
+                {'$filter': {
+                    'input': {'$ifNull': ['$assessment_breakdown', []]},
+                    'as': 'existing',
+                    'cond': {'$not': [{'$in': ['$$existing.name', names]}]}
+                }},
+                {'$literal': items}
+            ]},
+            'assessment_type': {'$ifNull': ['$assessment_type', items[0]['type']]},
+            'assessment_date': records['assessment_date'] or {'$ifNull': ['$assessment_date', now]},
+            'entered_by': {'$ifNull': ['$entered_by', 'CA Import']},
+            'entered_at': {'$ifNull': ['$entered_at', now]},
+            'updated_at': now
+        }},
+        {'$set': {
+            'score': {'$sum': '$assessment_breakdown.score'},
+            'total_score': {'$sum': '$assessment_breakdown.max_score'}
+        }}
+    ]
+
+def _enrolled_keys(batch):
+    """The (student, course, year, semester) keys of a batch that have an enrollment, in one query"""
+    keys = {key for _, (key, _, _) in batch}
+    enrolled = set()
+    for enrollment in student_courses_collection.find(
+        {
+            'student_id': {'$in': list({key[0] for key in keys})},
+            'course_id': {'$in': list({key[1] for key in keys})},
+            'academic_year': {'$in': list({key[2] for key in keys})},
+            'semester': {'$in': list({key[3] for key in keys})}
+        },
+        {'student_id': 1, 'course_id': 1, 'academic_year': 1, 'semester': 1}
+    ):
+        enrolled.add((enrollment['student_id'], enrollment['course_id'], enrollment['academic_year'], enrollment['semester']))
+    return keys & enrolled
+
+def _flush(batch, report):
+    """Validate a batch against enrollments and upsert its CA records; returns False if the write failed"""
+    enrolled = _enrolled_keys(batch)
+    records = {}
+    for line_number, (key, item, assessment_date) in batch:
+        if key not in enrolled:
+            add_error(report, line_number, 'student is not enrolled in this course for the given academic year and semester')
+            continue
+        record = records.setdefault(key, {'items': {}, 'assessment_date': None})
+        record['items'][item['name']] = item
+        record['assessment_date'] = assessment_date or record['assessment_date']
+        report['imported'] += 1
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {'student_id': student_id, 'course_id': course_id, 'academic_year': academic_year, 'semester': semester},
+            _merge_update(record, now),
+            upsert=True
+        )
+        for (student_id, course_id, academic_year, semester), record in records.items()
+    ]
+    try:
+        if operations:
+            ca_collection.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error writing CA import batch: {str(e)}")
+        report['imported'] -= sum(len(record['items']) for record in records.values())
+        report['failed'] = f"Write failed for rows {batch[0][0]}-{batch[-1][0]}: {str(e)}"
+        return False
+
+    report['records'] += len(operations)
+    report['committed_through_row'] = batch[-1][0]
+    return True
+
+def import_ca_scores(stream, filename, default_year, default_semester, start_row=2, batch_size=CA_IMPORT_BATCH_SIZE):
+    """Stream a CA sheet into ca_collection.
+
+    Rows before start_row are skipped so an interrupted import can be resumed. Returns
+    {'rows', 'imported', 'records', 'error_count', 'errors', 'committed_through_row',
+    'failed'}; errors lists {'row', 'error'} for rejected rows, capped at
+    MAX_REPORTED_ERRORS, and failed is set if a batch could not be written.
+    """
+    report = {
+        'rows': 0, 'imported': 0, 'records': 0, 'error_count': 0, 'errors': [],
+        'committed_through_row': None, 'failed': None
+    }
+    rows = iter_upload_rows(stream, REQUIRED_COLUMNS, filename)
+
+    student_ids = build_student_number_map()
+    course_ids = build_course_code_map()
+    item_counts = {}
+
+    # Skipped rows are still parsed so unnamed items get the same numbers on a resumed run
+    import_rows(
+        rows, lambda row: parse_ca_row(row, student_ids, course_ids, default_year, default_semester, item_counts),
+        lambda batch: _flush(batch, report), report, batch_size, start_row=start_row
+    )
+    return report
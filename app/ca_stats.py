@@ -0,0 +1,166 @@
+from app import ca_collection, courses_collection, students_collection
+from app.config import SystemConfig
+from app.stats import median
+from bson import ObjectId
+
+# CA statistics computed by the database. A student's CA history is joined to course
+# details, grouped per semester and totalled in one $lookup/$facet aggregation; course
+# statistics for lecturers (mean, median, grade distribution, at-risk students) come
+# from one $facet aggregation over the course's CA records.
+
+# CA grade boundaries used for the distribution buckets (lower bounds, see calculate_ca_grade)
+CA_GRADE_BOUNDARIES = [(80, 'A'), (70, 'B'), (60, 'C'), (50, 'D'), (0, 'F')]
+
+def _percentage_stage(default_total=None):
+    """$addFields computing ca_score, ca_total and percentage from a CA record"""
+    total = {'$ifNull': ['$total_score', 0]}
+    if default_total is not None:
+        # view_student_ca has always treated a missing or zero total as out of default_total
+        total = {'$cond': [{'$gt': [total, 0]}, total, default_total]}
+    return {'$addFields': {
+        'ca_score': {'$ifNull': ['$score', 0]},
+        'ca_total': total
+    }}
+
+_PERCENTAGE = {'$cond': [
+    {'$gt': ['$ca_total', 0]},
+    {'$multiply': [{'$divide': ['$ca_score', '$ca_total']}, 100]},
+    0
+]}
+
+def student_ca_summary(student_id):
+    """A student's CA records grouped per semester with semester and overall totals.
+
+    Returns (semesters, overall): semesters is a list (newest first) of
+    {'academic_year', 'semester', 'records', 'total_courses', 'total_score',
+    'total_possible'}; overall holds total_assessments, total_score, total_possible
+    and passed_courses.
+    """
+    pipeline = [
+        {'$match': {'student_id': ObjectId(student_id)}},
+        {'$lookup': {
+            'from': courses_collection.name,
+            'localField': 'course_id',
+            'foreignField': '_id',
+            'as': 'course'
+        }},
+        {'$unwind': '$course'},
+        _percentage_stage(default_total=40),
+        {'$addFields': {'percentage': _PERCENTAGE}},
+        {'$facet': {
+            'semesters': [
+                {'$sort': {'academic_year': -1, 'semester': -1, 'course_id': 1}},
+                {'$group': {
+                    '_id': {'academic_year': '$academic_year', 'semester': '$semester'},
+                    'records': {'$push': {
+                        'course_code': '$course.code',
+                        'course_name': '$course.name',
+                        'credits': {'$ifNull': ['$course.credits', 0]},
+                        'score': '$score',
+                        'total_score': '$ca_total',
+                        'percentage': '$percentage',
+                        'assessment_type': {'$ifNull': ['$assessment_type', 'assignment']},
+                        'assessment_breakdown': {'$cond': [{'$isArray': '$assessment_breakdown'}, '$assessment_breakdown', []]},
+                        'assessment_date': {'$ifNull': ['$assessment_date', '$entered_at']},
+                        'entered_at': '$entered_at'
+                    }},
+                    'total_courses': {'$sum': 1},
+                    'total_score': {'$sum': '$ca_score'},
+                    'total_possible': {'$sum': '$ca_total'}
+                }},
+                {'$sort': {'_id.academic_year': -1, '_id.semester': -1}}
+            ],
+            'overall': [
+                {'$group': {
+                    '_id': None,
+                    'total_assessments': {'$sum': 1},
+                    'total_score': {'$sum': '$ca_score'},
+                    'total_possible': {'$sum': '$ca_total'},
+                    'passed_courses': {'$sum': {'$cond': [{'$gte': ['$percentage', 50]}, 1, 0]}}
+                }}
+            ]
+        }}
+    ]
+    result = next(ca_collection.aggregate(pipeline), {'semesters': [], 'overall': []})
+
+    semesters = []
+    for row in result['semesters']:
+        row.update(row.pop('_id'))
+        semesters.append(row)
+    overall = result['overall'][0] if result['overall'] else {
+        'total_assessments': 0, 'total_score': 0, 'total_possible': 0, 'passed_courses': 0
+    }
+    overall.pop('_id', None)
+    return semesters, overall
+
+def course_ca_stats(course_id, academic_year, semester, at_risk_limit=50):
+    """Mean, median, min/max, CA grade distribution and at-risk students for one course and term"""
+    threshold = SystemConfig.CA_AT_RISK_PERCENTAGE
+    pipeline = [
+        {'$match': {'course_id': ObjectId(course_id), 'academic_year': academic_year, 'semester': semester}},
+        _percentage_stage(),
+        {'$match': {'ca_total': {'$gt': 0}}},
+        {'$addFields': {'percentage': _PERCENTAGE}},
+        {'$facet': {
+            'summary': [{'$group': {
+                '_id': None,
+                'students': {'$sum': 1},
+                'mean': {'$avg': '$percentage'},
+                'min': {'$min': '$percentage'},
+                'max': {'$max': '$percentage'},
+                'at_risk_count': {'$sum': {'$cond': [{'$lt': ['$percentage', threshold]}, 1, 0]}}
+            }}],
+            'percentages': [
+                {'$sort': {'percentage': 1}},
+                {'$group': {'_id': None, 'values': {'$push': '$percentage'}}}
+            ],
+            'distribution': [{'$bucket': {
+                'groupBy': '$percentage',
+                'boundaries': [low for low, _ in reversed(CA_GRADE_BOUNDARIES)] + [float('inf')],
+                'default': 'other',
+                'output': {'count': {'$sum': 1}}
+            }}],
+            'at_risk': [
+                {'$match': {'percentage': {'$lt': threshold}}},
+                {'$sort': {'percentage': 1}},
+                {'$limit': at_risk_limit},
+                {'$lookup': {
+                    'from': students_collection.name,
+                    'localField': 'student_id',
+                    'foreignField': '_id',
+                    'as': 'student'
+                }},
+                {'$project': {
+                    '_id': 0,
+                    'student_id': {'$toString': '$student_id'},
+                    'student_number': {'$first': '$student.student_number'},
+                    'f_name': {'$first': '$student.f_name'},
+                    'l_name': {'$first': '$student.l_name'},
+                    'percentage': {'$round': ['$percentage', 1]}
+                }}
+            ]
+        }}
+    ]
+    result = next(ca_collection.aggregate(pipeline))
+
+    summary = result['summary'][0] if result['summary'] else {'students': 0, 'mean': None, 'min': None, 'max': None, 'at_risk_count': 0}
+    summary.pop('_id', None)
+    values = result['percentages'][0]['values'] if result['percentages'] else []
+
+    grades_by_bound = dict(CA_GRADE_BOUNDARIES)
+    distribution = {grade: 0 for _, grade in CA_GRADE_BOUNDARIES}
+    for bucket in result['distribution']:
+        if bucket['_id'] in grades_by_bound:
+            distribution[grades_by_bound[bucket['_id']]] = bucket['count']
+
+    return {
+        'students': summary['students'],
+        'mean': round(summary['mean'], 1) if summary['mean'] is not None else None,
+        'median': round(median(values), 1) if values else None,
+        'min': round(summary['min'], 1) if summary['min'] is not None else None,
+        'max': round(summary['max'], 1) if summary['max'] is not None else None,
+        'at_risk_threshold': threshold,
+        'at_risk_count': summary['at_risk_count'],
+        'distribution': distribution,
+        'at_risk_students': result['at_risk']
+    }
@@ -0,0 +1,93 @@
+from app import schools_collection, programs_collection, courses_collection
+from app.config import SystemConfig
+import threading
+import time
+
+# In-process TTL cache for the academic catalog. Schools, programs and courses change a
+# few times a term but are read on nearly every request, so each collection is loaded
+# whole and served from memory until it expires or is invalidated by the courses_program
+# add_/edit_/delete_ routes. Cached documents are shared between requests - treat them
+# as read-only.
+
+CATALOG_COLLECTIONS = {
+    'schools': schools_collection,
+    'programs': programs_collection,
+    'courses': courses_collection
+}
+
+class CatalogCache:
+    """TTL cache serving dict-by-id and list-by-status views of catalog collections"""
+
+    def __init__(self, collections, ttl):
+        self.collections = collections
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _load(self, kind):
+        documents = list(self.collections[kind].find())
+        return {
+            'loaded_at': time.monotonic(),
+            'list': documents,
+            'by_id': {str(doc['_id']): doc for doc in documents}
+        }
+
+    def _entry(self, kind):
+        with self._lock:
+            entry = self._entries.get(kind)
+            if entry and time.monotonic() - entry['loaded_at'] < self.ttl:
+                self.hits += 1
+                return entry
+            if entry:
+                # Expired
+                self.evictions += 1
+                del self._entries[kind]
+            self.misses += 1
+
+        # Load outside the lock so a slow query doesn't block hits on other collections
+        entry = self._load(kind)
+        with self._lock:
+            self._entries[kind] = entry
+        return entry
+
+    def by_id(self, kind):
+        """All documents of a catalog collection keyed by string id"""
+        return self._entry(kind)['by_id']
+
+    def list(self, kind, status=None):
+        """All documents of a catalog collection, optionally only those with the given status"""
+        documents = self._entry(kind)['list']
+        if status is None:
+            return list(documents)
+        return [doc for doc in documents if doc.get('status') == status]
+
+    def get(self, kind, document_id):
+        """A single catalog document by id, or None"""
+        return self.by_id(kind).get(str(document_id)) if document_id else None
+
+    def invalidate(self, *kinds):
+        """Drop cached collections so the next read reloads them (all of them if none given)"""
+        with self._lock:
+            for kind in kinds or list(self._entries):
+                if self._entries.pop(kind, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        """Hit/miss/eviction counters and the current hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': (self.hits / lookups) if lookups else 0,
+                'cached': sorted(self._entries),
+                'ttl': self.ttl
+            }
+
+catalog = CatalogCache(CATALOG_COLLECTIONS, SystemConfig.CATALOG_CACHE_TTL)
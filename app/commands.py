@@ -0,0 +1,116 @@
+import click
+from datetime import datetime
+from app import app
+
+
+@app.cli.command('reconcile-balances')
+@click.option('--dry-run', is_flag=True, help='Report drift without rewriting the balance summaries.')
+def reconcile_balances_command(dry_run):
+    """Rebuild student balance summaries from the Accounts ledger and report any drift"""
+    from app.ledger import reconcile_balances
+
+    report = reconcile_balances(fix=not dry_run)
+    for item in report['drift']:
+        scope = f"{item['academic_year']} Sem {item['semester']}" if item['academic_year'] else 'overall'
+        click.echo(f"{item['student_id']} ({scope}): stored={item['stored_balance']} ledger={item['ledger_balance']}")
+
+    click.echo(f"Checked {report['checked']} summaries, {report['drifted']} drifted, {report['fixed']} fixed")
+
+
+@app.cli.command('create-default-admin')
+def create_default_admin_command():
+    """Create the default admin account if no admin exists yet"""
+    from app.routes.login import create_default_admin, DEFAULT_ADMIN_MARKER
+    from app import settings_collection
+
+    if not create_default_admin():
+        raise click.ClickException('Could not create the default admin account')
+    settings_collection.update_one({'_id': DEFAULT_ADMIN_MARKER}, {'$set': {'updated_at': datetime.utcnow()}}, upsert=True)
+    click.echo('Default admin account created/verified')
+
+
+@app.cli.command('migrate-login-keys')
+def migrate_login_keys_command():
+    """Populate login_keys and denormalised profile fields on existing user accounts"""
+    from app.users import migrate_login_keys
+
+    report = migrate_login_keys()
+    click.echo(f"Updated {report['updated']} user account(s)")
+    for collision in report['collisions']:
+        click.echo(f"Skipped user {collision['_id']}: login key(s) {', '.join(collision['login_keys'])} "
+                   f"already belong to another account", err=True)
+    if report['collisions']:
+        click.echo('Resolve the duplicate usernames/emails and run migrate-login-keys again; '
+                   'until then logins keep the fallback lookup', err=True)
+
+
+@app.cli.command('rebuild-search-keys')
+def rebuild_search_keys_command():
+    """Recompute the indexed search keys on every student"""
+    from app.search import rebuild_search_keys
+
+    updated = rebuild_search_keys()
+    click.echo(f"Rebuilt search keys for {updated} student(s)")
+
+
+@app.cli.command('regrade-course')
+@click.argument('course_code')
+@click.argument('academic_year')
+@click.argument('semester')
+@click.option('--exam-type', type=click.Choice(['final', 'mock']), default='final')
+def regrade_course_command(course_code, academic_year, semester, exam_type):
+    """Recompute a course's grades and remarks from marks using the current grade scale"""
+    from app import courses_collection
+    from app.grading import regrade_course
+
+    course = courses_collection.find_one({'code': course_code})
+    if not course:
+        raise click.ClickException(f"Course {course_code} not found")
+
+    updated = regrade_course(course['_id'], academic_year, semester, exam_type)
+    click.echo(f"Regraded {updated} {exam_type} grade entr{'y' if updated == 1 else 'ies'} for {course_code}")
+
+
+@app.cli.command('rebuild-academic-standing')
+@click.option('--processes', type=int, default=None, help='Worker processes (defaults to the CPU count).')
+def rebuild_academic_standing_command(processes):
+    """Rebuild every student's GPA/credit summary from their final grades, one program per worker"""
+    from app.academic_standing import rebuild_all
+
+    counts = rebuild_all(processes)
+    for program_id, count in counts.items():
+        click.echo(f"{program_id}: {count} student(s)")
+    click.echo(f"Rebuilt {sum(counts.values())} academic standing summaries")
+
+
+@app.cli.command('compute-final-marks')
+@click.argument('academic_year')
+@click.argument('semester')
+@click.option('--course', 'course_code', help='Only this course code.')
+@click.option('--school', 'school_id', help='Only courses in this school (id).')
+def compute_final_marks_command(academic_year, semester, course_code, school_id):
+    """Compute composite CA + exam final marks for a term (every course unless narrowed)"""
+    from app.catalog import catalog
+    from app.final_marks import compute_final_marks, courses_for_school
+
+    if course_code:
+        course_ids = [c['_id'] for c in catalog.list('courses') if c.get('code') == course_code]
+        if not course_ids:
+            raise click.ClickException(f"Course {course_code} not found")
+    elif school_id:
+        course_ids = courses_for_school(school_id)
+    else:
+        course_ids = [c['_id'] for c in catalog.list('courses')]
+
+    result = compute_final_marks(course_ids, academic_year, semester)
+    click.echo(f"Computed {result['computed']} final mark(s) across {result['courses']} course(s)")
+
+
+@app.cli.command('rebuild-result-analytics')
+@click.option('--processes', type=int, default=None, help='Worker processes (defaults to the CPU count).')
+def rebuild_result_analytics_command(processes):
+    """Recompute every course, program and school results summary from the grades"""
+    from app.result_analytics import rebuild_all
+
+    computed = rebuild_all(processes)
+    click.echo(f"Rebuilt result analytics for {computed} course term(s)")
@@ -20,4 +20,24 @@ class SystemConfig:
     }
     
     # Staff privilege levels that can override balance checks
-    GRADE_VIEW_PRIVILEGES = ['admin', 'registrar', 'finance', 'academics', 'admin_dvc', 'ict', 'admin_vc']
\ No newline at end of file
+    GRADE_VIEW_PRIVILEGES = ['admin', 'registrar', 'finance', 'academics', 'admin_dvc', 'ict', 'admin_vc']
+    
+    # How long a staff member's privilege level is trusted before re-reading it
+    STAFF_PRIVILEGE_CACHE_TTL = 60
+    
+    # Academic catalog cache (schools, programs, courses) lifetime in seconds
+    CATALOG_CACHE_TTL = 300
+    
+    # Per-student transcript read model: lifetime in seconds and how many students to keep
+    TRANSCRIPT_CACHE_TTL = 600
+    TRANSCRIPT_CACHE_SIZE = 5000
+    
+    # Cumulative GPA thresholds for the academic standing lists
+    DEANS_LIST_GPA = 4.0
+    PROBATION_GPA = 2.0
+    
+    # Percentage of a course's final mark that comes from CA when the course sets no ca_weight
+    DEFAULT_CA_WEIGHT = 40
+    
+    # Students below this CA percentage are flagged as at risk in course CA statistics
+    CA_AT_RISK_PERCENTAGE = 50
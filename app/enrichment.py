@@ -0,0 +1,68 @@
+from app.catalog import catalog
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Batched lookups for course/program/school details. Each helper collects every id
+# referenced by a list of documents, resolves them in one go per collection and attaches
+# the results in memory, so the number of queries per page stays constant no matter how
+# many rows are on it. Catalog collections are served from the catalog cache, so a warm
+# cache costs no queries at all.
+
+def _to_object_id(value):
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+def fetch_by_ids(collection, ids, projection=None):
+    """Resolve many ids with a single $in query, returning {str(id): document}"""
+    object_ids = {oid for oid in (_to_object_id(i) for i in ids if i) if oid}
+    if not object_ids:
+        return {}
+    return {str(doc['_id']): doc for doc in collection.find({'_id': {'$in': list(object_ids)}}, projection)}
+
+def fetch_catalog(kind, ids):
+    """Resolve many catalog ids from the catalog cache, returning {str(id): document}"""
+    documents = catalog.by_id(kind)
+    return {str(i): documents[str(i)] for i in ids if i and str(i) in documents}
+
+def enrich_programs(records, program_key='program_id', include_school=True):
+    """Attach 'program' (and the program's 'school') to each record that references a program"""
+    programs = fetch_catalog('programs', [r.get(program_key) for r in records])
+    schools = {}
+    if include_school:
+        schools = fetch_catalog('schools', [p.get('school_id') for p in programs.values()])
+
+    for record in records:
+        program = programs.get(str(record.get(program_key)))
+        record['program'] = program
+        if include_school:
+            record['school'] = schools.get(str(program.get('school_id'))) if program else None
+    return records
+
+def enrich_courses(records, course_key='course_id', include_program=True, include_school=True):
+    """Attach 'course', plus the course's 'program' and 'school', to each record that references a course.
+
+    Costs at most one query per collection (none on a warm catalog cache) regardless of
+    how many records are passed in.
+    """
+    courses = fetch_catalog('courses', [r.get(course_key) for r in records])
+
+    programs = {}
+    if include_program or include_school:
+        programs = fetch_catalog('programs', [c.get('program_id') for c in courses.values()])
+    schools = {}
+    if include_school:
+        schools = fetch_catalog('schools', [p.get('school_id') for p in programs.values()])
+
+    for record in records:
+        course = courses.get(str(record.get(course_key)))
+        record['course'] = course
+        program = programs.get(str(course.get('program_id'))) if course else None
+        if include_program:
+            record['program'] = program
+        if include_school:
+            record['school'] = schools.get(str(program.get('school_id'))) if program else None
+    return records
@@ -0,0 +1,111 @@
+from app import ca_collection, grades_collection, final_marks_collection
+from app.catalog import catalog
+from app.config import SystemConfig
+from app.grading import calculate_grade, get_remarks
+from bson import ObjectId
+from pymongo import UpdateOne
+from datetime import datetime
+
+# Composite final marks. Each course carries a `ca_weight` (percent of the final mark
+# that comes from continuous assessment, SystemConfig.DEFAULT_CA_WEIGHT if unset); the
+# rest comes from the final exam. For a set of courses and a term, CA totals are read
+# with one aggregation over `Continus Assessment`, exam marks with one aggregation over
+# `Grades` on the grades.course_id index, and the composite marks, grades and remarks are
+# upserted into `Final Marks` with one unordered bulk_write. The composite is rounded to
+# a whole mark before grading because the grade scale uses whole-mark ranges.
+
+def get_ca_weight(course):
+    """Share of the final mark (0-100) that comes from CA for a course"""
+    weight = course.get('ca_weight') if course else None
+    return SystemConfig.DEFAULT_CA_WEIGHT if weight is None else weight
+
+def composite_mark(ca_percentage, exam_marks, ca_weight):
+    """Weighted final mark, rounded half up to a whole mark"""
+    mark = ca_percentage * ca_weight / 100 + exam_marks * (100 - ca_weight) / 100
+    return int(mark + 0.5)
+
+def _ca_percentages(course_ids, academic_year, semester):
+    """{(student_id, course_id): CA percentage} for the given courses in one aggregation"""
+    percentages = {}
+    for row in ca_collection.aggregate([
+        {'$match': {'course_id': {'$in': course_ids}, 'academic_year': academic_year, 'semester': semester}},
+        {'$group': {
+            '_id': {'student_id': '$student_id', 'course_id': '$course_id'},
+            'score': {'$sum': {'$ifNull': ['$score', 0]}},
+            'total_score': {'$sum': {'$ifNull': ['$total_score', 0]}}
+        }}
+    ]):
+        if row['total_score']:
+            key = (row['_id']['student_id'], str(row['_id']['course_id']))
+            percentages[key] = min(row['score'] / row['total_score'] * 100, 100)
+    return percentages
+
+def _exam_entries(course_ids, academic_year, semester):
+    """{(student_id, course_id): exam grade entry} for the given courses in one aggregation"""
+    keys = [str(course_id) for course_id in course_ids]
+    return {
+        (row['student_id'], row['grade']['course_id']): row['grade']
+        for row in grades_collection.aggregate([
+            {'$match': {'grades.course_id': {'$in': keys}, 'academic_year': academic_year, 'semester': semester}},
+            {'$project': {'student_id': 1, 'grades': 1}},
+            {'$unwind': '$grades'},
+            {'$match': {'grades.course_id': {'$in': keys}}},
+            {'$project': {'_id': 0, 'student_id': 1, 'grade': '$grades'}}
+        ], allowDiskUse=True)
+    }
+
+def compute_final_marks(course_ids, academic_year, semester):
+    """Compute and store composite final marks for every student in the given courses and term.
+
+    Students with an exam mark but no CA record count as 0% CA. Exam entries without
+    marks (e.g. DEF, EX) carry their grade over. Returns {'computed', 'courses'}.
+    """
+    course_ids = [ObjectId(course_id) for course_id in course_ids]
+    courses = catalog.by_id('courses')
+    ca_percentages = _ca_percentages(course_ids, academic_year, semester)
+    exam_entries = _exam_entries(course_ids, academic_year, semester)
+
+    now = datetime.utcnow()
+    operations = []
+    for (student_id, course_id), exam in exam_entries.items():
+        ca_weight = get_ca_weight(courses.get(course_id))
+        ca_percentage = ca_percentages.get((student_id, course_id))
+        exam_marks = exam.get('marks')
+
+        if exam_marks is None:
+            final_mark = None
+            grade = exam.get('grade')
+        else:
+            final_mark = composite_mark(ca_percentage or 0, exam_marks, ca_weight)
+            grade = calculate_grade(final_mark)
+
+        operations.append(UpdateOne(
+            {'student_id': student_id, 'course_id': ObjectId(course_id), 'academic_year': academic_year, 'semester': semester},
+            {
+                '$set': {
+                    'ca_percentage': round(ca_percentage, 2) if ca_percentage is not None else None,
+                    'exam_marks': exam_marks,
+                    'ca_weight': ca_weight,
+                    'final_mark': final_mark,
+                    'grade': grade,
+                    'remarks': get_remarks(grade),
+                    'computed_at': now
+                }
+            },
+            upsert=True
+        ))
+
+    if operations:
+        final_marks_collection.bulk_write(operations, ordered=False)
+    return {'computed': len(operations), 'courses': len(course_ids)}
+
+def courses_for_school(school_id):
+    """Ids of every course in a school's programs, from the catalog cache"""
+    program_ids = {str(p['_id']) for p in catalog.list('programs') if str(p.get('school_id')) == str(school_id)}
+    return [c['_id'] for c in catalog.list('courses') if str(c.get('program_id')) in program_ids]
+
+def get_final_marks(course_id, academic_year, semester):
+    """Stored composite marks for a course and term"""
+    return list(final_marks_collection.find(
+        {'course_id': ObjectId(course_id), 'academic_year': academic_year, 'semester': semester}
+    ))
@@ -0,0 +1,145 @@
+from app import grades_collection, mock_grades_collection
+from app.grading import GRADE_SCALE, calculate_grade, get_remarks, is_grade_override
+from app.transcripts import invalidate_transcripts
+from app.academic_standing import refresh_semesters_safely
+from app.result_analytics import refresh_course_terms_safely
+from app.importing import (
+    build_student_number_map, build_course_code_map, resolve_student_course, iter_upload_rows, import_rows,
+    normalise_cell
+)
+from pymongo import UpdateOne
+from datetime import datetime
+
+# CSV grade import. The upload is read one row at a time; student numbers and course
+# codes are resolved through maps built once per import, and rows are grouped per
+# (student, academic year, semester) grade document and written with one bulk_write per
+# batch. Each document is updated with a pipeline that replaces only the imported
+# courses in its grades array, so re-importing a file is idempotent and grades entered
+# for other courses are kept.
+#
+# Expected columns: student_number, course_code, marks, and optionally grade (for
+# non-mark grades such as F, P, EX, DEF), academic_year and semester (which default to
+# the values chosen on the upload form).
+
+IMPORT_BATCH_SIZE = 1000
+EXAM_TYPES = ('final', 'mock')
+REQUIRED_COLUMNS = ('student_number', 'course_code')
+
+def parse_grade_row(row, student_ids, course_ids, default_year, default_semester):
+    """Validate one CSV row; returns (key, grade_entry) or raises ValueError with the reason"""
+    student_id, course_id = resolve_student_course(row, student_ids, course_ids)
+
+    marks = normalise_cell(row.get('marks'))
+    grade = normalise_cell(row.get('grade')).upper()
+    if marks:
+        try:
+            marks = float(marks)
+        except ValueError:
+            raise ValueError(f"marks '{marks}' is not a number")
+        if not 0 <= marks <= 100:
+            raise ValueError(f"marks {marks:g} out of range 0-100")
+        if marks.is_integer():
+            marks = int(marks)
+    else:
+        marks = None
+
+    if grade:
+        if grade not in GRADE_SCALE:
+            raise ValueError(f"unknown grade '{grade}'")
+    elif marks is not None:
+        grade = calculate_grade(marks)
+    else:
+        raise ValueError('either marks or grade is required')
+
+    academic_year = normalise_cell(row.get('academic_year')) or default_year
+    semester = normalise_cell(row.get('semester')) or default_semester
+    entry = {
+        'course_id': str(course_id),
+        'marks': marks,
+        'grade': grade,
+        'remarks': get_remarks(grade),
+        'grade_override': is_grade_override(marks, grade)
+    }
+    return (student_id, academic_year, semester), entry
+
+def _merge_update(exam_type, entries, now):
+    """Update pipeline replacing the given courses in a grade document's grades array"""
+    course_ids = [entry['course_id'] for entry in entries]
+    return [{
+        '$set': {
+            'exam_type': exam_type,
+            'grades': {'$concatArrays': [
+                {'$filter': {
+                    'input': {'$ifNull': ['$grades', []]},
+                    'as': 'existing',
+                    'cond': {'$not': [{'$in': ['$$existing.course_id', course_ids]}]}
+                }},
+                {'$literal': entries}
+            ]},
+            'entered_by': {'$ifNull': ['$entered_by', 'CSV Import']},
+            'entered_at': {'$ifNull': ['$entered_at', now]},
+            'updated_at': now,
+            # Bump the version like mark entry does, so a save based on an older read conflicts
+            'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}
+        }
+    }]
+
+def _flush(collection, exam_type, batch, written, course_terms):
+    """Write one batch of parsed rows grouped per grade document, recording the documents and course-terms written"""
+    pending = {}
+    for _, (key, entry) in batch:
+        # A later row for the same student/course/semester overrides an earlier one
+        pending.setdefault(key, {})[entry['course_id']] = entry
+
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {'student_id': student_id, 'academic_year': academic_year, 'semester': semester},
+            _merge_update(exam_type, list(entries.values()), now),
+            upsert=True
+        )
+        for (student_id, academic_year, semester), entries in pending.items()
+    ]
+    collection.bulk_write(operations, ordered=False)
+    written.update(pending)
+    course_terms.update(
+        (course_id, academic_year, semester, exam_type)
+        for (_, academic_year, semester), entries in pending.items()
+        for course_id in entries
+    )
+
+def import_grades_csv(stream, exam_type, default_year, default_semester, batch_size=IMPORT_BATCH_SIZE):
+    """Stream a grades CSV into the final or mock grades collection.
+
+    Returns {'rows', 'imported', 'documents', 'error_count', 'errors'} where errors lists
+    {'row', 'error'} for rejected rows (line numbers as shown in a spreadsheet), capped
+    at MAX_REPORTED_ERRORS. documents counts distinct grade documents, however many
+    batches their rows were spread over.
+    """
+    if exam_type not in EXAM_TYPES:
+        raise ValueError(f"Unknown exam type '{exam_type}'")
+    collection = mock_grades_collection if exam_type == 'mock' else grades_collection
+    report = {'rows': 0, 'imported': 0, 'documents': 0, 'errors': [], 'error_count': 0}
+
+    rows = iter_upload_rows(stream, REQUIRED_COLUMNS)
+
+    student_ids = build_student_number_map()
+    course_ids = build_course_code_map()
+    written = set()
+    course_terms = set()
+
+    def write_batch(batch):
+        report['imported'] += len(batch)
+        _flush(collection, exam_type, batch, written, course_terms)
+
+    import_rows(
+        rows, lambda row: parse_grade_row(row, student_ids, course_ids, default_year, default_semester),
+        write_batch, report, batch_size
+    )
+    report['documents'] = len(written)
+    if written:
+        invalidate_transcripts(*{student_id for student_id, _, _ in written})
+    if exam_type != 'mock':
+        refresh_semesters_safely(written)
+    refresh_course_terms_safely(course_terms)
+    return report
@@ -0,0 +1,187 @@
+# Grade scale and the rules that turn marks into grades and remarks
+
+from app import grades_collection, mock_grades_collection
+from pymongo import UpdateOne
+from bisect import bisect_right
+from datetime import datetime
+
+GRADE_SCALE = {
+    'A+': {'range': (86, 100), 'description': 'Distinction'},
+    'A': {'range': (76, 85), 'description': 'Distinction'},
+    'B+': {'range': (66, 75), 'description': 'Meritorious'},
+    'B': {'range': (60, 65), 'description': 'Credit'},
+    'C+': {'range': (55, 59), 'description': 'Clear Pass'},
+    'C': {'range': (50, 54), 'description': 'Bare Pass'},
+    'D+': {'range': (45, 49), 'description': 'Bare Fail'},
+    'D': {'range': (0, 44), 'description': 'Definite Fail'},
+    'F': {'range': None, 'description': 'Fail in Supplementary Exam'},
+    'U': {'range': None, 'description': 'Unsatisfactory - Fail in Practical/Thesis/Oral'},
+    'P': {'range': None, 'description': 'Pass in Supplementary/Practical'},
+    'S': {'range': None, 'description': 'Satisfactory - Pass in Practical/Oral'},
+    'WP': {'range': None, 'description': 'Withdraw with Permission'},
+    'DC': {'range': None, 'description': 'Deceased during Course'},
+    'EX': {'range': None, 'description': 'Exempted'},
+    'INC': {'range': None, 'description': 'Incomplete'},
+    'DEF': {'range': None, 'description': 'Deferred Exam'},
+    'SP': {'range': None, 'description': 'Supplementary Exam'},
+    'DISQ': {'range': None, 'description': 'Disqualified'}
+}
+
+# Grade points per credit for GPA; grades not listed (P, S, EX, WP, DEF, ...) carry no
+# points and their credits are left out of the GPA
+GRADE_POINTS = {
+    'A+': 5.0, 'A': 4.0, 'B+': 3.5, 'B': 3.0, 'C+': 2.5, 'C': 2.0,
+    'D+': 1.0, 'D': 0.0, 'F': 0.0, 'U': 0.0, 'DISQ': 0.0
+}
+
+DEFAULT_GRADE = 'D'  # Grade for marks that fall outside every range
+PASSING_GRADES = frozenset(['A+', 'A', 'B+', 'B', 'C+', 'C', 'P', 'S', 'EX'])
+
+# Marks are graded through a GradeTable built once per scale: a 0-100 lookup list for
+# whole marks and a sorted list of range lower bounds (bisected) for everything else,
+# so grading is O(1)/O(log n) per mark instead of a walk over GRADE_SCALE. The results
+# are identical to checking each range in turn, including marks that fall between two
+# ranges (e.g. 85.5) getting DEFAULT_GRADE.
+
+class GradeTable:
+    """Precomputed mark -> grade mapping for a grade scale"""
+
+    def __init__(self, scale):
+        self.ranges = sorted(
+            (info['range'][0], info['range'][1], grade)
+            for grade, info in scale.items() if info.get('range')
+        )
+        self.lower_bounds = [low for low, _, _ in self.ranges]
+        self.whole_marks = [self._search(mark) for mark in range(101)]
+
+    def _search(self, marks):
+        index = bisect_right(self.lower_bounds, marks) - 1
+        if index >= 0 and marks <= self.ranges[index][1]:
+            return self.ranges[index][2]
+        return DEFAULT_GRADE
+
+    def grade(self, marks):
+        """Grade for a single mark, or None if there is no mark"""
+        if marks is None:
+            return None
+        if isinstance(marks, int) and 0 <= marks <= 100:
+            return self.whole_marks[marks]
+        return self._search(marks)
+
+    def grade_many(self, marks):
+        """Grades for a sequence of marks"""
+        whole_marks = self.whole_marks
+        search = self._search
+        return [
+            None if m is None else whole_marks[m] if isinstance(m, int) and 0 <= m <= 100 else search(m)
+            for m in marks
+        ]
+
+_default_table = GradeTable(GRADE_SCALE)
+
+def grade_table(scale=None):
+    """GradeTable for the given scale (the shared GRADE_SCALE table if none is given)"""
+    return _default_table if scale is None else GradeTable(scale)
+
+def calculate_grade(marks):
+    """Calculate grade based on marks"""
+    return _default_table.grade(marks)
+
+def is_grade_override(marks, grade):
+    """True when a grade was entered by hand instead of being the one calculated from the marks"""
+    return marks is not None and grade is not None and grade != calculate_grade(marks)
+
+def grade_cohort(marks, scale=None):
+    """Grade a whole cohort's marks in one pass.
+
+    Returns parallel lists {'grades', 'remarks', 'passed'} in the order of marks. A
+    modified scale (e.g. after a boundary change) can be passed instead of GRADE_SCALE.
+    """
+    grades = grade_table(scale).grade_many(marks)
+    passed = [grade in PASSING_GRADES for grade in grades]
+    return {
+        'grades': grades,
+        'remarks': ['Proceed' if ok else 'Repeat' for ok in passed],
+        'passed': passed
+    }
+
+def regrade_course(course_id, academic_year, semester, exam_type='final', scale=None, batch_size=1000):
+    """Recompute grades and remarks from marks for every student's entry in one course.
+
+    Reads the course's entries once, grades them with grade_cohort and writes only the
+    entries whose grade changed, in batched bulk writes. Entries flagged grade_override,
+    and entries holding a grade that no mark range produces (DEF, EX, ...), were set by
+    hand and are left alone. Returns the number updated.
+    """
+    collection = mock_grades_collection if exam_type == 'mock' else grades_collection
+    course_id = str(course_id)
+
+    entries = []
+    for doc in collection.find(
+        {'academic_year': academic_year, 'semester': semester, 'grades.course_id': course_id},
+        {'student_id': 1, 'grades.$': 1}
+    ):
+        entry = doc['grades'][0]
+        if entry.get('marks') is None or entry.get('grade_override'):
+            continue
+        if entry.get('grade') and not (GRADE_SCALE.get(entry['grade']) or {}).get('range'):
+            continue
+        entries.append((doc, entry))
+
+    cohort = grade_cohort([entry['marks'] for _, entry in entries], scale)
+    now = datetime.utcnow()
+    changed = [
+        (doc, grade, remarks)
+        for (doc, entry), grade, remarks in zip(entries, cohort['grades'], cohort['remarks'])
+        if entry.get('grade') != grade or entry.get('remarks') != remarks
+    ]
+    operations = [
+        UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': {'grades.$[entry].grade': grade, 'grades.$[entry].remarks': remarks, 'updated_at': now},
+             '$inc': {'version': 1}},
+            array_filters=[{'entry.course_id': course_id}]
+        )
+        for doc, grade, remarks in changed
+    ]
+    for start in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[start:start + batch_size], ordered=False)
+
+    if operations:
+        # Imported here because the transcript, standing and analytics modules depend on this one
+        from app.transcripts import invalidate_transcripts
+        from app.academic_standing import refresh_semesters_safely
+        from app.result_analytics import refresh_course_terms_safely
+        invalidate_transcripts()
+        if exam_type != 'mock':
+            refresh_semesters_safely([(doc['student_id'], academic_year, semester) for doc, _, _ in changed])
+        refresh_course_terms_safely([(course_id, academic_year, semester, exam_type)])
+    return len(operations)
+
+def calculate_gpa(entries):
+    """Credit-weighted GPA of grade entries carrying 'grade' and 'credits'; None if nothing counts"""
+    points = 0.0
+    credits = 0
+    for entry in entries:
+        grade_points = GRADE_POINTS.get(entry.get('grade'))
+        entry_credits = entry.get('credits') or 0
+        if grade_points is None or not entry_credits:
+            continue
+        points += grade_points * entry_credits
+        credits += entry_credits
+    return round(points / credits, 2) if credits else None
+
+def get_grade_description(grade):
+    """Get description for a grade"""
+    return GRADE_SCALE.get(grade, {}).get('description', 'Unknown')
+
+def is_passing_grade(grade):
+    """Check if grade is passing (50 and above)"""
+    return grade in PASSING_GRADES
+
+def get_remarks(grade):
+    """Get remarks based on grade - either 'Proceed' or 'Repeat'"""
+    if is_passing_grade(grade):
+        return 'Proceed'
+    else:
+        return 'Repeat'
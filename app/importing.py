@@ -0,0 +1,128 @@
+from app import students_collection
+from app.catalog import catalog
+import csv
+import io
+
+# Shared plumbing for spreadsheet imports (grades, CA scores). Uploads are read one row
+# at a time from CSV or XLSX, student numbers and course codes are resolved through maps
+# built once per import, rejected rows are collected into the import report with their
+# spreadsheet line numbers, and accepted rows are handed to the importer in batches so
+# each batch can be written with one bulk_write.
+
+MAX_REPORTED_ERRORS = 500
+
+def normalise_cell(value):
+    """A spreadsheet cell as a trimmed string ('' for empty cells)"""
+    return str(value).strip() if value is not None else ''
+
+def build_student_number_map():
+    """{upper-cased student number: student _id} for every student, built with one query"""
+    return {
+        student['student_number'].strip().upper(): student['_id']
+        for student in students_collection.find({}, {'student_number': 1})
+        if student.get('student_number')
+    }
+
+def build_course_code_map():
+    """{upper-cased course code: course _id} from the catalog cache"""
+    return {
+        course['code'].strip().upper(): course['_id']
+        for course in catalog.list('courses')
+        if course.get('code')
+    }
+
+def resolve_student_course(row, student_ids, course_ids):
+    """(student_id, course_id) for a row's student_number and course_code, or raises ValueError"""
+    student_number = normalise_cell(row.get('student_number')).upper()
+    course_code = normalise_cell(row.get('course_code')).upper()
+    if not student_number or not course_code:
+        raise ValueError('student_number and course_code are required')
+
+    student_id = student_ids.get(student_number)
+    if student_id is None:
+        raise ValueError(f"unknown student number '{student_number}'")
+    course_id = course_ids.get(course_code)
+    if course_id is None:
+        raise ValueError(f"unknown course code '{course_code}'")
+    return student_id, course_id
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.reader(text):
+            yield row
+    finally:
+        text.detach()
+
+def _iter_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX upload requires the openpyxl package; upload a CSV instead')
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+def iter_upload_rows(stream, required_columns, filename=None):
+    """Yield (line_number, {column: value}) for each non-empty data row of a CSV or XLSX upload.
+
+    The filename's extension picks the format; without a filename the stream is read as
+    CSV. Column names are trimmed and lower-cased; a ValueError is raised for other file
+    types or if a required column is missing.
+    """
+    if filename is None or filename.lower().endswith('.csv'):
+        rows = _iter_csv(stream)
+    elif filename.lower().endswith('.xlsx'):
+        rows = _iter_xlsx(stream)
+    else:
+        raise ValueError('Please upload a CSV or XLSX file')
+
+    header = [normalise_cell(name).lower() for name in next(rows, [])]
+    missing = [column for column in required_columns if column not in header]
+    if missing:
+        rows.close()
+        raise ValueError(f"Upload is missing required column(s): {', '.join(missing)}")
+
+    for line_number, values in enumerate(rows, start=2):
+        if not any(normalise_cell(value) for value in values):
+            continue
+        yield line_number, dict(zip(header, values))
+
+def add_error(report, line_number, message):
+    """Record a rejected row, keeping at most MAX_REPORTED_ERRORS of them in the report"""
+    report['error_count'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'row': line_number, 'error': message})
+
+def import_rows(rows, parse_row, write_batch, report, batch_size, start_row=2):
+    """Parse upload rows and hand the valid ones to write_batch in batches.
+
+    parse_row(row) returns the parsed row or raises ValueError, which is recorded in the
+    report. write_batch(batch) gets a list of (line_number, parsed) and returns False to
+    stop the import. Rows before start_row are parsed but not written, so any state
+    parse_row keeps is the same on a resumed run. Returns False if a batch stopped it.
+    """
+    batch = []
+    for line_number, row in rows:
+        try:
+            parsed, error = parse_row(row), None
+        except ValueError as e:
+            parsed, error = None, str(e)
+        if line_number < start_row:
+            continue
+
+        report['rows'] += 1
+        if error:
+            add_error(report, line_number, error)
+            continue
+
+        batch.append((line_number, parsed))
+        if len(batch) >= batch_size:
+            if write_batch(batch) is False:
+                return False
+            batch = []
+    return write_batch(batch) is not False if batch else True
@@ -0,0 +1,291 @@
+from app import accounts_collection, balances_collection
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from datetime import datetime
+
+# Balance summaries live in `Student Balances`: one document per student with
+# academic_year/semester set to None, plus one document per (student, year, semester)
+# for semester-specific transactions. They are kept current with $inc on every write
+# to accounts_collection so balance lookups never have to scan the ledger.
+
+def _summary_key(student_id, academic_year=None, semester=None):
+    return {
+        'student_id': ObjectId(student_id),
+        'academic_year': academic_year,
+        'semester': semester
+    }
+
+def _split_amounts(transaction):
+    """Billing and clearing amounts carried by a transaction"""
+    if transaction.get('type') == 'Billing':
+        return transaction.get('debit', 0) or 0, 0
+    return 0, transaction.get('credit', 0) or 0
+
+def _apply_delta(transaction, billing, clearing):
+    """Atomically add billing/clearing deltas to the summaries a transaction belongs to"""
+    update = {
+        '$inc': {
+            'total_billing': billing,
+            'total_clearing': clearing,
+            'balance': billing - clearing
+        },
+        '$set': {'updated_at': datetime.utcnow()}
+    }
+
+    result = balances_collection.update_one(_summary_key(transaction['student_id']), update)
+    if result.matched_count == 0:
+        # Student was never seeded - build every summary from the ledger, which already has this write
+        rebuild_student_balance(transaction['student_id'])
+        return
+
+    if transaction.get('semester') and transaction.get('academic_year'):
+        # A seeded student with no summary for this semester simply had no transactions in it yet
+        balances_collection.update_one(
+            _summary_key(transaction['student_id'], transaction['academic_year'], transaction['semester']),
+            update,
+            upsert=True
+        )
+
+def record_transaction(transaction):
+    """Update balance summaries after a transaction has been inserted"""
+    try:
+        billing, clearing = _split_amounts(transaction)
+        _apply_delta(transaction, billing, clearing)
+    except Exception as e:
+        print(f"Error recording transaction in balance summary: {str(e)}")
+
+def adjust_transaction(old_transaction, new_transaction):
+    """Update balance summaries after an existing transaction was edited"""
+    try:
+        old_billing, old_clearing = _split_amounts(old_transaction)
+        new_billing, new_clearing = _split_amounts(new_transaction)
+
+        if old_billing == new_billing and old_clearing == new_clearing:
+            return
+
+        _apply_delta(new_transaction, new_billing - old_billing, new_clearing - old_clearing)
+    except Exception as e:
+        print(f"Error adjusting balance summary: {str(e)}")
+
+def get_student_balance(student_id):
+    """Current overall balance for a student, read from the balance summary"""
+    try:
+        summary = balances_collection.find_one(_summary_key(student_id), {'balance': 1})
+        if summary is None:
+            return rebuild_student_balance(student_id)
+        return summary.get('balance', 0)
+    except Exception as e:
+        print(f"Error reading balance for student {student_id}: {str(e)}")
+        return 0
+
+def get_semester_balance(student_id, semester, academic_year):
+    """Balance for a specific semester, read from the balance summary"""
+    try:
+        summary = balances_collection.find_one(_summary_key(student_id, academic_year, semester), {'balance': 1})
+        if summary is None:
+            # Seed the student's summaries; a missing semester simply has no transactions
+            rebuild_student_balance(student_id)
+            summary = balances_collection.find_one(_summary_key(student_id, academic_year, semester), {'balance': 1})
+        return summary.get('balance', 0) if summary else 0
+    except Exception as e:
+        print(f"Error reading semester balance for student {student_id}: {str(e)}")
+        return 0
+
+def get_semester_summaries(student_id):
+    """All of a student's per-semester summaries in one query, keyed by (academic_year, semester)"""
+    student_id = ObjectId(student_id)
+    summaries = list(balances_collection.find({'student_id': student_id}))
+    if not any(s.get('academic_year') is None for s in summaries):
+        # Student was never seeded
+        rebuild_student_balance(student_id)
+        summaries = list(balances_collection.find({'student_id': student_id}))
+    return {
+        (s['academic_year'], s['semester']): s
+        for s in summaries if s.get('academic_year') is not None
+    }
+
+def get_student_totals(student_ids):
+    """Overall balance, total billing and total clearing for many students in one query.
+
+    Keyed by string student id; students without a summary yet are seeded from the ledger.
+    """
+    object_ids = [ObjectId(sid) for sid in student_ids]
+    projection = {'student_id': 1, 'balance': 1, 'total_billing': 1, 'total_clearing': 1}
+    totals = {str(sid): {'balance': 0, 'total_billing': 0, 'total_clearing': 0} for sid in object_ids}
+
+    def read(ids):
+        found = set()
+        for summary in balances_collection.find(
+            {'student_id': {'$in': ids}, 'academic_year': None, 'semester': None}, projection
+        ):
+            totals[str(summary['student_id'])] = {
+                'balance': summary.get('balance', 0),
+                'total_billing': summary.get('total_billing', 0),
+                'total_clearing': summary.get('total_clearing', 0)
+            }
+            found.add(summary['student_id'])
+        return [sid for sid in ids if sid not in found]
+
+    missing = read(object_ids)
+    if missing:
+        rebuild_student_balances(missing)
+        read(missing)
+    return totals
+
+def get_student_balances(student_ids):
+    """Overall balances for many students in one query, keyed by string student id"""
+    return {sid: t['balance'] for sid, t in get_student_totals(student_ids).items()}
+
+def _ledger_totals_pipeline(match):
+    """Aggregate billing/clearing totals per student and per student-semester"""
+    return [
+        {'$match': match},
+        {
+            '$group': {
+                '_id': {
+                    'student_id': '$student_id',
+                    'academic_year': {'$ifNull': ['$academic_year', None]},
+                    'semester': {'$ifNull': ['$semester', None]}
+                },
+                'total_billing': {'$sum': {'$cond': [{'$eq': ['$type', 'Billing']}, {'$ifNull': ['$debit', 0]}, 0]}},
+                'total_clearing': {'$sum': {'$cond': [{'$ne': ['$type', 'Billing']}, {'$ifNull': ['$credit', 0]}, 0]}}
+            }
+        }
+    ]
+
+def _summaries_from_ledger(match):
+    """Build summary documents from the raw ledger, keyed by (student_id, academic_year, semester)"""
+    summaries = {}
+    for row in accounts_collection.aggregate(_ledger_totals_pipeline(match), allowDiskUse=True):
+        student_id = row['_id']['student_id']
+        academic_year = row['_id']['academic_year']
+        semester = row['_id']['semester']
+
+        overall = summaries.setdefault((student_id, None, None), {
+            'student_id': student_id, 'academic_year': None, 'semester': None,
+            'total_billing': 0, 'total_clearing': 0
+        })
+        overall['total_billing'] += row['total_billing']
+        overall['total_clearing'] += row['total_clearing']
+
+        if academic_year and semester:
+            summaries[(student_id, academic_year, semester)] = {
+                'student_id': student_id, 'academic_year': academic_year, 'semester': semester,
+                'total_billing': row['total_billing'], 'total_clearing': row['total_clearing']
+            }
+
+    for summary in summaries.values():
+        summary['balance'] = summary['total_billing'] - summary['total_clearing']
+    return summaries
+
+def rebuild_student_balance(student_id):
+    """Rebuild one student's balance summaries from the ledger and return the overall balance"""
+    return rebuild_student_balances([student_id]).get(str(ObjectId(student_id)), 0)
+
+def rebuild_student_balances(student_ids):
+    """Rebuild balance summaries for many students with one aggregation and one bulk write"""
+    object_ids = [ObjectId(sid) for sid in student_ids]
+    try:
+        summaries = _summaries_from_ledger({'student_id': {'$in': object_ids}})
+        for student_id in object_ids:
+            summaries.setdefault((student_id, None, None), {
+                'student_id': student_id, 'academic_year': None, 'semester': None,
+                'total_billing': 0, 'total_clearing': 0, 'balance': 0
+            })
+
+        now = datetime.utcnow()
+        operations = []
+        for key, summary in summaries.items():
+            summary['updated_at'] = now
+            operations.append(ReplaceOne(_summary_key(*key), summary, upsert=True))
+        balances_collection.bulk_write(operations, ordered=False)
+
+        return {str(sid): summaries[(sid, None, None)]['balance'] for sid in object_ids}
+    except Exception as e:
+        print(f"Error rebuilding balances for {len(object_ids)} student(s): {str(e)}")
+        return {str(sid): 0 for sid in object_ids}
+
+def record_transactions(transactions):
+    """Update balance summaries for a batch of inserted transactions in one bulk write.
+
+    Every student in the batch must already have a summary (get_student_balances seeds them).
+    """
+    deltas = {}
+    for transaction in transactions:
+        billing, clearing = _split_amounts(transaction)
+        keys = [(transaction['student_id'], None, None)]
+        if transaction.get('semester') and transaction.get('academic_year'):
+            keys.append((transaction['student_id'], transaction['academic_year'], transaction['semester']))
+        for key in keys:
+            total = deltas.setdefault(key, [0, 0])
+            total[0] += billing
+            total[1] += clearing
+
+    if not deltas:
+        return
+
+    now = datetime.utcnow()
+    balances_collection.bulk_write([
+        UpdateOne(
+            _summary_key(*key),
+            {
+                '$inc': {'total_billing': billing, 'total_clearing': clearing, 'balance': billing - clearing},
+                '$set': {'updated_at': now}
+            },
+            upsert=True
+        )
+        for key, (billing, clearing) in deltas.items()
+    ], ordered=False)
+
+def reconcile_balances(fix=True):
+    """Compare every balance summary against the raw ledger and report (and optionally repair) drift"""
+    expected = _summaries_from_ledger({})
+    stored = {
+        (s['student_id'], s.get('academic_year'), s.get('semester')): s
+        for s in balances_collection.find({})
+    }
+
+    drift = []
+    operations = []
+    now = datetime.utcnow()
+
+    for key, summary in expected.items():
+        current = stored.get(key)
+        current_balance = current.get('balance', 0) if current else None
+        if current is None or current_balance != summary['balance'] \
+                or current.get('total_billing') != summary['total_billing'] \
+                or current.get('total_clearing') != summary['total_clearing']:
+            drift.append({
+                'student_id': str(key[0]),
+                'academic_year': key[1],
+                'semester': key[2],
+                'stored_balance': current_balance,
+                'ledger_balance': summary['balance']
+            })
+            summary['updated_at'] = now
+            operations.append(ReplaceOne(_summary_key(*key), summary, upsert=True))
+
+    # Summaries with no transactions behind them should be zero
+    for key, current in stored.items():
+        if key not in expected and current.get('balance', 0) != 0:
+            drift.append({
+                'student_id': str(key[0]),
+                'academic_year': key[1],
+                'semester': key[2],
+                'stored_balance': current.get('balance', 0),
+                'ledger_balance': 0
+            })
+            operations.append(ReplaceOne(_summary_key(*key), {
+                'student_id': key[0], 'academic_year': key[1], 'semester': key[2],
+                'total_billing': 0, 'total_clearing': 0, 'balance': 0, 'updated_at': now
+            }, upsert=True))
+
+    if fix and operations:
+        balances_collection.bulk_write(operations, ordered=False)
+
+    return {
+        'checked': len(expected),
+        'drifted': len(drift),
+        'fixed': len(operations) if fix else 0,
+        'drift': drift
+    }
@@ -0,0 +1,408 @@
+from app import students_collection, student_courses_collection, grades_collection, mock_grades_collection, ca_collection
+from app.grading import GRADE_SCALE, calculate_grade, get_remarks, is_grade_override
+from app.transcripts import invalidate_transcripts
+from app.academic_standing import refresh_semesters_safely
+from app.result_analytics import refresh_course_terms_safely
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+
+# Course-centric mark entry: a lecturer loads one course's class list for a term with
+# every student's existing final, mock and CA marks, and saves the whole class at once.
+# Final/mock grade documents hold one array element per course, so a save only ever
+# touches that course's element (arrayFilters); CA records are already one document per
+# student and course. Grade documents carry a version counter that every write bumps, so
+# student-centric saves (save_semester_grades) can detect concurrent edits.
+
+def load_course_roster(course_id, academic_year, semester):
+    """Students enrolled in a course for a term with their final, mock and CA marks, in one aggregation"""
+    course_id = ObjectId(course_id)
+
+    def grade_lookup(collection, field):
+        return {'$lookup': {
+            'from': collection.name,
+            'let': {'student_id': '$student_id'},
+            'pipeline': [
+                {'$match': {
+                    '$expr': {'$eq': ['$student_id', '$$student_id']},
+                    'academic_year': academic_year,
+                    'semester': semester
+                }},
+                {'$project': {'_id': 0, 'entry': {'$filter': {
+                    'input': {'$ifNull': ['$grades', []]},
+                    'as': 'grade',
+                    'cond': {'$eq': ['$$grade.course_id', str(course_id)]}
+                }}}}
+            ],
+            'as': field
+        }}
+
+    pipeline = [
+        {'$match': {'course_id': course_id, 'academic_year': academic_year, 'semester': semester}},
+        {'$lookup': {
+            'from': students_collection.name,
+            'localField': 'student_id',
+            'foreignField': '_id',
+            'as': 'student'
+        }},
+        {'$unwind': '$student'},
+        grade_lookup(grades_collection, 'final'),
+        grade_lookup(mock_grades_collection, 'mock'),
+        {'$lookup': {
+            'from': ca_collection.name,
+            'let': {'student_id': '$student_id'},
+            'pipeline': [
+                {'$match': {
+                    '$expr': {'$eq': ['$student_id', '$$student_id']},
+                    'course_id': course_id,
+                    'academic_year': academic_year,
+                    'semester': semester
+                }},
+                {'$project': {'_id': 0, 'score': 1, 'total_score': 1}}
+            ],
+            'as': 'ca'
+        }},
+        {'$project': {
+            'student_id': 1,
+            'student_number': '$student.student_number',
+            'f_name': '$student.f_name',
+            'l_name': '$student.l_name',
+            'final': {'$first': {'$ifNull': [{'$first': '$final.entry'}, []]}},
+            'mock': {'$first': {'$ifNull': [{'$first': '$mock.entry'}, []]}},
+            'ca': {'$first': '$ca'}
+        }},
+        {'$sort': {'l_name': 1, 'f_name': 1, 'student_id': 1}}
+    ]
+
+    roster = []
+    for row in student_courses_collection.aggregate(pipeline):
+        final = row.get('final') or {}
+        mock = row.get('mock') or {}
+        ca = row.get('ca') or {}
+        roster.append({
+            'student_id': str(row['student_id']),
+            'student_number': row.get('student_number'),
+            'f_name': row.get('f_name'),
+            'l_name': row.get('l_name'),
+            'final': {'marks': final.get('marks'), 'grade': final.get('grade'), 'remarks': final.get('remarks')},
+            'mock': {'marks': mock.get('marks'), 'grade': mock.get('grade'), 'remarks': mock.get('remarks')},
+            'ca': {'score': ca.get('score'), 'total_score': ca.get('total_score')}
+        })
+    return roster
+
+def _parse_marks(value, upper=100):
+    if value in (None, ''):
+        return None
+    marks = float(value)
+    if not 0 <= marks <= upper:
+        raise ValueError(f'marks {marks:g} out of range 0-{upper:g}')
+    return int(marks) if marks.is_integer() else marks
+
+def _grade_operations(student_id, course_id, academic_year, semester, exam_type, entry, now):
+    """Ordered operations writing one course's element of a student's grade document"""
+    key = {'student_id': student_id, 'academic_year': academic_year, 'semester': semester}
+    return [
+        # Make sure the semester document exists
+        UpdateOne(key, {'$setOnInsert': {
+            'exam_type': exam_type, 'grades': [], 'entered_by': 'System', 'entered_at': now
+        }}, upsert=True),
+        # Add an element for the course if the student has none yet
+        UpdateOne(dict(key, **{'grades.course_id': {'$ne': course_id}}), {
+            '$push': {'grades': {'course_id': course_id}},
+            '$inc': {'version': 1}
+        }),
+        # Write only that element
+        UpdateOne(key, {
+            '$set': {
+                'grades.$[entry].marks': entry['marks'],
+                'grades.$[entry].grade': entry['grade'],
+                'grades.$[entry].remarks': entry['remarks'],
+                'grades.$[entry].grade_override': entry['grade_override'],
+                'updated_at': now
+            },
+            '$inc': {'version': 1}
+        }, array_filters=[{'entry.course_id': course_id}])
+    ]
+
+def _ca_operations(student_id, course_id, academic_year, semester, entry, now):
+    """Operation upserting one student's CA record, keyed like save_ca_scores"""
+    return [UpdateOne(
+        {'student_id': student_id, 'course_id': course_id, 'academic_year': academic_year, 'semester': semester},
+        {
+            '$set': {'score': entry['score'], 'total_score': entry['total_score'], 'updated_at': now},
+            '$setOnInsert': {
+                'assessment_type': 'assignment', 'assessment_date': now, 'assessment_breakdown': [],
+                'entered_by': 'System', 'entered_at': now
+            }
+        },
+        upsert=True
+    )]
+
+def _prepare_entry(exam_type, mark):
+    """Validated values to store for one student's submitted mark"""
+    if exam_type == 'ca':
+        total_score = _parse_marks(mark.get('total_score'), upper=float('inf'))
+        if not total_score:
+            raise ValueError('total_score must be greater than 0')
+        score = _parse_marks(mark.get('score'), upper=total_score)
+        return {'score': score, 'total_score': total_score}
+
+    marks = _parse_marks(mark.get('marks'))
+    grade = (mark.get('grade') or '').strip().upper()
+    if grade and grade not in GRADE_SCALE:
+        raise ValueError(f"unknown grade '{grade}'")
+    grade = grade or calculate_grade(marks)
+    if grade is None:
+        raise ValueError('either marks or grade is required')
+    return {'marks': marks, 'grade': grade, 'remarks': get_remarks(grade), 'grade_override': is_grade_override(marks, grade)}
+
+def save_course_marks(course_id, academic_year, semester, exam_type, marks):
+    """Save a whole class's marks for one course with a single bulk write.
+
+    exam_type is 'final', 'mock' or 'ca'; marks is a list of {'student_id', 'marks',
+    'grade'} (or {'student_id', 'score', 'total_score'} for CA). Returns per-student
+    results [{'student_id', 'success', 'error'}] in submission order.
+    """
+    course_object_id = ObjectId(course_id)
+    results = [{'student_id': mark.get('student_id'), 'success': False, 'error': None} for mark in marks]
+
+    prepared = []
+    for result, mark in zip(results, marks):
+        try:
+            student_id = ObjectId(mark.get('student_id'))
+            prepared.append((result, student_id, _prepare_entry(exam_type, mark)))
+        except (InvalidId, TypeError):
+            result['error'] = 'invalid student id'
+        except ValueError as e:
+            result['error'] = str(e)
+
+    enrolled = {e['student_id'] for e in student_courses_collection.find(
+        {
+            'course_id': course_object_id,
+            'academic_year': academic_year,
+            'semester': semester,
+            'student_id': {'$in': [student_id for _, student_id, _ in prepared]}
+        },
+        {'student_id': 1}
+    )}
+
+    now = datetime.utcnow()
+    operations = []
+    owners = []
+    for result, student_id, entry in prepared:
+        if student_id not in enrolled:
+            result['error'] = 'student is not enrolled in this course for the given academic year and semester'
+            continue
+        if exam_type == 'ca':
+            student_operations = _ca_operations(student_id, course_object_id, academic_year, semester, entry, now)
+        else:
+            student_operations = _grade_operations(student_id, str(course_object_id), academic_year, semester, exam_type, entry, now)
+        operations.extend(student_operations)
+        owners.extend([result] * len(student_operations))
+        result['success'] = True
+
+    if not operations:
+        return results
+
+    collection = {'ca': ca_collection, 'mock': mock_grades_collection}.get(exam_type, grades_collection)
+    failed = _bulk_write_chains(collection, operations, owners)
+    for result in owners:
+        if id(result) in failed:
+            result.update(success=False, error=failed[id(result)])
+    if exam_type != 'ca':
+        invalidate_transcripts(*[student_id for _, student_id, _ in prepared])
+    if exam_type == 'final':
+        refresh_semesters_safely([(student_id, academic_year, semester) for result, student_id, _ in prepared if result['success']])
+    if exam_type != 'ca' and any(result['success'] for result, _, _ in prepared):
+        refresh_course_terms_safely([(str(course_object_id), academic_year, semester, exam_type)])
+    return results
+
+def _grade_changed(existing, entry):
+    return any(existing.get(field) != entry[field] for field in ('marks', 'grade', 'remarks'))
+
+def _semester_update(document, entries, now, exam_type):
+    """Operations writing only the changed course elements of a semester grade document.
+
+    Returns (operations, changed_count, write_id); operations is empty when nothing
+    changed. Existing courses are set through array filters and new ones are $push-ed only
+    if still missing. The first operation pins the document's current version and each
+    later one pins the version and write id left by the one before, so the chain stops as
+    soon as someone else has saved; write_id is the token left by the last operation.
+    """
+    existing = {str(grade.get('course_id')): grade for grade in document.get('grades', [])}
+    updates = {}
+    array_filters = []
+    appended = []
+    for entry in entries:
+        course_id = entry['course_id']
+        if course_id in existing:
+            grade = existing[course_id]
+            if not _grade_changed(grade, entry):
+                continue
+            name = f'c{len(array_filters)}'
+            for field in ('marks', 'grade', 'remarks', 'grade_override'):
+                updates[f'grades.$[{name}].{field}'] = entry[field]
+            array_filters.append({f'{name}.course_id': grade.get('course_id')})
+        else:
+            appended.append(entry)
+
+    version = document.get('version')
+    guard = {'_id': document['_id'], 'version': version if version is not None else {'$exists': False}}
+    operations = []
+    write_id = None
+    if updates:
+        write_id = ObjectId()
+        updates.update({'updated_at': now, 'last_write': write_id, 'exam_type': exam_type})
+        operations.append(UpdateOne(guard, {'$set': updates, '$inc': {'version': 1}}, array_filters=array_filters))
+        guard = {'_id': document['_id'], 'version': (version or 0) + 1, 'last_write': write_id}
+    if appended:
+        write_id = ObjectId()
+        operations.append(UpdateOne(
+            dict(guard, **{'grades.course_id': {'$nin': [entry['course_id'] for entry in appended]}}),
+            {
+                '$push': {'grades': {'$each': appended}},
+                '$set': {'updated_at': now, 'last_write': write_id, 'exam_type': exam_type},
+                '$inc': {'version': 1}
+            }
+        ))
+    return operations, len(array_filters) + len(appended), write_id
+
+def _bulk_write_chains(collection, operations, owners):
+    """Run per-document operation chains in one ordered bulk_write, skipping past failures.
+
+    owners[i] is the result the i-th operation belongs to. Ordered, so a document's
+    chained operations run in sequence; when one fails the rest of that document's chain
+    is dropped and the bulk resumes with the next document. Returns {id(owner): error}.
+    """
+    failed = {}
+    start = 0
+    while start < len(operations):
+        try:
+            collection.bulk_write(operations[start:], ordered=True)
+            break
+        except BulkWriteError as e:
+            error = e.details['writeErrors'][0]
+            index = start + error['index']
+            print(f"Error saving grades: {error.get('errmsg')}")
+            failed[id(owners[index])] = error.get('errmsg', 'write failed')
+            start = index + 1
+            while start < len(operations) and owners[start] is owners[index]:
+                start += 1
+    return failed
+
+def _prepare_grades(grades):
+    """Grade entries as stored, with automatic remarks; a later entry for the same course wins"""
+    prepared = {}
+    for grade_entry in grades:
+        grade = grade_entry.get('grade')
+        marks = grade_entry.get('marks')
+        prepared[str(grade_entry['course_id'])] = {
+            'course_id': str(grade_entry['course_id']),
+            'marks': marks,
+            'grade': grade,
+            'remarks': get_remarks(grade),
+            'grade_override': isinstance(marks, (int, float)) and is_grade_override(marks, grade)
+        }
+    return list(prepared.values())
+
+def _parse_version(value):
+    """A client-supplied document version as an int (None if not supplied); raises ValueError"""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+        raise ValueError(f"version must be a whole number, got {value!r}")
+    return int(value)
+
+def save_semester_grades(updates):
+    """Apply many per-student semester grade updates with one bulk write per collection.
+
+    Each update is {'student_id', 'academic_year', 'semester', 'exam_type', 'grades',
+    'version'?}. Only courses whose marks, grade or remarks changed are written, each
+    document's writes are pinned to the version that was read (or the version the client
+    supplied), and entered_at is only set when the document is created. Returns a
+    result per update: {'success', 'changed', 'version', 'conflict', 'error'}.
+    """
+    results = [{'success': False, 'changed': 0, 'version': None, 'conflict': False, 'error': None} for _ in updates]
+    now = datetime.utcnow()
+
+    by_collection = {}
+    for result, update in zip(results, updates):
+        try:
+            key = (ObjectId(update['student_id']), update.get('academic_year', '2025/2026'), update.get('semester', '1'))
+            entries = _prepare_grades(update.get('grades', []))
+            expected_version = _parse_version(update.get('version'))
+        except (InvalidId, TypeError, KeyError, ValueError) as e:
+            result['error'] = f'invalid update: {str(e)}'
+            continue
+        exam_type = 'mock' if update.get('exam_type') == 'mock' else 'final'
+        by_collection.setdefault(exam_type, []).append((result, key, entries, expected_version))
+
+    for exam_type, items in by_collection.items():
+        collection = mock_grades_collection if exam_type == 'mock' else grades_collection
+        documents = {
+            (doc['student_id'], doc['academic_year'], doc['semester']): doc
+            for doc in collection.find(
+                {'$or': [{'student_id': sid, 'academic_year': year, 'semester': sem} for _, (sid, year, sem), _, _ in items]},
+                {'student_id': 1, 'academic_year': 1, 'semester': 1, 'grades': 1, 'version': 1}
+            )
+        }
+
+        operations = []
+        owners = []
+        pending = []
+        for result, key, entries, expected_version in items:
+            document = documents.get(key)
+            if document is None:
+                # New semester document; $setOnInsert leaves it alone if someone created it first
+                write_id = ObjectId()
+                document_operations = [UpdateOne(
+                    {'student_id': key[0], 'academic_year': key[1], 'semester': key[2]},
+                    {'$setOnInsert': {
+                        'exam_type': exam_type, 'grades': entries, 'version': 1,
+                        'entered_by': 'System', 'entered_at': now, 'updated_at': now, 'last_write': write_id
+                    }},
+                    upsert=True
+                )]
+                changed, new_version = len(entries), 1
+            else:
+                current_version = document.get('version', 0)
+                if expected_version is not None and expected_version != current_version:
+                    result.update(conflict=True, version=current_version,
+                                  error='These grades were changed by someone else; reload and try again')
+                    continue
+                document_operations, changed, write_id = _semester_update(document, entries, now, exam_type)
+                new_version = current_version + len(document_operations)
+                if not document_operations:
+                    result.update(success=True, version=current_version)
+                    continue
+            operations.extend(document_operations)
+            owners.extend([result] * len(document_operations))
+            pending.append((result, write_id, changed, new_version))
+
+        if not operations:
+            continue
+        failed = _bulk_write_chains(collection, operations, owners)
+
+        # Updates whose version no longer matched were skipped; the write id shows which landed
+        applied = {doc['last_write'] for doc in collection.find(
+            {'last_write': {'$in': [write_id for _, write_id, _, _ in pending]}}, {'last_write': 1}
+        )}
+        for result, write_id, changed, new_version in pending:
+            if id(result) in failed:
+                result['error'] = failed[id(result)]
+            elif write_id in applied:
+                result.update(success=True, changed=changed, version=new_version)
+            else:
+                result.update(conflict=True, error='These grades were changed by someone else; reload and try again')
+        invalidate_transcripts(*[key[0] for _, key, _, _ in items])
+        if exam_type == 'final':
+            refresh_semesters_safely([key for result, key, _, _ in items if result['changed']])
+        refresh_course_terms_safely({
+            (entry['course_id'], year, sem, exam_type)
+            for result, (_, year, sem), entries, _ in items if result['changed']
+            for entry in entries
+        })
+    return results
+
@@ -0,0 +1,210 @@
+from app import grades_collection, mock_grades_collection, analytics_collection
+from app.catalog import catalog
+from app.grading import PASSING_GRADES
+from app.stats import median, process_map
+from bson import ObjectId
+from pymongo import UpdateOne
+from datetime import datetime
+
+# Materialised result analytics in `Result Analytics`. For every course, term and exam
+# type there is one 'course' document with the grade histogram, a 10-mark band
+# histogram, mean/median/min/max and pass rate; 'program' and 'school' documents roll
+# those up per term. When grades are saved only the affected course-terms are
+# recomputed (one indexed aggregation each, on grades.course_id) and their programme and
+# school rollups re-summed from the stored course documents, so dashboards and exam
+# boards read precomputed documents instead of scanning embedded grades arrays.
+
+MARK_BANDS = 10  # 0-9, 10-19, ..., 90-100
+
+def _collection(exam_type):
+    return mock_grades_collection if exam_type == 'mock' else grades_collection
+
+def course_term_stats(course_id, academic_year, semester, exam_type='final'):
+    """Histograms, averages and pass rate for one course-term, from one aggregation"""
+    course_key = str(course_id)
+    rows = list(_collection(exam_type).aggregate([
+        {'$match': {'grades.course_id': course_key, 'academic_year': academic_year, 'semester': semester}},
+        {'$project': {'grades': 1}},
+        {'$unwind': '$grades'},
+        {'$match': {'grades.course_id': course_key}},
+        {'$group': {
+            '_id': None,
+            'marks': {'$push': '$grades.marks'},
+            'grades': {'$push': '$grades.grade'}
+        }}
+    ], allowDiskUse=True))
+
+    grades = rows[0]['grades'] if rows else []
+    marks = [m for m in (rows[0]['marks'] if rows else []) if isinstance(m, (int, float))]
+
+    grade_histogram = {}
+    for grade in grades:
+        grade = grade or 'N/A'
+        grade_histogram[grade] = grade_histogram.get(grade, 0) + 1
+    mark_histogram = [0] * MARK_BANDS
+    for mark in marks:
+        mark_histogram[min(max(int(mark // 10), 0), MARK_BANDS - 1)] += 1
+    pass_count = sum(1 for grade in grades if grade in PASSING_GRADES)
+
+    return {
+        'students': len(grades),
+        'marked': len(marks),
+        'marks_total': sum(marks),
+        'mean': round(sum(marks) / len(marks), 2) if marks else None,
+        'median': median(marks),
+        'min': min(marks) if marks else None,
+        'max': max(marks) if marks else None,
+        'pass_count': pass_count,
+        'pass_rate': round(pass_count / len(grades) * 100, 1) if grades else None,
+        'grade_histogram': grade_histogram,
+        'mark_histogram': mark_histogram
+    }
+
+def _rollup(match, scope, scope_fields, now, extra=None):
+    """Re-sum a program/school rollup from the stored documents one level down"""
+    rows = list(analytics_collection.aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': None,
+            'courses': {'$sum': {'$ifNull': ['$courses', 1]}},
+            'students': {'$sum': '$students'},
+            'marked': {'$sum': '$marked'},
+            'marks_total': {'$sum': '$marks_total'},
+            'pass_count': {'$sum': '$pass_count'},
+            'grade_histograms': {'$push': '$grade_histogram'},
+            'mark_histograms': {'$push': '$mark_histogram'}
+        }}
+    ]))
+    key = dict(scope_fields, scope=scope)
+    if not rows:
+        analytics_collection.delete_one(key)
+        return
+
+    row = rows[0]
+    grade_histogram = {}
+    for histogram in row['grade_histograms']:
+        for grade, count in histogram.items():
+            grade_histogram[grade] = grade_histogram.get(grade, 0) + count
+    mark_histogram = [sum(band) for band in zip(*row['mark_histograms'])] or [0] * MARK_BANDS
+
+    analytics_collection.update_one(key, {'$set': {
+        'courses': row['courses'],
+        'students': row['students'],
+        'marked': row['marked'],
+        'marks_total': row['marks_total'],
+        'mean': round(row['marks_total'] / row['marked'], 2) if row['marked'] else None,
+        'pass_count': row['pass_count'],
+        'pass_rate': round(row['pass_count'] / row['students'] * 100, 1) if row['students'] else None,
+        'grade_histogram': grade_histogram,
+        'mark_histogram': mark_histogram,
+        'updated_at': now,
+        **(extra or {})
+    }}, upsert=True)
+
+def refresh_course_terms(keys, rollups=True):
+    """Recompute course analytics for (course_id, academic_year, semester, exam_type) keys, then their rollups"""
+    courses = catalog.by_id('courses')
+    programs = catalog.by_id('programs')
+    now = datetime.utcnow()
+
+    operations = []
+    program_terms = set()
+    for course_id, academic_year, semester, exam_type in set(keys):
+        course = courses.get(str(course_id))
+        program_id = course.get('program_id') if course else None
+        program = programs.get(str(program_id)) if program_id else None
+        term = {'academic_year': academic_year, 'semester': semester, 'exam_type': exam_type}
+        operations.append(UpdateOne(
+            dict(term, scope='course', course_id=ObjectId(course_id)),
+            {'$set': dict(
+                course_term_stats(course_id, academic_year, semester, exam_type),
+                program_id=program_id,
+                school_id=program.get('school_id') if program else None,
+                updated_at=now
+            )},
+            upsert=True
+        ))
+        program_terms.add((program_id, program.get('school_id') if program else None, academic_year, semester, exam_type))
+
+    if operations:
+        analytics_collection.bulk_write(operations, ordered=False)
+    if rollups:
+        refresh_rollups(program_terms, now)
+    return len(operations)
+
+def refresh_rollups(program_terms, now=None):
+    """Re-sum program rollups and then school rollups for (program_id, school_id, year, semester, exam_type)"""
+    now = now or datetime.utcnow()
+    school_terms = set()
+    for program_id, school_id, academic_year, semester, exam_type in program_terms:
+        term = {'academic_year': academic_year, 'semester': semester, 'exam_type': exam_type}
+        if program_id:
+            _rollup(dict(term, scope='course', program_id=program_id), 'program', dict(term, program_id=program_id), now,
+                    extra={'school_id': school_id})
+        if school_id:
+            school_terms.add((school_id, academic_year, semester, exam_type))
+    for school_id, academic_year, semester, exam_type in school_terms:
+        term = {'academic_year': academic_year, 'semester': semester, 'exam_type': exam_type}
+        _rollup(dict(term, scope='program', school_id=school_id), 'school', dict(term, school_id=school_id), now)
+
+def refresh_course_terms_safely(keys):
+    """refresh_course_terms for write paths: a failure is logged, never raised to the caller"""
+    try:
+        if keys:
+            refresh_course_terms(keys)
+    except Exception as e:
+        print(f"Error refreshing result analytics: {str(e)}")
+
+def get_analytics(scope, scope_id, academic_year, semester, exam_type='final'):
+    """The precomputed course, program or school document for a term"""
+    return analytics_collection.find_one({
+        'scope': scope, f'{scope}_id': ObjectId(scope_id),
+        'academic_year': academic_year, 'semester': semester, 'exam_type': exam_type
+    }, {'_id': 0})
+
+def list_course_analytics(academic_year, semester, exam_type='final', program_id=None, school_id=None):
+    """Precomputed course documents for a term, lowest pass rate first (exam-board view)"""
+    query = {'scope': 'course', 'academic_year': academic_year, 'semester': semester, 'exam_type': exam_type}
+    if program_id:
+        query['program_id'] = ObjectId(program_id)
+    if school_id:
+        query['school_id'] = ObjectId(school_id)
+    return list(analytics_collection.find(query, {'_id': 0}).sort('pass_rate', 1))
+
+def _course_terms(exam_type):
+    """Every (course_id, academic_year, semester, exam_type) with grades, in one aggregation"""
+    return [
+        (row['_id']['course_id'], row['_id']['academic_year'], row['_id']['semester'], exam_type)
+        for row in _collection(exam_type).aggregate([
+            {'$project': {'academic_year': 1, 'semester': 1, 'course_id': '$grades.course_id'}},
+            {'$unwind': '$course_id'},
+            {'$group': {'_id': {'course_id': '$course_id', 'academic_year': '$academic_year', 'semester': '$semester'}}}
+        ], allowDiskUse=True)
+        if ObjectId.is_valid(row['_id']['course_id'])
+    ]
+
+def _rebuild_course_terms(keys):
+    # Worker entry point: course documents only, rollups are done once by the parent
+    return refresh_course_terms(keys, rollups=False)
+
+def rebuild_all(processes=None):
+    """Recompute every course-term in parallel (grouped by program), then all rollups; returns the count"""
+    keys = _course_terms('final') + _course_terms('mock')
+    courses = catalog.by_id('courses')
+
+    by_program = {}
+    for key in keys:
+        course = courses.get(str(key[0]))
+        by_program.setdefault(str(course.get('program_id')) if course else None, []).append(key)
+
+    computed = sum(process_map(_rebuild_course_terms, list(by_program.values()), processes))
+
+    programs = catalog.by_id('programs')
+    program_terms = set()
+    for course_id, academic_year, semester, exam_type in keys:
+        course = courses.get(str(course_id))
+        program_id = course.get('program_id') if course else None
+        program = programs.get(str(program_id)) if program_id else None
+        program_terms.add((program_id, program.get('school_id') if program else None, academic_year, semester, exam_type))
+    refresh_rollups(program_terms)
+    return computed
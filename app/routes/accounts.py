@@ -1,13 +1,18 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
-from app import accounts_collection, students_collection, schools_collection, programs_collection, courses_collection
+from app import accounts_collection, students_collection, schools_collection, programs_collection, courses_collection, student_courses_collection
 from bson import ObjectId
-from datetime import datetime
+from app.catalog import catalog
+from app.search import search_filter, search_students
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
 import random
 import string
 
 # Replace the import line with this:
-from app.utils import can_view_semester_grades, get_semester_balance, get_semester_fees
+from app.utils import get_semester_fee_statuses
 from app.config import SystemConfig
+from app.ledger import get_student_balance, get_student_balances, get_student_totals, adjust_transaction
+from app.billing import run_billing_batch, get_semester_fees_for_students
 
 bp = Blueprint('accounts', __name__)
 
@@ -17,48 +22,61 @@ def generate_transaction_code():
     numbers = ''.join(random.choices(string.digits, k=4))
     return f"{letters}{numbers}"
 
-def get_student_balance(student_id):
-    """Calculate current balance for a student"""
+def recalculate_student_balance(student_id, from_transaction=None):
+    """Recalculate balance_after for a student's transactions and write only the corrections.
+
+    If from_transaction is given, recalculation starts at that transaction, seeded with the
+    balance_after of the transaction just before it, so earlier history is never read.
+    All corrections go to the database in one unordered bulk_write.
+    """
     try:
-        # Get all transactions for the student, sorted by date
-        transactions = list(accounts_collection.find({
-            'student_id': ObjectId(student_id)
-        }).sort('created_at', 1))
-        
+        query = {'student_id': ObjectId(student_id)}
         balance = 0
-        for transaction in transactions:
-            if transaction['type'] == 'Billing':
-                balance += transaction.get('debit', 0)
-            else:  # Clearing
-                balance -= transaction.get('credit', 0)
         
-        print(f"Balance for student {student_id}: {balance}")
-        return balance
+        if from_transaction:
+            created_at = from_transaction['created_at']
+            transaction_id = from_transaction['_id']
+            
+            # Opening balance is whatever the ledger said right before the edited transaction
+            previous = accounts_collection.find_one(
+                {
+                    'student_id': ObjectId(student_id),
+                    '$or': [
+                        {'created_at': {'$lt': created_at}},
+                        {'created_at': created_at, '_id': {'$lt': transaction_id}}
+                    ]
+                },
+                {'balance_after': 1},
+                sort=[('created_at', -1), ('_id', -1)]
+            )
+            balance = previous.get('balance_after', 0) if previous else 0
+            
+            query['$or'] = [
+                {'created_at': {'$gt': created_at}},
+                {'created_at': created_at, '_id': {'$gte': transaction_id}}
+            ]
         
-    except Exception as e:
-        print(f"Error calculating balance for student {student_id}: {str(e)}")
-        return 0
-
-def recalculate_student_balance(student_id):
-    """Recalculate and update all balances for a student after transaction update"""
-    try:
-        # Get all transactions for the student, sorted by date
-        transactions = list(accounts_collection.find({
-            'student_id': ObjectId(student_id)
-        }).sort('created_at', 1))
+        transactions = accounts_collection.find(
+            query,
+            {'type': 1, 'debit': 1, 'credit': 1, 'balance_after': 1}
+        ).sort([('created_at', 1), ('_id', 1)])
         
-        balance = 0
+        corrections = []
         for transaction in transactions:
             if transaction['type'] == 'Billing':
                 balance += transaction.get('debit', 0)
             else:  # Clearing
                 balance -= transaction.get('credit', 0)
             
-            # Update the balance_after field for each transaction
-            accounts_collection.update_one(
-                {'_id': transaction['_id']},
-                {'$set': {'balance_after': balance}}
-            )
+            # Only rewrite rows whose stored balance is actually wrong
+            if transaction.get('balance_after') != balance:
+                corrections.append(UpdateOne(
+                    {'_id': transaction['_id']},
+                    {'$set': {'balance_after': balance}}
+                ))
+        
+        if corrections:
+            accounts_collection.bulk_write(corrections, ordered=False)
         
         return balance
     except Exception as e:
@@ -99,8 +117,8 @@ def accounts_management():
         outstanding_balance = total_billing - total_clearing
         
         # Get schools and programs for filters
-        schools = list(schools_collection.find({'status': 'active'}))
-        programs = list(programs_collection.find({'status': 'active'}))
+        schools = catalog.list('schools', status='active')
+        programs = catalog.list('programs', status='active')
         
         return render_template('accounts/accounts_management.html',
                              total_students=total_students,
@@ -124,9 +142,9 @@ def accounts_management():
 @bp.route('/accounts/create_invoice')
 def create_invoice():
     """Create invoice page"""
-    schools = list(schools_collection.find({'status': 'active'}))
-    programs = list(programs_collection.find({'status': 'active'}))
-    courses = list(courses_collection.find({'status': 'active'}))
+    schools = catalog.list('schools', status='active')
+    programs = catalog.list('programs', status='active')
+    courses = catalog.list('courses', status='active')
     
     return render_template('accounts/create_invoice.html',
                          schools=schools,
@@ -147,29 +165,17 @@ def get_students():
         if filter_type == 'all':
             # Get all active students
             if search_term:
-                query['$or'] = [
-                    {'student_number': {'$regex': search_term, '$options': 'i'}},
-                    {'f_name': {'$regex': search_term, '$options': 'i'}},
-                    {'l_name': {'$regex': search_term, '$options': 'i'}}
-                ]
+                query.update(search_filter(search_term))
             students = list(students_collection.find(query))
         elif filter_type == 'program' and filter_value:
             query['program_id'] = ObjectId(filter_value)
             if search_term:
-                query['$or'] = [
-                    {'student_number': {'$regex': search_term, '$options': 'i'}},
-                    {'f_name': {'$regex': search_term, '$options': 'i'}},
-                    {'l_name': {'$regex': search_term, '$options': 'i'}}
-                ]
+                query.update(search_filter(search_term))
             students = list(students_collection.find(query))
         elif filter_type == 'school' and filter_value:
             query['school_id'] = ObjectId(filter_value)
             if search_term:
-                query['$or'] = [
-                    {'student_number': {'$regex': search_term, '$options': 'i'}},
-                    {'f_name': {'$regex': search_term, '$options': 'i'}},
-                    {'l_name': {'$regex': search_term, '$options': 'i'}}
-                ]
+                query.update(search_filter(search_term))
             students = list(students_collection.find(query))
         elif filter_type == 'course' and filter_value:
             # Get students enrolled in this course using aggregation
@@ -182,7 +188,7 @@ def get_students():
                 },
                 {
                     '$lookup': {
-                        'from': 'students',
+                        'from': students_collection.name,
                         'localField': 'student_id',
                         'foreignField': '_id',
                         'as': 'student_info'
@@ -200,15 +206,7 @@ def get_students():
             
             # Add search filter if provided
             if search_term:
-                pipeline.append({
-                    '$match': {
-                        '$or': [
-                            {'student_info.student_number': {'$regex': search_term, '$options': 'i'}},
-                            {'student_info.f_name': {'$regex': search_term, '$options': 'i'}},
-                            {'student_info.l_name': {'$regex': search_term, '$options': 'i'}}
-                        ]
-                    }
-                })
+                pipeline.append({'$match': search_filter(search_term, prefix='student_info.')})
             
             pipeline.append({
                 '$replaceRoot': {'newRoot': '$student_info'}
@@ -235,32 +233,25 @@ def get_students():
             if program_ids:
                 query['program_id'] = {'$in': program_ids}
                 if search_term:
-                    query['$or'] = [
-                        {'student_number': {'$regex': search_term, '$options': 'i'}},
-                        {'f_name': {'$regex': search_term, '$options': 'i'}},
-                        {'l_name': {'$regex': search_term, '$options': 'i'}}
-                    ]
+                    query.update(search_filter(search_term))
                 students = list(students_collection.find(query))
             else:
                 students = []
         elif filter_type == 'individual':
             # Search for individual students
             if search_term:
-                query['$or'] = [
-                    {'student_number': {'$regex': search_term, '$options': 'i'}},
-                    {'f_name': {'$regex': search_term, '$options': 'i'}},
-                    {'l_name': {'$regex': search_term, '$options': 'i'}}
-                ]
-                students = list(students_collection.find(query).limit(50))  # Limit results for performance
+                # Ranked and paginated; limit results for performance
+                students, _ = search_students(search_term, query, page=data.get('page', 1))
             else:
                 students = []
         else:
             students = []
         
+        students = [student for student in students if student]  # Skip if student is None
+        balances = get_student_balances([student['_id'] for student in students])
+        
         students_data = []
         for student in students:
-            if not student:  # Skip if student is None
-                continue
                 
             # Get program and school info
             program = programs_collection.find_one({'_id': ObjectId(student['program_id'])}) if student.get('program_id') else None
@@ -272,7 +263,7 @@ def get_students():
                 'name': f"{student.get('f_name', '')} {student.get('l_name', '')}",
                 'program': program['name'] if program else 'N/A',
                 'school': school['name'] if school else 'N/A',
-                'current_balance': get_student_balance(student['_id'])
+                'current_balance': balances[str(student['_id'])]
             })
         
         return jsonify({'success': True, 'students': students_data})
@@ -305,7 +296,6 @@ def create_transaction():
         
         # Generate a single transaction code for this batch
         transaction_code = generate_transaction_code()
-        created_count = 0
         
         # Get filter description for reference
         filter_description = f"Filter: {filter_type}"
@@ -324,48 +314,37 @@ def create_transaction():
             elif filter_type == 'individual':
                 filter_description += " - Selected Students"
         
-        for student_id in student_ids:
-            try:
-                student = students_collection.find_one({'_id': ObjectId(student_id)})
-                if not student:
-                    print(f"Student {student_id} not found")
-                    continue
-                
-                # Get current balance before transaction
-                current_balance = get_student_balance(student_id)
-                
-                # Create transaction data with filter reference
-                transaction_data = {
-                    'transaction_code': transaction_code,
-                    'student_id': ObjectId(student_id),
-                    'type': transaction_type,
-                    'description': description,
-                    'filter_reference': filter_description,
-                    'debit': amount if transaction_type == 'Billing' else 0,
-                    'credit': amount if transaction_type == 'Clearing' else 0,
-                    'balance_after': current_balance + (amount if transaction_type == 'Billing' else -amount),
-                    'created_at': datetime.utcnow(),
-                    'created_by': 'system',  # You can replace this with actual user from session
-                    'batch_transaction': True if len(student_ids) > 1 else False
-                }
-                
-                # Add semester and academic_year for semester-specific transactions
-                if semester and academic_year:
-                    transaction_data['semester'] = semester
-                    transaction_data['academic_year'] = academic_year
-                    if transaction_type == 'Billing':
-                        transaction_data['fee_type'] = 'tuition'  # Default fee type
-                        transaction_data['is_semester_fee'] = True
-                
-                # Insert transaction
-                result = accounts_collection.insert_one(transaction_data)
-                created_count += 1
-                
-                print(f"Created transaction {transaction_code} for student {student_id}")
-                
-            except Exception as e:
-                print(f"Error creating transaction for student {student_id}: {str(e)}")
-                continue
+        def build_transaction(student, _amount, current_balance):
+            # Create transaction data with filter reference
+            transaction_data = {
+                'transaction_code': transaction_code,
+                'student_id': student['_id'],
+                'type': transaction_type,
+                'description': description,
+                'filter_reference': filter_description,
+                'debit': amount if transaction_type == 'Billing' else 0,
+                'credit': amount if transaction_type == 'Clearing' else 0,
+                'created_at': created_at,
+                'created_by': 'system',  # You can replace this with actual user from session
+                'batch_transaction': True if len(student_ids) > 1 else False
+            }
+            
+            # Add semester and academic_year for semester-specific transactions
+            if semester and academic_year:
+                transaction_data['semester'] = semester
+                transaction_data['academic_year'] = academic_year
+                if transaction_type == 'Billing':
+                    transaction_data['fee_type'] = 'tuition'  # Default fee type
+                    transaction_data['is_semester_fee'] = True
+            return transaction_data
+        
+        # Prefetch students and balances once, then insert the whole batch in one write
+        created_at = datetime.utcnow()
+        result = run_billing_batch(student_ids, build_transaction)
+        created_count = result['created']
+        
+        for failure in result['failures']:
+            print(f"Error creating transaction for student {failure['student_id']}: {failure['error']}")
         
         if created_count > 0:
             transaction_type_name = "invoice" if transaction_type == 'Billing' else "payment"
@@ -373,10 +352,11 @@ def create_transaction():
             return jsonify({
                 'success': True,
                 'message': message,
-                'transaction_code': transaction_code
+                'transaction_code': transaction_code,
+                'failures': result['failures']
             })
         else:
-            return jsonify({'success': False, 'error': 'No transactions were created'})
+            return jsonify({'success': False, 'error': 'No transactions were created', 'failures': result['failures']})
     
     except Exception as e:
         print(f"Error in create_transaction: {str(e)}")
@@ -413,15 +393,69 @@ def student_transactions(student_id):
         flash(f'Error loading student transactions: {str(e)}', 'error')
         return redirect(url_for('accounts.accounts_management'))
 
+TRANSACTION_HISTORY_PAGE_SIZE = 50
+
+def build_transaction_filters(args):
+    """Build the Accounts match filter for transaction history from request args"""
+    match = {}
+    
+    start_date = args.get('start_date', '')
+    end_date = args.get('end_date', '')
+    if start_date or end_date:
+        match['created_at'] = {}
+        if start_date:
+            match['created_at']['$gte'] = datetime.strptime(start_date, '%Y-%m-%d')
+        if end_date:
+            # Inclusive of the whole end day
+            match['created_at']['$lt'] = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    
+    transaction_type = args.get('type', '')
+    if transaction_type in ('Billing', 'Clearing'):
+        match['type'] = transaction_type
+    
+    program_id = args.get('program_id', '')
+    if program_id:
+        # Transactions carry only student_id, so resolve the programme to its students first
+        student_ids = students_collection.distinct('_id', {'program_id': ObjectId(program_id)})
+        match['student_id'] = {'$in': student_ids}
+    
+    return match
+
+def encode_history_cursor(transaction):
+    """Keyset cursor pointing just past a transaction in (created_at, _id) descending order"""
+    return f"{transaction['created_at'].isoformat()}_{transaction['_id']}"
+
+def decode_history_cursor(cursor):
+    """Turn a keyset cursor back into a filter for the rows that follow it"""
+    created_at, transaction_id = cursor.rsplit('_', 1)
+    created_at = datetime.fromisoformat(created_at)
+    return {
+        '$or': [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': ObjectId(transaction_id)}}
+        ]
+    }
+
 @bp.route('/accounts/transaction_history')
 def transaction_history():
-    """View all transactions history"""
+    """View transaction history one keyset page at a time, newest first"""
     try:
-        # Get all transactions with student information using aggregation - SORTED BY DATE DESCENDING
+        filters = build_transaction_filters(request.args)
+        cursor = request.args.get('after', '')
+        per_page = min(max(request.args.get('per_page', TRANSACTION_HISTORY_PAGE_SIZE, type=int), 1), 200)
+        
+        page_match = dict(filters)
+        if cursor:
+            page_match = {'$and': [filters, decode_history_cursor(cursor)]}
+        
+        # Page first, then join student and programme details for just this page
         pipeline = [
+            {'$match': page_match},
+            {'$sort': {'created_at': -1, '_id': -1}},  # Ensure newest transactions come first
+            {'$limit': per_page + 1},
             {
                 '$lookup': {
-                    'from': 'students',
+                    'from': students_collection.name,
                     'localField': 'student_id',
                     'foreignField': '_id',
                     'as': 'student_info'
@@ -435,7 +469,7 @@ def transaction_history():
             },
             {
                 '$lookup': {
-                    'from': 'programs',
+                    'from': programs_collection.name,
                     'localField': 'student_info.program_id',
                     'foreignField': '_id',
                     'as': 'program_info'
@@ -447,9 +481,6 @@ def transaction_history():
                     'preserveNullAndEmptyArrays': True
                 }
             },
-            {
-                '$sort': {'created_at': -1}  # Ensure newest transactions come first
-            },
             {
                 '$project': {
                     'transaction_code': 1,
@@ -463,41 +494,54 @@ def transaction_history():
                     'created_at': 1,
                     'student_name': {
                         '$cond': {
-                            'if': {'$ne': ['$student_info', None]},
+                            'if': {'$ifNull': ['$student_info', False]},
                             'then': {'$concat': ['$student_info.f_name', ' ', '$student_info.l_name']},
                             'else': 'Unknown Student'
                         }
                     },
-                    'student_number': {
-                        '$cond': {
-                            'if': {'$ne': ['$student_info', None]},
-                            'then': '$student_info.student_number',
-                            'else': 'N/A'
-                        }
-                    },
-                    'program_name': {
-                        '$cond': {
-                            'if': {'$ne': ['$program_info', None]},
-                            'then': '$program_info.name',
-                            'else': 'N/A'
-                        }
-                    }
+                    'student_number': {'$ifNull': ['$student_info.student_number', 'N/A']},
+                    'program_name': {'$ifNull': ['$program_info.name', 'N/A']}
                 }
             }
         ]
         
         transactions = list(accounts_collection.aggregate(pipeline))
         
-        # Calculate summary statistics
-        total_billing = sum(t.get('debit', 0) for t in transactions)
-        total_clearing = sum(t.get('credit', 0) for t in transactions)
+        next_cursor = None
+        if len(transactions) > per_page:
+            transactions = transactions[:per_page]
+            next_cursor = encode_history_cursor(transactions[-1])
+        
+        # Summary statistics for the whole filtered ledger, computed server-side
+        totals = list(accounts_collection.aggregate([
+            {'$match': filters},
+            {
+                '$group': {
+                    '_id': None,
+                    'total_billing': {'$sum': '$debit'},
+                    'total_clearing': {'$sum': '$credit'},
+                    'count': {'$sum': 1}
+                }
+            }
+        ]))
+        total_billing = totals[0]['total_billing'] if totals else 0
+        total_clearing = totals[0]['total_clearing'] if totals else 0
+        total_count = totals[0]['count'] if totals else 0
         outstanding_balance = total_billing - total_clearing
         
+        programs = catalog.list('programs', status='active')
+        filter_args = {key: value for key, value in request.args.items() if key != 'after' and value}
+        
         return render_template('accounts/transaction_history.html',
                              transactions=transactions,
                              total_billing=total_billing,
                              total_clearing=total_clearing,
-                             outstanding_balance=outstanding_balance)
+                             outstanding_balance=outstanding_balance,
+                             total_count=total_count,
+                             next_cursor=next_cursor,
+                             is_first_page=not cursor,
+                             filter_args=filter_args,
+                             programs=programs)
     
     except Exception as e:
         print(f"Error in transaction_history: {str(e)}")
@@ -559,9 +603,11 @@ def update_transaction(transaction_id):
             {'$set': update_data}
         )
         
+        adjust_transaction(transaction, {**transaction, **update_data})
+        
         # Recalculate balances for the student
         student_id = transaction['student_id']
-        recalculate_student_balance(student_id)
+        recalculate_student_balance(student_id, from_transaction=transaction)
         
         return jsonify({'success': True, 'message': 'Transaction updated successfully'})
     
@@ -580,45 +626,28 @@ def search_students_transactions():
         
         query = {'status': 'active'}
         
-        # Build search query
-        if search_term:
-            query['$or'] = [
-                {'student_number': {'$regex': search_term, '$options': 'i'}},
-                {'f_name': {'$regex': search_term, '$options': 'i'}},
-                {'l_name': {'$regex': search_term, '$options': 'i'}}
-            ]
-        
         if school_id:
             query['school_id'] = ObjectId(school_id)
         
         if program_id:
             query['program_id'] = ObjectId(program_id)
         
-        # Sort students by name for consistent display
-        students = list(students_collection.find(query).sort('f_name', 1).limit(50))
+        # Ranked by search match when searching, otherwise sorted by name for consistent display
+        page = data.get('page', 1)
+        if search_term:
+            students, has_more = search_students(search_term, query, page=page)
+        else:
+            students, has_more = search_students('', query, page=page, sort={'f_name': 1, '_id': 1})
+        
+        # Balance and lifetime billing/payment totals for the whole page from the balance summaries
+        totals = get_student_totals([student['_id'] for student in students])
         
         students_data = []
         for student in students:
             # Get program and school info
-            program = programs_collection.find_one({'_id': ObjectId(student['program_id'])}) if student.get('program_id') else None
-            school = schools_collection.find_one({'_id': ObjectId(student['school_id'])}) if student.get('school_id') else None
-            
-            # Calculate financial statistics
-            student_id = student['_id']
-            current_balance = get_student_balance(student_id)
-            
-            # Get total billing and payments - sorted by date for accurate calculation
-            billing_transactions = list(accounts_collection.find({
-                'student_id': student_id,
-                'type': 'Billing'
-            }).sort('created_at', 1))
-            payment_transactions = list(accounts_collection.find({
-                'student_id': student_id,
-                'type': 'Clearing'
-            }).sort('created_at', 1))
-            
-            total_billing = sum(t.get('debit', 0) for t in billing_transactions)
-            total_payments = sum(t.get('credit', 0) for t in payment_transactions)
+            program = catalog.get('programs', student.get('program_id'))
+            school = catalog.get('schools', student.get('school_id'))
+            student_totals = totals[str(student['_id'])]
             
             students_data.append({
                 'id': str(student['_id']),
@@ -626,12 +655,12 @@ def search_students_transactions():
                 'name': f"{student.get('f_name', '')} {student.get('l_name', '')}",
                 'program': program['name'] if program else 'N/A',
                 'school': school['name'] if school else 'N/A',
-                'current_balance': current_balance,
-                'total_billing': total_billing,
-                'total_payments': total_payments
+                'current_balance': student_totals['balance'],
+                'total_billing': student_totals['total_billing'],
+                'total_payments': student_totals['total_clearing']
             })
         
-        return jsonify({'success': True, 'students': students_data})
+        return jsonify({'success': True, 'students': students_data, 'has_more': has_more})
     
     except Exception as e:
         print(f"Error in search_students_transactions: {str(e)}")
@@ -651,96 +680,6 @@ def get_student_balance_api(student_id):
 #semester billing
 from app.config import SystemConfig
 
-def get_semester_fees(student_id, semester, academic_year):
-    """Calculate total semester fees for a student"""
-    try:
-        student = students_collection.find_one({'_id': ObjectId(student_id)})
-        if not student:
-            return 0
-        
-        # Get student's program level
-        program = programs_collection.find_one({'_id': ObjectId(student['program_id'])})
-        level = program.get('level', 'undergraduate').lower() if program else 'undergraduate'
-        
-        # Map level to fee category
-        level_mapping = {
-            'certificate': 'certificate',
-            'diploma': 'diploma', 
-            'undergraduate': 'undergraduate',
-            'bachelor': 'undergraduate',
-            'postgraduate': 'postgraduate',
-            'masters': 'postgraduate',
-            'phd': 'postgraduate'
-        }
-        
-        fee_category = level_mapping.get(level, 'undergraduate')
-        base_fee = SystemConfig.DEFAULT_SEMESTER_FEES.get(fee_category, 1000.00)
-        
-        # Get additional course fees for the semester
-        enrolled_courses = list(student_courses_collection.find({
-            'student_id': ObjectId(student_id),
-            'semester': semester,
-            'academic_year': academic_year
-        }))
-        
-        course_fees = 0
-        for ec in enrolled_courses:
-            course = courses_collection.find_one({'_id': ObjectId(ec['course_id'])})
-            if course and course.get('course_fee'):
-                course_fees += course.get('course_fee', 0)
-        
-        return base_fee + course_fees
-        
-    except Exception as e:
-        print(f"Error calculating semester fees: {str(e)}")
-        return SystemConfig.DEFAULT_SEMESTER_FEES['undergraduate']
-
-def get_semester_balance(student_id, semester, academic_year):
-    """Calculate balance for a specific semester"""
-    try:
-        # Get all transactions for the semester
-        semester_start = datetime.strptime(f"{academic_year.split('/')[0]}-01-01", "%Y-%m-%d")
-        semester_end = datetime.strptime(f"{academic_year.split('/')[1]}-12-31", "%Y-%m-%d")
-        
-        transactions = list(accounts_collection.find({
-            'student_id': ObjectId(student_id),
-            'semester': semester,
-            'academic_year': academic_year
-        }).sort('created_at', 1))
-        
-        balance = 0
-        for transaction in transactions:
-            if transaction['type'] == 'Billing':
-                balance += transaction.get('debit', 0)
-            else:  # Clearing
-                balance -= transaction.get('credit', 0)
-        
-        return balance
-        
-    except Exception as e:
-        print(f"Error calculating semester balance: {str(e)}")
-        return 0
-
-def can_view_semester_grades(student_id, semester, academic_year):
-    """Check if student can view grades for a semester based on balance threshold"""
-    try:
-        semester_balance = get_semester_balance(student_id, semester, academic_year)
-        semester_fees = get_semester_fees(student_id, semester, academic_year)
-        
-        if semester_fees <= 0:
-            return True  # No fees configured, allow access
-        
-        paid_percentage = ((semester_fees - semester_balance) / semester_fees) * 100
-        can_view = paid_percentage >= SystemConfig.BALANCE_THRESHOLD_PERCENTAGE
-        
-        print(f"Semester fees: {semester_fees}, Balance: {semester_balance}, Paid %: {paid_percentage}, Can view: {can_view}")
-        
-        return can_view
-        
-    except Exception as e:
-        print(f"Error checking grade view permission: {str(e)}")
-        return False
-
 @bp.route('/accounts/create_semester_invoice', methods=['POST'])
 def create_semester_invoice():
     """Create semester invoice covering all semester fees"""
@@ -757,58 +696,46 @@ def create_semester_invoice():
         
         # Generate a single transaction code for this batch
         transaction_code = generate_transaction_code()
-        created_count = 0
+        created_at = datetime.utcnow()
+        
+        def semester_fees(students):
+            # Calculate semester fee for every student in one pass
+            return get_semester_fees_for_students(students, semester, academic_year)
+        
+        def build_transaction(student, amount, current_balance):
+            # Create semester transaction
+            return {
+                'transaction_code': transaction_code,
+                'student_id': student['_id'],
+                'type': 'Billing',
+                'description': f"{SystemConfig.SEMESTER_TRANSACTION_TYPES.get(fee_type, 'Semester Fee')} - {description}",
+                'fee_type': fee_type,
+                'semester': semester,
+                'academic_year': academic_year,
+                'debit': amount,
+                'credit': 0,
+                'created_at': created_at,
+                'created_by': 'system',
+                'batch_transaction': True,
+                'is_semester_fee': True
+            }
         
-        for student_id in student_ids:
-            try:
-                student = students_collection.find_one({'_id': ObjectId(student_id)})
-                if not student:
-                    continue
-                
-                # Calculate semester fee for this student
-                amount = get_semester_fees(student_id, semester, academic_year)
-                
-                if amount <= 0:
-                    continue
-                
-                # Get current balance before transaction
-                current_balance = get_student_balance(student_id)
-                
-                # Create semester transaction
-                transaction_data = {
-                    'transaction_code': transaction_code,
-                    'student_id': ObjectId(student_id),
-                    'type': 'Billing',
-                    'description': f"{SystemConfig.SEMESTER_TRANSACTION_TYPES.get(fee_type, 'Semester Fee')} - {description}",
-                    'fee_type': fee_type,
-                    'semester': semester,
-                    'academic_year': academic_year,
-                    'debit': amount,
-                    'credit': 0,
-                    'balance_after': current_balance + amount,
-                    'created_at': datetime.utcnow(),
-                    'created_by': 'system',
-                    'batch_transaction': True,
-                    'is_semester_fee': True
-                }
-                
-                # Insert transaction
-                result = accounts_collection.insert_one(transaction_data)
-                created_count += 1
-                
-            except Exception as e:
-                print(f"Error creating semester invoice for student {student_id}: {str(e)}")
-                continue
+        result = run_billing_batch(student_ids, build_transaction, amount_for=semester_fees)
+        created_count = result['created']
+        
+        for failure in result['failures']:
+            print(f"Error creating semester invoice for student {failure['student_id']}: {failure['error']}")
         
         if created_count > 0:
             message = f'Successfully created semester invoices for {created_count} student(s) with transaction code: {transaction_code}'
             return jsonify({
                 'success': True,
                 'message': message,
-                'transaction_code': transaction_code
+                'transaction_code': transaction_code,
+                'failures': result['failures']
             })
         else:
-            return jsonify({'success': False, 'error': 'No semester invoices were created'})
+            return jsonify({'success': False, 'error': 'No semester invoices were created', 'failures': result['failures']})
     
     except Exception as e:
         print(f"Error in create_semester_invoice: {str(e)}")
@@ -821,21 +748,19 @@ def get_semester_fee_summary(student_id):
         academic_year = request.args.get('academic_year', '2025/2026')
         semester = request.args.get('semester', '1')
         
-        total_fees = get_semester_fees(student_id, semester, academic_year)
-        current_balance = get_semester_balance(student_id, semester, academic_year)
-        amount_paid = total_fees - current_balance
-        paid_percentage = (amount_paid / total_fees * 100) if total_fees > 0 else 100
-        
-        can_view_grades = can_view_semester_grades(student_id, semester, academic_year)
+        statuses = get_semester_fee_statuses(student_id, [(academic_year, semester)])
+        if not statuses:
+            return jsonify({'success': False, 'error': 'Student not found'})
+        status = statuses[(academic_year, semester)]
         
         return jsonify({
             'success': True,
-            'total_fees': total_fees,
-            'amount_paid': amount_paid,
-            'current_balance': current_balance,
-            'paid_percentage': paid_percentage,
+            'total_fees': status['total_fees'],
+            'amount_paid': status['amount_paid'],
+            'current_balance': status['current_balance'],
+            'paid_percentage': status['paid_percentage'],
             'threshold_percentage': SystemConfig.BALANCE_THRESHOLD_PERCENTAGE,
-            'can_view_grades': can_view_grades
+            'can_view_grades': status['can_view']
         })
     
     except Exception as e:
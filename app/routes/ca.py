@@ -1,6 +1,11 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
-from app import students_collection, schools_collection, programs_collection, courses_collection, student_courses_collection, ca_collection
+from app import students_collection, schools_collection, programs_collection, student_courses_collection, ca_collection
 from bson import ObjectId
+from app.search import search_stages, tokenize, SEARCH_SORT
+from app.catalog import catalog
+from app.enrichment import enrich_courses
+from app.ca_import import import_ca_scores
+from app.ca_stats import student_ca_summary, course_ca_stats
 from datetime import datetime
 import re
 
@@ -14,8 +19,8 @@ def ca_dashboard():
 @bp.route('/ca/manage')
 def manage_ca():
     """Manage Continuous Assessments"""
-    schools = list(schools_collection.find({'status': 'active'}))
-    programs = list(programs_collection.find({'status': 'active'}))
+    schools = catalog.list('schools', status='active')
+    programs = catalog.list('programs', status='active')
     academic_years = ['2025/2026', '2024/2025', '2023/2024']
     semesters = ['1', '2']
     
@@ -39,19 +44,25 @@ def get_student_courses_ca(student_id):
             'semester': semester
         }))
         
+        enrich_courses(enrolled_courses, include_school=False)
+        
+        # Get existing CA data for all of these courses at once
+        ca_by_course = {
+            str(ca['course_id']): ca
+            for ca in ca_collection.find({
+                'student_id': ObjectId(student_id),
+                'course_id': {'$in': [ObjectId(ec['course_id']) for ec in enrolled_courses]},
+                'academic_year': academic_year,
+                'semester': semester
+            })
+        }
+        
         courses_data = []
         for ec in enrolled_courses:
-            course = courses_collection.find_one({'_id': ObjectId(ec['course_id'])})
+            course = ec['course']
             if course:
-                program = programs_collection.find_one({'_id': ObjectId(course['program_id'])})
-                
-                # Get existing CA data if any
-                ca_data = ca_collection.find_one({
-                    'student_id': ObjectId(student_id),
-                    'course_id': ObjectId(ec['course_id']),
-                    'academic_year': academic_year,
-                    'semester': semester
-                })
+                program = ec['program']
+                ca_data = ca_by_course.get(str(ec['course_id']))
                 
                 # Process assessment breakdown to number duplicate types
                 assessment_breakdown = ca_data.get('assessment_breakdown', []) if ca_data else []
@@ -166,123 +177,46 @@ def view_student_ca(student_id):
             return redirect(url_for('ca.manage_ca'))
         
         # Get school and program details
-        school = schools_collection.find_one({'_id': ObjectId(student['school_id'])}) if student.get('school_id') else None
-        program = programs_collection.find_one({'_id': ObjectId(student['program_id'])}) if student.get('program_id') else None
+        school = catalog.get('schools', student.get('school_id'))
+        program = catalog.get('programs', student.get('program_id'))
         
-        # Get all CA records for this student, grouped by academic year and semester
-        ca_records = list(ca_collection.find({
-            'student_id': ObjectId(student_id)
-        }).sort([('academic_year', -1), ('semester', -1), ('course_id', 1)]))
+        # Records, course details and per-semester/overall totals from one aggregation
+        semesters, overall = student_ca_summary(student_id)
         
-        # Group records by academic year and semester
         records_by_semester = {}
-        for record in ca_records:
-            course = courses_collection.find_one({'_id': ObjectId(record['course_id'])})
-            if course:
-                key = f"{record['academic_year']}_S{record['semester']}"
-                if key not in records_by_semester:
-                    records_by_semester[key] = {
-                        'academic_year': record['academic_year'],
-                        'semester': record['semester'],
-                        'records': [],
-                        'stats': {
-                            'total_courses': 0,
-                            'total_score': 0,
-                            'total_possible': 0,
-                            'average_percentage': 0
-                        }
-                    }
-                
-                # Handle None values for score and total_score
-                score = record.get('score', 0) or 0  # Convert None to 0
-                total_score = record.get('total_score', 40) or 40  # Convert None to default 40
-                
-                # Prevent division by zero
-                if total_score > 0:
-                    percentage = (score / total_score) * 100
-                else:
-                    percentage = 0
-                
-                # Get assessment breakdown if it exists - ensure it's properly formatted
-                assessment_breakdown = record.get('assessment_breakdown', [])
-                # Ensure breakdown is a list and has proper structure
-                if not isinstance(assessment_breakdown, list):
-                    assessment_breakdown = []
-                
-                # Add course record with breakdown data
-                course_record = {
-                    'course_code': course['code'],
-                    'course_name': course['name'],
-                    'credits': course.get('credits', 0),
-                    'score': record.get('score'),  # Keep original value for display
-                    'total_score': total_score,
-                    'percentage': percentage,
-                    'assessment_type': record.get('assessment_type', 'assignment'),
-                    'assessment_breakdown': assessment_breakdown,
-                    'assessment_date': record.get('assessment_date', record.get('entered_at', datetime.utcnow())).strftime('%Y-%m-%d'),
-                    'entered_at': record.get('entered_at', datetime.utcnow()).strftime('%Y-%m-%d %H:%M'),
+        for semester_data in semesters:
+            records = []
+            for record in semester_data['records']:
+                percentage = record['percentage']
+                entered_at = record.get('entered_at') or datetime.utcnow()
+                record.update({
+                    'assessment_date': (record.get('assessment_date') or entered_at).strftime('%Y-%m-%d'),
+                    'entered_at': entered_at.strftime('%Y-%m-%d %H:%M'),
                     'grade': calculate_ca_grade(percentage),
                     'remarks': 'Pass' if percentage >= 50 else 'Fail'
+                })
+                records.append(record)
+            
+            total_possible = semester_data['total_possible']
+            records_by_semester[f"{semester_data['academic_year']}_S{semester_data['semester']}"] = {
+                'academic_year': semester_data['academic_year'],
+                'semester': semester_data['semester'],
+                'records': records,
+                'stats': {
+                    'total_courses': semester_data['total_courses'],
+                    'total_score': semester_data['total_score'],
+                    'total_possible': total_possible,
+                    'average_percentage': (semester_data['total_score'] / total_possible) * 100 if total_possible > 0 else 0
                 }
-                
-                records_by_semester[key]['records'].append(course_record)
-        
-        # Calculate statistics for each semester and overall
-        total_all_scores = 0
-        total_all_possible = 0
-        total_passed_courses = 0
-        
-        for semester_data in records_by_semester.values():
-            records = semester_data['records']
-            if records:
-                semester_data['stats']['total_courses'] = len(records)
-                
-                # Calculate semester totals
-                total_score = sum(r['score'] or 0 for r in records)
-                total_possible = sum(r['total_score'] for r in records)
-                
-                semester_data['stats']['total_score'] = total_score
-                semester_data['stats']['total_possible'] = total_possible
-                
-                # Calculate semester average percentage
-                if total_possible > 0:
-                    semester_data['stats']['average_percentage'] = (total_score / total_possible) * 100
-                else:
-                    semester_data['stats']['average_percentage'] = 0
-                
-                # Add to overall totals
-                total_all_scores += total_score
-                total_all_possible += total_possible
-                
-                # Count passed courses for this semester
-                for record in records:
-                    if record['percentage'] >= 50:
-                        total_passed_courses += 1
-        
-        # Calculate overall statistics
-        total_assessments = len(ca_records)
-        total_semesters = len(records_by_semester)
-        
-        # Calculate overall average percentage
-        if total_all_possible > 0:
-            average_percentage_all = (total_all_scores / total_all_possible) * 100
-        else:
-            average_percentage_all = 0
+            }
         
         overall_stats = {
-            'total_assessments': total_assessments,
-            'total_semesters': total_semesters,
-            'average_percentage_all': average_percentage_all,
-            'passed_courses': total_passed_courses
+            'total_assessments': overall['total_assessments'],
+            'total_semesters': len(records_by_semester),
+            'average_percentage_all': (overall['total_score'] / overall['total_possible']) * 100 if overall['total_possible'] > 0 else 0,
+            'passed_courses': overall['passed_courses']
         }
         
-        # Debug: Print breakdown data to console
-        print(f"Records by semester: {len(records_by_semester)}")
-        for key, semester_data in records_by_semester.items():
-            print(f"Semester {key}: {len(semester_data['records'])} records")
-            for record in semester_data['records']:
-                print(f"  Course: {record['course_code']}, Breakdown: {len(record.get('assessment_breakdown', []))} items")
-        
         return render_template('grades/ca/view_student_ca.html',
                              student=student,
                              school=school,
@@ -307,6 +241,28 @@ def calculate_ca_grade(percentage):
     else:
         return 'F'
 
+@bp.route('/ca/course_stats/<course_id>')
+def course_ca_statistics(course_id):
+    """CA statistics for a course and term: mean, median, distribution and at-risk students"""
+    try:
+        academic_year = request.args.get('academic_year', '2025/2026')
+        semester = request.args.get('semester', '1')
+        
+        course = catalog.get('courses', course_id)
+        if not course:
+            return jsonify({'success': False, 'error': 'Course not found'}), 404
+        
+        stats = course_ca_stats(course_id, academic_year, semester)
+        return jsonify({
+            'success': True,
+            'course': {'id': str(course['_id']), 'code': course.get('code'), 'name': course.get('name')},
+            'academic_year': academic_year,
+            'semester': semester,
+            **stats
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @bp.route('/ca/student_records/<student_id>')
 def student_ca_records(student_id):
     """View all CA records for a specific student - Simplified view"""
@@ -326,9 +282,10 @@ def student_ca_records(student_id):
         }).sort([('academic_year', -1), ('semester', -1), ('entered_at', -1)]))
         
         # Enhance records with course information
+        enrich_courses(ca_records, include_program=False, include_school=False)
         enhanced_records = []
         for record in ca_records:
-            course = courses_collection.find_one({'_id': ObjectId(record['course_id'])})
+            course = record['course']
             if course:
                 # Handle None values for score and total_score
                 score = record.get('score', 0) or 0
@@ -365,27 +322,31 @@ def student_ca_records(student_id):
 
 @bp.route('/ca/bulk_upload', methods=['POST'])
 def bulk_upload_ca():
-    """Bulk upload CA scores via CSV"""
+    """Bulk upload CA scores via CSV or XLSX and return a row-level import report"""
     try:
         if 'file' not in request.files:
-            flash('No file selected!', 'error')
-            return redirect(url_for('ca.manage_ca'))
+            return jsonify({'success': False, 'error': 'No file selected!'}), 400
         
         file = request.files['file']
         if file.filename == '':
-            flash('No file selected!', 'error')
-            return redirect(url_for('ca.manage_ca'))
+            return jsonify({'success': False, 'error': 'No file selected!'}), 400
         
-        if file and file.filename.endswith('.csv'):
-            # Process CSV file
-            flash('CSV upload functionality implemented successfully!', 'success')
-        else:
-            flash('Please upload a CSV file', 'error')
+        academic_year = request.form.get('academic_year', '2025/2026')
+        semester = request.form.get('semester', '1')
+        start_row = request.form.get('start_row', 2, type=int)
         
-        return redirect(url_for('ca.manage_ca'))
+        report = import_ca_scores(file.stream, file.filename, academic_year, semester, start_row=start_row)
+        
+        return jsonify({
+            'success': report['failed'] is None,
+            'message': f"Imported {report['imported']} of {report['rows']} CA row(s) into {report['records']} record(s), {report['error_count']} rejected",
+            **report
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        flash(f'Error uploading CA scores: {str(e)}', 'error')
-        return redirect(url_for('ca.manage_ca'))
+        print(f"Error uploading CA scores: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @bp.route('/ca/search_students')
 def search_ca_students():
@@ -398,66 +359,92 @@ def search_ca_students():
         semester = request.args.get('semester', '1')
         course_code = request.args.get('course_code', '')
         course_name = request.args.get('course_name', '')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 100)
         
         query = {'status': 'active'}
         
-        if search_term:
-            query['$or'] = [
-                {'student_number': {'$regex': search_term, '$options': 'i'}},
-                {'f_name': {'$regex': search_term, '$options': 'i'}},
-                {'l_name': {'$regex': search_term, '$options': 'i'}}
-            ]
-        
         if school_id:
             query['school_id'] = ObjectId(school_id)
         
         if program_id:
             query['program_id'] = ObjectId(program_id)
         
-        students = list(students_collection.find(query).limit(50))
+        # Resolve the course filter once per request from the catalog cache
+        enrollment_query = {'academic_year': academic_year, 'semester': semester}
+        if course_code or course_name:
+            code_pattern = re.compile(re.escape(course_code), re.IGNORECASE)
+            name_pattern = re.compile(re.escape(course_name), re.IGNORECASE)
+            course_ids = [
+                course['_id'] for course in catalog.list('courses')
+                if code_pattern.search(course.get('code') or '') and name_pattern.search(course.get('name') or '')
+            ]
+            if not course_ids:
+                return jsonify([])
+            enrollment_query['course_id'] = {'$in': course_ids}
+        
+        student_fields = {'student_number': 1, 'f_name': 1, 'l_name': 1, 'school_id': 1, 'program_id': 1}
+        if tokenize(search_term):
+            # Start from the indexed search keys, so a keystroke costs as much as its matches,
+            # and count enrollments only for the page being returned
+            def enrollments(*stages):
+                return {'$lookup': {
+                    'from': student_courses_collection.name,
+                    'let': {'student_id': '$_id'},
+                    'pipeline': [{'$match': dict(enrollment_query, **{'$expr': {'$eq': ['$student_id', '$$student_id']}})}] + list(stages),
+                    'as': 'enrollments'
+                }}
+            
+            pipeline = search_stages(search_term, query) + [
+                enrollments({'$limit': 1}),
+                {'$match': {'enrollments': {'$ne': []}}},
+                {'$sort': SEARCH_SORT},
+                {'$skip': (page - 1) * per_page},
+                {'$limit': per_page},
+                enrollments({'$count': 'count'}),
+                {'$project': {
+                    'student': {field: f'${field}' for field in ['_id'] + list(student_fields)},
+                    'enrolled_courses_count': {'$ifNull': [{'$first': '$enrollments.count'}, 0]}
+                }}
+            ]
+            rows = students_collection.aggregate(pipeline)
+        else:
+            # No search term: page through the term's enrolled students, then count enrollments
+            # for that page only
+            enrolled_ids = student_courses_collection.distinct('student_id', enrollment_query)
+            page_students = list(students_collection.find(
+                dict(query, _id={'$in': enrolled_ids}), student_fields
+            ).sort([('l_name', 1), ('f_name', 1), ('_id', 1)]).skip((page - 1) * per_page).limit(per_page))
+            counts = {
+                row['_id']: row['count'] for row in student_courses_collection.aggregate([
+                    {'$match': dict(enrollment_query, student_id={'$in': [student['_id'] for student in page_students]})},
+                    {'$group': {'_id': '$student_id', 'count': {'$sum': 1}}}
+                ])
+            }
+            rows = [
+                {'student': student, 'enrolled_courses_count': counts.get(student['_id'], 0)}
+                for student in page_students
+            ]
+        
+        schools = catalog.by_id('schools')
+        programs = catalog.by_id('programs')
         
         filtered_students = []
-        for student in students:
-            # Build course query
-            course_query = {
-                'student_id': student['_id'],
-                'academic_year': academic_year,
-                'semester': semester
-            }
-            
-            # Add course filters if provided
-            if course_code or course_name:
-                course_filter = {}
-                if course_code:
-                    course_filter['code'] = {'$regex': course_code, '$options': 'i'}
-                if course_name:
-                    course_filter['name'] = {'$regex': course_name, '$options': 'i'}
-                
-                # Find courses matching the filters
-                matching_courses = list(courses_collection.find(course_filter))
-                if matching_courses:
-                    course_query['course_id'] = {'$in': [course['_id'] for course in matching_courses]}
-                else:
-                    # No courses match the filters, skip this student
-                    continue
+        for row in rows:
+            student = row['student']
+            school = schools.get(str(student.get('school_id')))
+            program = programs.get(str(student.get('program_id')))
             
-            # Check if student has courses for the specified semester and academic year
-            enrolled_courses = list(student_courses_collection.find(course_query))
-            
-            if enrolled_courses:
-                school = schools_collection.find_one({'_id': ObjectId(student['school_id'])}) if student.get('school_id') else None
-                program = programs_collection.find_one({'_id': ObjectId(student['program_id'])}) if student.get('program_id') else None
-                
-                student_data = {
-                    'id': str(student['_id']),
-                    'student_number': student['student_number'],
-                    'f_name': student['f_name'],
-                    'l_name': student['l_name'],
-                    'school_name': school['name'] if school else 'Unknown',
-                    'program_name': program['name'] if program else 'Unknown',
-                    'enrolled_courses_count': len(enrolled_courses)
-                }
-                filtered_students.append(student_data)
+            student_data = {
+                'id': str(student['_id']),
+                'student_number': student['student_number'],
+                'f_name': student['f_name'],
+                'l_name': student['l_name'],
+                'school_name': school['name'] if school else 'Unknown',
+                'program_name': program['name'] if program else 'Unknown',
+                'enrolled_courses_count': row['enrolled_courses_count']
+            }
+            filtered_students.append(student_data)
         
         return jsonify(filtered_students)
     except Exception as e:
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from app import courses_collection, programs_collection, schools_collection
 from bson import ObjectId
+from app.catalog import catalog
+from app.transcripts import invalidate_transcripts
 
 bp = Blueprint('courses_programs', __name__)
 
@@ -13,9 +15,9 @@ def max_filter(value, other):
 @bp.route('/academic-manager')
 def academic_manager():
     # Get all data needed for the template
-    schools = list(schools_collection.find())
-    programs = list(programs_collection.find())
-    courses = list(courses_collection.find())
+    schools = catalog.list('schools')
+    programs = catalog.list('programs')
+    courses = catalog.list('courses')
     
     # Get counts
     schools_count = len(schools)
@@ -28,9 +30,9 @@ def academic_manager():
     active_courses_count = len([c for c in courses if c.get('status') == 'active'])
     
     # Get recent items (last 5)
-    recent_schools = list(schools_collection.find().sort('_id', -1).limit(5))
-    recent_programs = list(programs_collection.find().sort('_id', -1).limit(5))
-    recent_courses = list(courses_collection.find().sort('_id', -1).limit(5))
+    recent_schools = sorted(schools, key=lambda s: s['_id'], reverse=True)[:5]
+    recent_programs = sorted(programs, key=lambda p: p['_id'], reverse=True)[:5]
+    recent_courses = sorted(courses, key=lambda c: c['_id'], reverse=True)[:5]
     
     # Get dictionaries for names
     schools_dic = {str(s['_id']): s['name'] for s in schools}
@@ -100,6 +102,7 @@ def add_school():
             'status': request.form.get('status', 'active')
         }
         schools_collection.insert_one(school_data)
+        catalog.invalidate('schools')
         flash('School added successfully!✅', 'success')
     except Exception as e:
         flash(f'Error adding school: {str(e)}', 'error')
@@ -116,6 +119,7 @@ def edit_school(school_id):
             'status': request.form.get('status', 'active')
         }
         schools_collection.update_one({'_id': ObjectId(school_id)}, {'$set': update_data})
+        catalog.invalidate('schools')
         flash('School updated successfully!✅', 'success')
     except Exception as e:
         flash(f'Error updating school: {str(e)}', 'error')
@@ -130,6 +134,7 @@ def delete_school(school_id):
             flash('Cannot delete school with existing programs!', 'error')
         else:
             schools_collection.delete_one({'_id': ObjectId(school_id)})
+            catalog.invalidate('schools')
             flash('School deleted successfully!✅', 'success')
     except Exception as e:
         flash(f'Error deleting school: {str(e)}', 'error')
@@ -150,6 +155,7 @@ def add_program():
             'status': request.form.get('status', 'active')
         }
         programs_collection.insert_one(program_data)
+        catalog.invalidate('programs')
         flash('Program added successfully!✅', 'success')
     except Exception as e:
         flash(f'Error adding program: {str(e)}', 'error')
@@ -169,6 +175,7 @@ def edit_program(program_id):
             'status': request.form.get('status', 'active')
         }
         programs_collection.update_one({'_id': ObjectId(program_id)}, {'$set': update_data})
+        catalog.invalidate('programs')
         flash('Program updated successfully!✅', 'success')
     except Exception as e:
         flash(f'Error updating program: {str(e)}', 'error')
@@ -183,12 +190,20 @@ def delete_program(program_id):
             flash('Cannot delete program with existing courses!', 'error')
         else:
             programs_collection.delete_one({'_id': ObjectId(program_id)})
+            catalog.invalidate('programs')
             flash('Program deleted successfully!✅', 'success')
     except Exception as e:
         flash(f'Error deleting program: {str(e)}', 'error')
     return redirect(url_for('courses_programs.academic_manager'))
 
 # Course Management Routes
+def parse_ca_weight(value):
+    """CA share of the final mark as entered on the course forms (0-100)"""
+    weight = float(value)
+    if not 0 <= weight <= 100:
+        raise ValueError('CA weight must be between 0 and 100')
+    return int(weight) if weight.is_integer() else weight
+
 @bp.route('/add_course', methods=['POST'])
 def add_course():
     try:
@@ -203,7 +218,10 @@ def add_course():
             'prerequisites': request.form.get('prerequisites', '').split(','),
             'status': request.form.get('status', 'active')
         }
+        if request.form.get('ca_weight'):
+            course_data['ca_weight'] = parse_ca_weight(request.form['ca_weight'])
         courses_collection.insert_one(course_data)
+        catalog.invalidate('courses')
         flash('Course added successfully!✅', 'success')
     except Exception as e:
         flash(f'Error adding course: {str(e)}', 'error')
@@ -223,7 +241,15 @@ def edit_course(course_id):
             'prerequisites': request.form.get('prerequisites', '').split(','),
             'status': request.form.get('status', 'active')
         }
-        courses_collection.update_one({'_id': ObjectId(course_id)}, {'$set': update_data})
+        update = {'$set': update_data}
+        if request.form.get('ca_weight', '').strip():
+            update_data['ca_weight'] = parse_ca_weight(request.form['ca_weight'])
+        else:
+            # A cleared weight falls back to SystemConfig.DEFAULT_CA_WEIGHT
+            update['$unset'] = {'ca_weight': ''}
+        courses_collection.update_one({'_id': ObjectId(course_id)}, update)
+        catalog.invalidate('courses')
+        invalidate_transcripts()
         flash('Course updated successfully!✅', 'success')
     except Exception as e:
         flash(f'Error updating course: {str(e)}', 'error')
@@ -233,6 +259,8 @@ def edit_course(course_id):
 def delete_course(course_id):
     try:
         courses_collection.delete_one({'_id': ObjectId(course_id)})
+        catalog.invalidate('courses')
+        invalidate_transcripts()
         flash('Course deleted successfully!✅', 'success')
     except Exception as e:
         flash(f'Error deleting course: {str(e)}', 'error')
@@ -243,4 +271,9 @@ def delete_course(course_id):
 def get_programs(school_id):
     programs = list(programs_collection.find({'school_id': ObjectId(school_id)}))
     programs_data = [{'id': str(program['_id']), 'name': program['name']} for program in programs]
-    return jsonify(programs_data)
\ No newline at end of file
+    return jsonify(programs_data)
+
+@bp.route('/academic-manager/cache_stats')
+def catalog_cache_stats():
+    """Hit/miss/eviction counters for the academic catalog cache"""
+    return jsonify(catalog.stats())
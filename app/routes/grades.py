@@ -1,62 +1,28 @@
 from flask import Blueprint, render_template, request, flash, url_for, redirect, jsonify, session
 from app import students_collection, courses_collection, programs_collection, schools_collection, student_courses_collection, grades_collection, mock_grades_collection, staff_collection
 from bson import ObjectId
+from app.search import search_stages, SEARCH_SORT
+from app.catalog import catalog
+from app.enrichment import enrich_courses
 from datetime import datetime
+import re
 
 # Replace the import line with this:
-from app.utils import can_view_semester_grades, get_semester_balance, get_semester_fees, get_staff_privilege_level, has_staff_privilege
+from app.utils import get_staff_privilege_level, has_staff_privilege, get_viewable_semesters
 from app.config import SystemConfig
+from app.grading import GRADE_SCALE, is_passing_grade, get_remarks
+from app.grade_import import import_grades_csv, EXAM_TYPES
+from app.mark_entry import load_course_roster, save_course_marks, save_semester_grades
+from app.transcripts import get_transcript
+from app.academic_standing import get_academic_standing, standing_list
+from app.final_marks import compute_final_marks, courses_for_school, get_final_marks
+from app.result_analytics import get_analytics, list_course_analytics
 
 bp = Blueprint('grades', __name__)
 
-# Grade scale and definitions
-GRADE_SCALE = {
-    'A+': {'range': (86, 100), 'description': 'Distinction'},
-    'A': {'range': (76, 85), 'description': 'Distinction'},
-    'B+': {'range': (66, 75), 'description': 'Meritorious'},
-    'B': {'range': (60, 65), 'description': 'Credit'},
-    'C+': {'range': (55, 59), 'description': 'Clear Pass'},
-    'C': {'range': (50, 54), 'description': 'Bare Pass'},
-    'D+': {'range': (45, 49), 'description': 'Bare Fail'},
-    'D': {'range': (0, 44), 'description': 'Definite Fail'},
-    'F': {'range': None, 'description': 'Fail in Supplementary Exam'},
-    'U': {'range': None, 'description': 'Unsatisfactory - Fail in Practical/Thesis/Oral'},
-    'P': {'range': None, 'description': 'Pass in Supplementary/Practical'},
-    'S': {'range': None, 'description': 'Satisfactory - Pass in Practical/Oral'},
-    'WP': {'range': None, 'description': 'Withdraw with Permission'},
-    'DC': {'range': None, 'description': 'Deceased during Course'},
-    'EX': {'range': None, 'description': 'Exempted'},
-    'INC': {'range': None, 'description': 'Incomplete'},
-    'DEF': {'range': None, 'description': 'Deferred Exam'},
-    'SP': {'range': None, 'description': 'Supplementary Exam'},
-    'DISQ': {'range': None, 'description': 'Disqualified'}
-}
-
-def calculate_grade(marks):
-    """Calculate grade based on marks"""
-    if marks is None:
-        return None
-    
-    for grade, info in GRADE_SCALE.items():
-        if info['range'] and info['range'][0] <= marks <= info['range'][1]:
-            return grade
-    return 'D'  # Default to D if no range matches
-
-def get_grade_description(grade):
-    """Get description for a grade"""
-    return GRADE_SCALE.get(grade, {}).get('description', 'Unknown')
-
-def is_passing_grade(grade):
-    """Check if grade is passing (50 and above)"""
-    passing_grades = ['A+', 'A', 'B+', 'B', 'C+', 'C', 'P', 'S', 'EX']
-    return grade in passing_grades
-
-def get_remarks(grade):
-    """Get remarks based on grade - either 'Proceed' or 'Repeat'"""
-    if is_passing_grade(grade):
-        return 'Proceed'
-    else:
-        return 'Repeat'
+# Course grading systems counted as graded / ungraded by the course_type filters
+GRADED_SYSTEMS = ['letter', 'percentage', 'points']
+UNGRADED_SYSTEMS = ['pass_fail', 'satisfactory', 'credit']
 
 @bp.route('/Grades')
 def grades_dashboard():
@@ -66,8 +32,8 @@ def grades_dashboard():
 @bp.route('/grades/final')
 def final_grades():
     """Final grades management page"""
-    schools = list(schools_collection.find({'status': 'active'}))
-    programs = list(programs_collection.find({'status': 'active'}))
+    schools = catalog.list('schools', status='active')
+    programs = catalog.list('programs', status='active')
     academic_years = ['2036/2037','2035/2036','2034/2035','2033/2034','2032/2033','2031/2032','2030/2031','2029/2030','2028/2029','2027/2028','2026/2027','2025/2026', '2024/2025', '2023/2024', '2022/2023', '2021/2022','2020/2021', '2019/2020']  # Expanded list
     semesters = ['1', '2']
     
@@ -81,8 +47,8 @@ def final_grades():
 @bp.route('/grades/mock')
 def mock_grades():
     """Mock grades management page"""
-    schools = list(schools_collection.find({'status': 'active'}))
-    programs = list(programs_collection.find({'status': 'active'}))
+    schools = catalog.list('schools', status='active')
+    programs = catalog.list('programs', status='active')
     academic_years = ['2025/2026', '2024/2025', '2023/2024']
     semesters = ['1', '2']
     
@@ -103,92 +69,110 @@ def search_students():
         academic_year = request.args.get('academic_year', '')
         course_type = request.args.get('course_type', '')
         course_code = request.args.get('course_code', '')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 100)
         
         query = {'status': 'active'}
         
-        if search_term:
-            query['$or'] = [
-                {'student_number': {'$regex': search_term, '$options': 'i'}},
-                {'f_name': {'$regex': search_term, '$options': 'i'}},
-                {'l_name': {'$regex': search_term, '$options': 'i'}},
-                {'email': {'$regex': search_term, '$options': 'i'}}
-            ]
-        
         if school_id:
             query['school_id'] = ObjectId(school_id)
         
         if program_id:
             query['program_id'] = ObjectId(program_id)
         
-        students = list(students_collection.find(query).limit(50))  # Limit results
+        # Student match, enrollment/course filters and school/program names in one
+        # round trip; only the requested page is resolved
+        enrollment_stages = [
+            {'$lookup': {
+                'from': student_courses_collection.name,
+                'localField': '_id',
+                'foreignField': 'student_id',
+                'as': 'enrollments'
+            }},
+            {'$addFields': {
+                'current_academic_year': {'$max': '$enrollments.academic_year'},
+                'enrollments': {'$filter': {
+                    'input': '$enrollments',
+                    'as': 'enrollment',
+                    'cond': {'$eq': ['$$enrollment.academic_year', academic_year]}
+                }} if academic_year else '$enrollments'
+            }}
+        ]
+        
+        page_stages = [{'$sort': SEARCH_SORT}, {'$skip': (page - 1) * per_page}, {'$limit': per_page}]
+        if not (course_code or course_type):
+            # Enrollments only narrow the course filters, so without them join just the page
+            pipeline = search_stages(search_term, query) + page_stages + enrollment_stages
+        else:
+            pipeline = search_stages(search_term, query) + enrollment_stages
+            code_pattern = re.escape(course_code)
+            pipeline += [
+                {'$lookup': {
+                    'from': courses_collection.name,
+                    'let': {'course_ids': '$enrollments.course_id'},
+                    'pipeline': [
+                        {'$match': {'$expr': {'$in': ['$_id', '$$course_ids']}}},
+                        {'$project': {'code': 1, 'grading_system': 1}}
+                    ],
+                    'as': 'enrolled_courses'
+                }}
+            ]
+            course_filters = {}
+            if course_code:
+                course_filters['enrolled_courses.code'] = {'$regex': code_pattern, '$options': 'i'}
+            if course_type == 'graded':
+                course_filters['enrolled_courses.grading_system'] = {'$in': GRADED_SYSTEMS}
+            elif course_type == 'ungraded':
+                course_filters['enrolled_courses.grading_system'] = {'$in': UNGRADED_SYSTEMS}
+            if course_filters:
+                pipeline.append({'$match': course_filters})
+            if course_code:
+                pipeline.append({'$addFields': {'matching_courses': {'$map': {
+                    'input': {'$filter': {
+                        'input': '$enrolled_courses',
+                        'as': 'course',
+                        'cond': {'$regexMatch': {
+                            'input': {'$ifNull': ['$$course.code', '']},
+                            'regex': code_pattern,
+                            'options': 'i'
+                        }}
+                    }},
+                    'as': 'course',
+                    'in': '$$course.code'
+                }}}})
+            pipeline += page_stages
+        
+        pipeline += [
+            {'$lookup': {'from': schools_collection.name, 'localField': 'school_id', 'foreignField': '_id', 'as': 'school'}},
+            {'$lookup': {'from': programs_collection.name, 'localField': 'program_id', 'foreignField': '_id', 'as': 'program'}},
+            {'$project': {
+                'student_number': 1,
+                'f_name': 1,
+                'l_name': 1,
+                'email': 1,
+                'current_academic_year': 1,
+                'matching_courses': 1,
+                'school_name': {'$ifNull': [{'$first': '$school.name'}, 'Unknown']},
+                'program_name': {'$ifNull': [{'$first': '$program.name'}, 'Unknown']}
+            }}
+        ]
         
-        # Filter by academic year, course type, and course code if specified
         filtered_students = []
-        for student in students:
-            # Check if student has courses matching the filters
-            course_query = {'student_id': student['_id']}
-            
-            if academic_year:
-                course_query['academic_year'] = academic_year
-            
-            # Get student's enrolled courses to check course type and code
-            enrolled_courses = list(student_courses_collection.find(course_query))
-            
-            if enrolled_courses:
-                course_ids = [ec['course_id'] for ec in enrolled_courses]
-                courses = list(courses_collection.find({'_id': {'$in': course_ids}}))
-                
-                # Apply course code filter if specified
-                if course_code:
-                    matching_courses = [c for c in courses if course_code.upper() in c.get('code', '').upper()]
-                    if not matching_courses:
-                        continue  # Skip student if no courses match the course code
-                
-                # Apply course type filter if specified
-                if course_type:
-                    if course_type == 'graded':
-                        graded_courses = [c for c in courses if c.get('grading_system') in ['letter', 'percentage', 'points']]
-                        if not graded_courses:
-                            continue  # Skip student if no graded courses match
-                    elif course_type == 'ungraded':
-                        ungraded_courses = [c for c in courses if c.get('grading_system') in ['pass_fail', 'satisfactory', 'credit']]
-                        if not ungraded_courses:
-                            continue  # Skip student if no ungraded courses match
-            else:
-                # If no enrolled courses and we have course-related filters, skip this student
-                if course_code or course_type:
-                    continue
-            
-            # If we get here, student matches all filters
-            school = schools_collection.find_one({'_id': ObjectId(student['school_id'])}) if student.get('school_id') else None
-            program = programs_collection.find_one({'_id': ObjectId(student['program_id'])}) if student.get('program_id') else None
-            
-            # Get current academic year for display
-            current_enrollment = student_courses_collection.find_one(
-                {'student_id': student['_id']},
-                sort=[('academic_year', -1)]
-            )
-            
-            # Get matching course names for display if course code filter is used
-            matching_course_names = []
-            if course_code and enrolled_courses:
-                matching_courses = [c for c in courses if course_code.upper() in c.get('code', '').upper()]
-                matching_course_names = [c['code'] for c in matching_courses]
-            
+        for student in students_collection.aggregate(pipeline):
             student_data = {
                 'id': str(student['_id']),
                 'student_number': student['student_number'],
                 'f_name': student['f_name'],
                 'l_name': student['l_name'],
                 'email': student['email'],
-                'school_name': school['name'] if school else 'Unknown',
-                'program_name': program['name'] if program else 'Unknown',
-                'academic_year': current_enrollment.get('academic_year') if current_enrollment else 'N/A'
+                'school_name': student['school_name'],
+                'program_name': student['program_name'],
+                'academic_year': student.get('current_academic_year') or 'N/A'
             }
             
             # Add matching courses info if course code filter was used
-            if matching_course_names:
-                student_data['matching_courses'] = ', '.join(matching_course_names)
+            if student.get('matching_courses'):
+                student_data['matching_courses'] = ', '.join(student['matching_courses'])
             
             filtered_students.append(student_data)
         
@@ -212,10 +196,11 @@ def get_student_courses(student_id):
             'semester': semester
         }
         enrolled_courses = list(student_courses_collection.find(query))
+        enrich_courses(enrolled_courses, include_school=False)
         
         courses_data = []
         for ec in enrolled_courses:
-            course = courses_collection.find_one({'_id': ObjectId(ec['course_id'])})
+            course = ec['course']
             if course:
                 # Apply course code filter if specified
                 if course_code and course_code.upper() not in course.get('code', '').upper():
@@ -223,12 +208,12 @@ def get_student_courses(student_id):
                 
                 # Apply course type filter if specified
                 if course_type:
-                    if course_type == 'graded' and course.get('grading_system') not in ['letter', 'percentage', 'points']:
+                    if course_type == 'graded' and course.get('grading_system') not in GRADED_SYSTEMS:
                         continue
-                    elif course_type == 'ungraded' and course.get('grading_system') not in ['pass_fail', 'satisfactory', 'credit']:
+                    elif course_type == 'ungraded' and course.get('grading_system') not in UNGRADED_SYSTEMS:
                         continue
                 
-                program = programs_collection.find_one({'_id': ObjectId(course['program_id'])})
+                program = ec['program']
                 courses_data.append({
                     'course_id': str(course['_id']),
                     'course_code': course['code'],
@@ -271,12 +256,15 @@ def get_grades(student_id, exam_type):
         if grade_doc:
             grades_data = grade_doc.get('grades', [])
             # Check if grades can be viewed
-            can_view = has_staff_privilege or can_view_semester_grades(student_id, semester, academic_year)
+            can_view = has_staff_privilege or get_viewable_semesters(student_id, [(academic_year, semester)])[
+                f"{academic_year}_semester_{semester}"
+            ]
             
             # Enhance grades data with course information
+            enrich_courses(grades_data, include_program=False, include_school=False)
             enhanced_grades = []
             for grade_entry in grades_data:
-                course = courses_collection.find_one({'_id': ObjectId(grade_entry['course_id'])})
+                course = grade_entry['course']
                 if course:
                     enhanced_grades.append({
                         'course_id': grade_entry['course_id'],
@@ -296,88 +284,352 @@ def get_grades(student_id, exam_type):
 
 @bp.route('/grades/save_grades/<student_id>/<exam_type>', methods=['POST'])
 def save_grades(student_id, exam_type):
-    """Save grades for a student - each semester as a separate document"""
+    """Save grades for a student - each semester as a separate document, writing only the courses that changed"""
     try:
         data = request.get_json()
         academic_year = data.get('academic_year', '2025/2026')
         semester = data.get('semester', '1')
-        grades_data = data.get('grades', [])
-        
-        # Prepare grades with automatic remarks
-        prepared_grades = []
-        for grade_entry in grades_data:
-            grade = grade_entry.get('grade')
-            prepared_grades.append({
-                'course_id': grade_entry['course_id'],
-                'marks': grade_entry.get('marks'),
-                'grade': grade,
-                'remarks': get_remarks(grade)  # Auto-generate remarks
-            })
         
-        # Choose the appropriate collection based on exam type
-        if exam_type == 'mock':
-            collection = mock_grades_collection
-            exam_type_display = 'Mock'
-        else:
-            collection = grades_collection
-            exam_type_display = 'Final'
+        exam_type_display = 'Mock' if exam_type == 'mock' else 'Final'
         
-        # Create or update grade document for this semester
-        grade_doc = {
-            'student_id': ObjectId(student_id),
-            'exam_type': exam_type,  # Still store exam type for consistency
+        result = save_semester_grades([{
+            'student_id': student_id,
             'academic_year': academic_year,
             'semester': semester,
-            'grades': prepared_grades,
-            'entered_by': 'System',  # You can replace with actual user
-            'entered_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
+            'exam_type': exam_type,
+            'grades': data.get('grades', []),
+            'version': data.get('version')
+        }])[0]
         
-        # Upsert the grade document
-        collection.update_one(
-            {
-                'student_id': ObjectId(student_id),
-                'academic_year': academic_year,
-                'semester': semester
-            },
-            {'$set': grade_doc},
-            upsert=True
-        )
+        if result['conflict']:
+            return jsonify({'success': False, 'conflict': True, 'version': result['version'], 'error': result['error']}), 409
+        if not result['success']:
+            return jsonify({'success': False, 'error': result['error']}), 400
         
         return jsonify({
             'success': True,
+            'version': result['version'],
+            'changed': result['changed'],
             'message': f'{exam_type_display} grades saved successfully for {academic_year} Semester {semester}!'
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@bp.route('/grades/save_grades_bulk/<exam_type>', methods=['POST'])
+def save_grades_bulk(exam_type):
+    """Save many students' semester grades at once; returns a result per update"""
+    try:
+        data = request.get_json()
+        updates = data.get('updates', [])
+        for update in updates:
+            update['exam_type'] = exam_type
+        
+        results = save_semester_grades(updates)
+        saved_count = sum(1 for result in results if result['success'])
+        
+        return jsonify({
+            'success': saved_count == len(results),
+            'message': f'Saved {saved_count} of {len(results)} grade update(s)',
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/course_roster/<course_id>')
+def course_roster(course_id):
+    """Class list for one course and term with existing final, mock and CA marks"""
+    try:
+        academic_year = request.args.get('academic_year', '2025/2026')
+        semester = request.args.get('semester', '1')
+        
+        course = catalog.get('courses', course_id)
+        if not course:
+            return jsonify({'success': False, 'error': 'Course not found'}), 404
+        
+        roster = load_course_roster(course_id, academic_year, semester)
+        return jsonify({
+            'success': True,
+            'course': {'id': str(course['_id']), 'code': course.get('code'), 'name': course.get('name')},
+            'students': roster
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/save_course_marks/<course_id>/<exam_type>', methods=['POST'])
+def save_course_marks_api(course_id, exam_type):
+    """Save final, mock or CA marks for a whole class in one request"""
+    try:
+        if exam_type not in ('final', 'mock', 'ca'):
+            return jsonify({'success': False, 'error': f'Unknown exam type {exam_type}'}), 400
+        
+        data = request.get_json()
+        academic_year = data.get('academic_year', '2025/2026')
+        semester = data.get('semester', '1')
+        
+        results = save_course_marks(course_id, academic_year, semester, exam_type, data.get('marks', []))
+        saved_count = sum(1 for result in results if result['success'])
+        
+        return jsonify({
+            'success': saved_count == len(results),
+            'message': f'Saved marks for {saved_count} of {len(results)} student(s) for {academic_year} Semester {semester}',
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/result_sheet/<course_id>')
+def course_result_sheet(course_id):
+    """Every student's mark, grade and remark for one course and term"""
+    try:
+        academic_year = request.args.get('academic_year', '2025/2026')
+        semester = request.args.get('semester', '1')
+        exam_type = request.args.get('exam_type', 'final')
+        
+        course = catalog.get('courses', course_id)
+        if not course:
+            return jsonify({'success': False, 'error': 'Course not found'}), 404
+        
+        collection = mock_grades_collection if exam_type == 'mock' else grades_collection
+        course_key = str(course['_id'])
+        
+        # The leading $match uses the multikey grades.course_id index; the second one keeps
+        # only this course's element after the unwind
+        pipeline = [
+            {'$match': {'grades.course_id': course_key, 'academic_year': academic_year, 'semester': semester}},
+            {'$project': {'student_id': 1, 'grades': 1}},
+            {'$unwind': '$grades'},
+            {'$match': {'grades.course_id': course_key}},
+            {'$lookup': {
+                'from': students_collection.name,
+                'localField': 'student_id',
+                'foreignField': '_id',
+                'as': 'student'
+            }},
+            {'$unwind': '$student'},
+            {'$project': {
+                '_id': 0,
+                'student_id': {'$toString': '$student_id'},
+                'student_number': '$student.student_number',
+                'f_name': '$student.f_name',
+                'l_name': '$student.l_name',
+                'marks': '$grades.marks',
+                'grade': '$grades.grade',
+                'remarks': '$grades.remarks'
+            }},
+            {'$sort': {'student_number': 1}}
+        ]
+        results = list(collection.aggregate(pipeline, allowDiskUse=True))
+        
+        grade_counts = {}
+        for row in results:
+            grade = row.get('grade') or 'N/A'
+            grade_counts[grade] = grade_counts.get(grade, 0) + 1
+        
+        return jsonify({
+            'success': True,
+            'course': {'id': course_key, 'code': course.get('code'), 'name': course.get('name')},
+            'academic_year': academic_year,
+            'semester': semester,
+            'exam_type': exam_type,
+            'total_students': len(results),
+            'passed': sum(1 for row in results if is_passing_grade(row.get('grade'))),
+            'grade_counts': grade_counts,
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/academic_standing/<standing>')
+def academic_standing_list(standing):
+    """Dean's list, probation and other standing lists, optionally for one program"""
+    try:
+        if standing not in ('deans_list', 'good_standing', 'probation', 'no_results'):
+            return jsonify({'success': False, 'error': f'Unknown standing {standing}'}), 400
+        
+        summaries = standing_list(standing, request.args.get('program_id') or None)
+        students = {
+            student['_id']: student for student in students_collection.find(
+                {'_id': {'$in': [summary['student_id'] for summary in summaries]}},
+                {'student_number': 1, 'f_name': 1, 'l_name': 1}
+            )
+        }
+        
+        results = []
+        for summary in summaries:
+            student = students.get(summary['student_id'], {})
+            program = catalog.get('programs', summary.get('program_id'))
+            results.append({
+                'student_id': str(summary['student_id']),
+                'student_number': student.get('student_number'),
+                'name': f"{student.get('f_name', '')} {student.get('l_name', '')}".strip(),
+                'program': program['name'] if program else 'N/A',
+                'cumulative_gpa': summary.get('cumulative_gpa'),
+                'attempted_credits': summary.get('attempted_credits', 0),
+                'earned_credits': summary.get('earned_credits', 0)
+            })
+        
+        return jsonify({'success': True, 'standing': standing, 'students': results})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/student_standing/<student_id>')
+def student_standing(student_id):
+    """A student's per-semester and cumulative GPA with attempted and earned credits"""
+    try:
+        summary = get_academic_standing(student_id)
+        if not summary:
+            return jsonify({'success': False, 'error': 'Student not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'cumulative_gpa': summary.get('cumulative_gpa'),
+            'attempted_credits': summary.get('attempted_credits', 0),
+            'earned_credits': summary.get('earned_credits', 0),
+            'standing': summary.get('standing'),
+            'semesters': summary.get('semesters', {})
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/compute_final_marks', methods=['POST'])
+def compute_final_marks_api():
+    """Compute composite CA + exam final marks for one course, or every course in a school"""
+    try:
+        data = request.get_json()
+        academic_year = data.get('academic_year', '2025/2026')
+        semester = data.get('semester', '1')
+        
+        if data.get('course_id'):
+            course_ids = [data['course_id']]
+        elif data.get('school_id'):
+            course_ids = courses_for_school(data['school_id'])
+        else:
+            return jsonify({'success': False, 'error': 'course_id or school_id is required'}), 400
+        
+        result = compute_final_marks(course_ids, academic_year, semester)
+        return jsonify({
+            'success': True,
+            'message': f"Computed {result['computed']} final mark(s) across {result['courses']} course(s) for {academic_year} Semester {semester}",
+            **result
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/final_marks/<course_id>')
+def course_final_marks(course_id):
+    """Stored composite final marks for a course and term"""
+    try:
+        academic_year = request.args.get('academic_year', '2025/2026')
+        semester = request.args.get('semester', '1')
+        
+        marks = get_final_marks(course_id, academic_year, semester)
+        students = {
+            student['_id']: student for student in students_collection.find(
+                {'_id': {'$in': [mark['student_id'] for mark in marks]}},
+                {'student_number': 1, 'f_name': 1, 'l_name': 1}
+            )
+        }
+        
+        results = []
+        for mark in marks:
+            student = students.get(mark['student_id'], {})
+            results.append({
+                'student_id': str(mark['student_id']),
+                'student_number': student.get('student_number'),
+                'name': f"{student.get('f_name', '')} {student.get('l_name', '')}".strip(),
+                'ca_percentage': mark.get('ca_percentage'),
+                'exam_marks': mark.get('exam_marks'),
+                'ca_weight': mark.get('ca_weight'),
+                'final_mark': mark.get('final_mark'),
+                'grade': mark.get('grade'),
+                'remarks': mark.get('remarks')
+            })
+        results.sort(key=lambda row: row['student_number'] or '')
+        
+        return jsonify({'success': True, 'results': results})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _analytics_json(document):
+    """A Result Analytics document with ids as strings and course details from the catalog"""
+    for field in ('course_id', 'program_id', 'school_id'):
+        if document.get(field) is not None:
+            document[field] = str(document[field])
+    if document.get('course_id'):
+        course = catalog.get('courses', document['course_id'])
+        document['course_code'] = course['code'] if course else 'N/A'
+        document['course_name'] = course['name'] if course else 'N/A'
+    return document
 
+@bp.route('/grades/analytics/<scope>/<scope_id>')
+def result_analytics(scope, scope_id):
+    """Precomputed result analytics (histograms, mean, pass rate) for a course, program or school"""
+    try:
+        if scope not in ('course', 'program', 'school'):
+            return jsonify({'success': False, 'error': f'Unknown scope {scope}'}), 400
+        
+        academic_year = request.args.get('academic_year', '2025/2026')
+        semester = request.args.get('semester', '1')
+        exam_type = 'mock' if request.args.get('exam_type') == 'mock' else 'final'
+        
+        document = get_analytics(scope, scope_id, academic_year, semester, exam_type)
+        if not document:
+            return jsonify({'success': False, 'error': 'No results recorded for this term'}), 404
+        
+        return jsonify({'success': True, 'analytics': _analytics_json(document)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/grades/analytics/courses')
+def course_analytics_list():
+    """Every course's precomputed results for a term, lowest pass rate first (exam board view)"""
+    try:
+        academic_year = request.args.get('academic_year', '2025/2026')
+        semester = request.args.get('semester', '1')
+        exam_type = 'mock' if request.args.get('exam_type') == 'mock' else 'final'
+        
+        documents = list_course_analytics(
+            academic_year, semester, exam_type,
+            program_id=request.args.get('program_id') or None,
+            school_id=request.args.get('school_id') or None
+        )
+        return jsonify({'success': True, 'courses': [_analytics_json(document) for document in documents]})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @bp.route('/grades/upload_grades/<exam_type>', methods=['POST'])
 def upload_grades(exam_type):
-    """Upload grades via CSV file"""
+    """Upload grades via CSV file and return a row-level import report"""
     try:
+        if exam_type not in EXAM_TYPES:
+            return jsonify({'success': False, 'error': f"Unknown exam type '{exam_type}'"}), 400
+        
         if 'file' not in request.files:
-            flash('No file selected!', 'error')
-            return redirect(url_for(f'grades.{exam_type}_grades'))
+            return jsonify({'success': False, 'error': 'No file selected!'}), 400
         
         file = request.files['file']
         if file.filename == '':
-            flash('No file selected!', 'error')
-            return redirect(url_for(f'grades.{exam_type}_grades'))
+            return jsonify({'success': False, 'error': 'No file selected!'}), 400
         
-        if file and file.filename.endswith('.csv'):
-            # Process CSV file
-            # This is a simplified version - you'd need to implement CSV parsing
-            flash('CSV upload functionality to be implemented', 'info')
-        else:
-            flash('Please upload a CSV file', 'error')
+        if not file.filename.lower().endswith('.csv'):
+            return jsonify({'success': False, 'error': 'Please upload a CSV file'}), 400
         
-        return redirect(url_for(f'grades.{exam_type}_grades'))
+        academic_year = request.form.get('academic_year', '2025/2026')
+        semester = request.form.get('semester', '1')
+        
+        report = import_grades_csv(file.stream, exam_type, academic_year, semester)
+        exam_type_display = 'Mock' if exam_type == 'mock' else 'Final'
+        
+        return jsonify({
+            'success': True,
+            'message': f"{exam_type_display} grades imported: {report['imported']} of {report['rows']} row(s), {report['error_count']} rejected",
+            **report
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        flash(f'Error uploading grades: {str(e)}', 'error')
-        return redirect(url_for(f'grades.{exam_type}_grades'))
+        print(f"Error uploading grades: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @bp.route('/grades/get_course_codes')
@@ -404,38 +656,22 @@ def student_results(student_id):
             return redirect(url_for('grades.final_grades'))
         
         # Get school and program details
-        school = schools_collection.find_one({'_id': ObjectId(student['school_id'])}) if student.get('school_id') else None
-        program = programs_collection.find_one({'_id': ObjectId(student['program_id'])}) if student.get('program_id') else None
+        school = catalog.get('schools', student.get('school_id'))
+        program = catalog.get('programs', student.get('program_id'))
         
-        # Get all grade documents for this student from both collections
-        final_grades = list(grades_collection.find({
-            'student_id': ObjectId(student_id)
-        }).sort([('academic_year', -1), ('semester', -1)]))
-        
-        mock_grades = list(mock_grades_collection.find({
-            'student_id': ObjectId(student_id)
-        }).sort([('academic_year', -1), ('semester', -1)]))
+        # Final and mock results from the cached transcript read model
+        transcript = get_transcript(student_id)
+        final_grades = [semester for semester in transcript if semester['exam_type'] == 'final']
+        mock_grades = [semester for semester in transcript if semester['exam_type'] == 'mock']
         
         # Check staff privileges
         staff_has_privilege = has_staff_privilege()
-        print(f"Staff has privilege: {staff_has_privilege}")
-        
-        # Check which semesters can be viewed based on balance AND staff privileges
-        viewable_semesters = {}
-        for grade_doc in final_grades + mock_grades:
-            academic_year = grade_doc['academic_year']
-            semester = grade_doc['semester']
-            key = f"{academic_year}_semester_{semester}"
-            
-            if key not in viewable_semesters:
-                # Staff can always view, otherwise check balance
-                can_view = staff_has_privilege or can_view_semester_grades(student_id, semester, academic_year)
-                viewable_semesters[key] = can_view
-                print(f"Semester {key} - Staff access: {staff_has_privilege}, Can view: {can_view}")
         
-        # Get all courses for course name lookup
-        all_courses = list(courses_collection.find({}))
-        courses_dict = {str(course['_id']): course for course in all_courses}
+        # Check which semesters can be viewed based on balance AND staff privileges, all in one pass
+        viewable_semesters = get_viewable_semesters(
+            student_id,
+            [(doc['academic_year'], doc['semester']) for doc in final_grades + mock_grades]
+        )
         
         return render_template('grades/student_results.html',
                              student=student,
@@ -443,7 +679,6 @@ def student_results(student_id):
                              program=program,
                              final_grades=final_grades,
                              mock_grades=mock_grades,
-                             courses_dict=courses_dict,
                              viewable_semesters=viewable_semesters,
                              SystemConfig=SystemConfig,
                              has_staff_access=staff_has_privilege)  # Pass this to template
@@ -460,77 +695,46 @@ def get_student_all_grades(student_id):
         staff_privilege = get_staff_privilege_level(staff_id) if staff_id else None
         has_staff_privilege = staff_privilege in ['admin', 'registrar', 'finance', 'academic']
         
-        # Get all grade documents for this student from both collections
-        final_grade_docs = list(grades_collection.find({
-            'student_id': ObjectId(student_id)
-        }).sort([('academic_year', -1), ('semester', -1)]))
+        # Final and mock results from the cached transcript read model
+        transcript = get_transcript(student_id)
         
-        mock_grade_docs = list(mock_grades_collection.find({
-            'student_id': ObjectId(student_id)
-        }).sort([('academic_year', -1), ('semester', -1)]))
+        # Grade-view decisions for every semester in one batched pass
+        viewable_semesters = {}
+        if not has_staff_privilege:
+            viewable_semesters = get_viewable_semesters(
+                student_id,
+                [(semester['academic_year'], semester['semester']) for semester in transcript]
+            )
         
         grades_data = []
-        
-        # Process final grades
-        for doc in final_grade_docs:
-            academic_year = doc['academic_year']
-            semester = doc['semester']
-            
-            # Check if grades can be viewed
-            can_view = has_staff_privilege or can_view_semester_grades(student_id, semester, academic_year)
-            
-            enhanced_grades = []
-            for grade_entry in doc.get('grades', []):
-                course = courses_collection.find_one({'_id': ObjectId(grade_entry['course_id'])})
-                if course:
-                    enhanced_grades.append({
-                        'course_code': course['code'],
-                        'course_name': course['name'],
-                        'marks': grade_entry.get('marks') if can_view else None,
-                        'grade': grade_entry.get('grade') if can_view else 'HIDDEN',
-                        'remarks': grade_entry.get('remarks') if can_view else 'Results withheld due to outstanding balance',
-                        'can_view': can_view,
-                        'withheld_reason': None if can_view else 'Outstanding balance'
-                    })
-            
-            grades_data.append({
-                'exam_type': 'final',
-                'academic_year': academic_year,
-                'semester': semester,
-                'entered_at': doc.get('entered_at', datetime.utcnow()).strftime('%Y-%m-%d %H:%M'),
-                'grades': enhanced_grades,
-                'can_view': can_view,
-                'viewed_by_staff': has_staff_privilege
-            })
-        
-        # Process mock grades
-        for doc in mock_grade_docs:
-            academic_year = doc['academic_year']
-            semester = doc['semester']
+        for semester_doc in transcript:
+            academic_year = semester_doc['academic_year']
+            semester = semester_doc['semester']
             
             # Check if grades can be viewed
-            can_view = has_staff_privilege or can_view_semester_grades(student_id, semester, academic_year)
+            can_view = has_staff_privilege or viewable_semesters[f"{academic_year}_semester_{semester}"]
             
             enhanced_grades = []
-            for grade_entry in doc.get('grades', []):
-                course = courses_collection.find_one({'_id': ObjectId(grade_entry['course_id'])})
-                if course:
-                    enhanced_grades.append({
-                        'course_code': course['code'],
-                        'course_name': course['name'],
-                        'marks': grade_entry.get('marks') if can_view else None,
-                        'grade': grade_entry.get('grade') if can_view else 'HIDDEN',
-                        'remarks': grade_entry.get('remarks') if can_view else 'Results withheld due to outstanding balance',
-                        'can_view': can_view,
-                        'withheld_reason': None if can_view else 'Outstanding balance'
-                    })
+            for grade_entry in semester_doc['grades']:
+                enhanced_grades.append({
+                    'course_code': grade_entry['course_code'],
+                    'course_name': grade_entry['course_name'],
+                    'credits': grade_entry['credits'],
+                    'marks': grade_entry['marks'] if can_view else None,
+                    'grade': grade_entry['grade'] if can_view else 'HIDDEN',
+                    'remarks': grade_entry['remarks'] if can_view else 'Results withheld due to outstanding balance',
+                    'can_view': can_view,
+                    'withheld_reason': None if can_view else 'Outstanding balance'
+                })
             
             grades_data.append({
-                'exam_type': 'mock',
+                'exam_type': semester_doc['exam_type'],
                 'academic_year': academic_year,
                 'semester': semester,
-                'entered_at': doc.get('entered_at', datetime.utcnow()).strftime('%Y-%m-%d %H:%M'),
+                'entered_at': (semester_doc['entered_at'] or datetime.utcnow()).strftime('%Y-%m-%d %H:%M'),
                 'grades': enhanced_grades,
+                'gpa': semester_doc['gpa'] if can_view else None,
+                'credits': semester_doc['credits'],
                 'can_view': can_view,
                 'viewed_by_staff': has_staff_privilege
             })
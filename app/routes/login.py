@@ -1,28 +1,29 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, session, jsonify
 from werkzeug.security import check_password_hash, generate_password_hash
 from app.forms import LoginForm
-from app import users_collection, students_collection, staff_collection
+from app import users_collection, students_collection, staff_collection, settings_collection
 from bson import ObjectId
+from app.users import build_login_keys, find_login_user
 import datetime
 
 bp = Blueprint('auth', __name__)
 
+def admin_exists():
+    """True if at least one admin user account exists"""
+    return users_collection.find_one({'user_type': 'staff', 'privilege_level': 'admin'}, {'_id': 1}) is not None
+
 def create_default_admin():
-    """Create a default admin account if it doesn't exist"""
+    """Create a default admin account if it doesn't exist; returns True once an admin exists"""
     try:
-        # Check if admin already exists
-        admin_exists = users_collection.find_one({
-            'user_type': 'staff',
-            'privilege_level': 'admin'
-        })
-        
-        if not admin_exists:
+        if not admin_exists():
             admin_data = {
                 'username': 'admin',
                 'email': 'admin@university.edu',
                 'password': generate_password_hash('admin123'),
                 'f_name': 'System',
                 'l_name': 'Administrator',
+                'full_name': 'System Administrator',
+                'login_keys': build_login_keys('admin', 'admin@university.edu'),
                 'user_type': 'staff',
                 'privilege_level': 'admin',
                 'profile_image': 'profile.svg',
@@ -65,15 +66,33 @@ def create_default_admin():
             print("Default admin account created successfully!")
             print("Username: admin")
             print("Password: admin123")
-            
+        
+        return admin_exists()
     except Exception as e:
         print(f"Error creating default admin: {str(e)}")
+        return False
+
+DEFAULT_ADMIN_MARKER = 'default_admin_bootstrapped'
+
+def bootstrap_default_admin():
+    """Create the default admin once per database, guarded by a marker in System Settings"""
+    try:
+        if settings_collection.find_one({'_id': DEFAULT_ADMIN_MARKER}):
+            return
+        
+        # Only mark the database once an admin really exists, so a failed first start retries
+        if not create_default_admin():
+            return
+        settings_collection.update_one(
+            {'_id': DEFAULT_ADMIN_MARKER},
+            {'$setOnInsert': {'created_at': datetime.datetime.utcnow()}},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error bootstrapping default admin: {str(e)}")
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
-    # Create default admin on first run
-    create_default_admin()
-    
     form = LoginForm()
     
     if form.validate_on_submit():
@@ -81,14 +100,8 @@ def login():
         password = form.password.data
         remember = form.remember.data
         
-        # Find user by username, email, or student number
-        user = users_collection.find_one({
-            '$or': [
-                {'username': username},
-                {'email': username},
-                {'student_number': username}
-            ]
-        })
+        # Find user by username, email, or student number (one read on the login_keys index)
+        user = find_login_user(username)
         
         if user and check_password_hash(user['password'], password):
             if user['status'] != 'active':
@@ -105,18 +118,13 @@ def login():
             # Store the actual user ID (student_id or staff_id) for profile access
             if user['user_type'] == 'student':
                 session['profile_id'] = str(user['student_id'])
-                # Get student details for session
-                student = students_collection.find_one({'_id': ObjectId(user['student_id'])})
-                if student:
-                    session['full_name'] = f"{student['f_name']} {student['l_name']}"
-                    session['profile_image'] = student.get('profile_image', 'profile.svg')
             else:  # staff
                 session['profile_id'] = str(user['staff_id'])
-                # Get staff details for session
-                staff = staff_collection.find_one({'_id': ObjectId(user['staff_id'])})
-                if staff:
-                    session['full_name'] = f"{staff['f_name']} {staff['l_name']}"
-                    session['profile_image'] = staff.get('profile_image', 'profile.svg')
+            
+            # Display details are denormalised onto the user document
+            if user.get('full_name'):
+                session['full_name'] = user['full_name']
+            session['profile_image'] = user.get('profile_image', 'profile.svg')
             
             # Update last login
             users_collection.update_one(
@@ -167,6 +175,8 @@ def create_default_admin_route():
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('auth.login'))
     
-    create_default_admin()
-    flash('Default admin account created/verified successfully!', 'success')
+    if create_default_admin():
+        flash('Default admin account created/verified successfully!', 'success')
+    else:
+        flash('Could not create the default admin account. Check the server log.', 'error')
     return redirect(url_for('staff.staff_list'))
\ No newline at end of file
@@ -4,6 +4,8 @@ from werkzeug.utils import secure_filename
 import os
 from app import staff_collection, schools_collection, departments_collection, students_collection, users_collection
 from bson import ObjectId
+from app.users import build_login_keys, login_profile_fields
+from app.utils import invalidate_staff_privilege
 import uuid
 from datetime import datetime
 
@@ -120,6 +122,8 @@ def add_staff():
             'staff_id': result.inserted_id,
             'username': username,
             'email': email,
+            'login_keys': build_login_keys(username, email),
+            **login_profile_fields(staff_data),
             'password': generate_password_hash(password),  # Hash password again for users collection
             'user_type': 'staff',
             'privilege_level': privilege_level,
@@ -232,6 +236,8 @@ def update_staff(staff_id):
         user_update_data = {
             'username': username,
             'email': email,
+            'login_keys': build_login_keys(username, email),
+            'full_name': f"{f_name} {l_name}",
             'privilege_level': privilege_level,
             'status': status,
             'updated_at': datetime.utcnow()
@@ -241,10 +247,14 @@ def update_staff(staff_id):
         if new_password and new_password.strip():
             user_update_data['password'] = generate_password_hash(new_password)
         
+        if update_data.get('profile_image'):
+            user_update_data['profile_image'] = update_data['profile_image']
+        
         users_collection.update_one(
             {'staff_id': ObjectId(staff_id)},
             {'$set': user_update_data}
         )
+        invalidate_staff_privilege(staff_id)
         
         flash('Staff member updated successfully!', 'success')
         
@@ -267,6 +277,7 @@ def delete_staff(staff_id):
         if result.deleted_count:
             # Also delete from users collection
             users_collection.delete_one({'staff_id': ObjectId(staff_id)})
+            invalidate_staff_privilege(staff_id)
             flash('Staff member deleted successfully!', 'success')
         else:
             flash('Staff member not found!', 'error')
@@ -295,6 +306,7 @@ def change_role(staff_id):
             {'_id': ObjectId(staff_id)},
             {'$set': update_data}
         )
+        invalidate_staff_privilege(staff_id)
         
         flash('Staff role updated successfully!', 'success')
         
@@ -4,6 +4,10 @@ from werkzeug.utils import secure_filename
 import os
 from app import students_collection, schools_collection, programs_collection, courses_collection, student_courses_collection, grades_collection, mock_grades_collection, users_collection
 from bson import ObjectId
+from app.search import build_search_fields
+from app.users import build_login_keys, login_profile_fields
+from app.catalog import catalog
+from app.enrichment import enrich_courses, enrich_programs
 import uuid
 from datetime import datetime
 import random
@@ -43,8 +47,8 @@ def student_management():
 @bp.route('/student/registration')
 def student_registration():
     """Student registration page"""
-    schools = list(schools_collection.find({'status': 'active'}))
-    programs = list(programs_collection.find({'status': 'active'}))
+    schools = catalog.list('schools', status='active')
+    programs = catalog.list('programs', status='active')
     academic_years = get_academic_years()
     return render_template('users/student/student_registration.html', 
                          schools=schools, 
@@ -57,8 +61,8 @@ def student_list():
     """Student list page"""
     students = list(students_collection.find())
     # Get school and program names for display
-    schools_dict = {str(school['_id']): school['name'] for school in schools_collection.find()}
-    programs_dict = {str(program['_id']): program['name'] for program in programs_collection.find()}
+    schools_dict = {school_id: school['name'] for school_id, school in catalog.by_id('schools').items()}
+    programs_dict = {program_id: program['name'] for program_id, program in catalog.by_id('programs').items()}
     
     return render_template('users/student/student_list.html', 
                          students=students,
@@ -96,27 +100,21 @@ def student_profile(student_id=None):
             {'student_id': ObjectId(student_id)}
         ).sort([('enrolled_at', -1)]).limit(5))
         
+        # Resolve courses, programs and schools for all enrollments at once
+        enrich_courses(enrolled_courses)
+        
         courses_info = []
         for ec in enrolled_courses:
-            try:
-                course = courses_collection.find_one({'_id': ObjectId(ec['course_id'])})
-                if course:
-                    course_program = programs_collection.find_one({'_id': ObjectId(course['program_id'])}) if course.get('program_id') else None
-                    course_school = None
-                    if course_program and course_program.get('school_id'):
-                        course_school = schools_collection.find_one({'_id': ObjectId(course_program['school_id'])})
-                    
-                    courses_info.append({
-                        'course': course,
-                        'semester': ec.get('semester', 'N/A'),
-                        'academic_year': ec.get('academic_year', 'N/A'),
-                        'status': ec.get('status', 'enrolled'),
-                        'program': course_program,
-                        'school': course_school,
-                        'enrolled_at': ec.get('enrolled_at', datetime.utcnow())
-                    })
-            except Exception as e:
-                continue
+            if ec['course']:
+                courses_info.append({
+                    'course': ec['course'],
+                    'semester': ec.get('semester', 'N/A'),
+                    'academic_year': ec.get('academic_year', 'N/A'),
+                    'status': ec.get('status', 'enrolled'),
+                    'program': ec['program'],
+                    'school': ec['school'],
+                    'enrolled_at': ec.get('enrolled_at', datetime.utcnow())
+                })
         
         total_courses_count = student_courses_collection.count_documents({'student_id': ObjectId(student_id)})
         
@@ -151,30 +149,22 @@ def student_courses(student_id):
             {'student_id': ObjectId(student_id)}
         ).sort([('academic_year', -1), ('semester', 1), ('enrolled_at', -1)]))
         
+        # Get course program and school info for display in one batch
+        enrich_courses(enrolled_courses)
+        
         courses_info = []
         
         for ec in enrolled_courses:
-            try:
-                course = courses_collection.find_one({'_id': ObjectId(ec['course_id'])})
-                if course:
-                    # Get course program and school info for display
-                    course_program = programs_collection.find_one({'_id': ObjectId(course['program_id'])}) if course.get('program_id') else None
-                    course_school = None
-                    if course_program and course_program.get('school_id'):
-                        course_school = schools_collection.find_one({'_id': ObjectId(course_program['school_id'])})
-                    
-                    courses_info.append({
-                        'course': course,
-                        'semester': ec.get('semester', 'N/A'),
-                        'academic_year': ec.get('academic_year', 'N/A'),
-                        'status': ec.get('status', 'enrolled'),
-                        'program': course_program,
-                        'school': course_school,
-                        'enrolled_at': ec.get('enrolled_at', datetime.utcnow())
-                    })
-            except Exception as e:
-                print(f"Error processing enrolled course: {str(e)}")
-                continue
+            if ec['course']:
+                courses_info.append({
+                    'course': ec['course'],
+                    'semester': ec.get('semester', 'N/A'),
+                    'academic_year': ec.get('academic_year', 'N/A'),
+                    'status': ec.get('status', 'enrolled'),
+                    'program': ec['program'],
+                    'school': ec['school'],
+                    'enrolled_at': ec.get('enrolled_at', datetime.utcnow())
+                })
         
         # Group courses by academic year and semester
         courses_by_semester = {}
@@ -291,6 +281,8 @@ def add_student():
             } if nok_name else None
         }
 
+        student_data.update(build_search_fields(student_data))
+        
         # Insert into database
         result = students_collection.insert_one(student_data)
         flash(f'Student registered successfully! Auto-generated password: {password}', 'success')
@@ -300,6 +292,8 @@ def add_student():
             'student_id': result.inserted_id,
             'student_number': student_number,
             'email': email,
+            'login_keys': build_login_keys(student_number, email),
+            **login_profile_fields(student_data),
             'password': generate_password_hash(password),
             'user_type': 'student',
             'privilege_level': 'student',
@@ -426,6 +420,9 @@ def update_student(student_id):
         # Update password only if provided
         if password and password.strip():
             update_data['password'] = generate_password_hash(password)
+        
+        # Keep the indexed search keys in step with the name/number/email
+        update_data.update(build_search_fields(update_data))
 
         # Handle profile image update (existing code)
         if 'profile_image' in request.files:
@@ -445,11 +442,16 @@ def update_student(student_id):
             {'$set': update_data}
         )
 
-        # Also update the users collection if email or password changed
+        # Also update the users collection so login keys and display details stay in sync
         user_update_data = {
             'email': email,
+            'student_number': student_number,
+            'login_keys': build_login_keys(student_number, email),
+            'full_name': f"{f_name} {l_name}",
             'updated_at': datetime.utcnow()
         }
+        if update_data.get('profile_image'):
+            user_update_data['profile_image'] = update_data['profile_image']
         
         if password and password.strip():
             user_update_data['password'] = generate_password_hash(password)
@@ -510,12 +512,12 @@ def course_registration(student_id):
         }))
         
         # Enhance courses with program and school information
+        enrich_programs(available_courses)
+        
         enhanced_courses = []
         for course in available_courses:
-            course_program = programs_collection.find_one({'_id': ObjectId(course['program_id'])}) if course.get('program_id') else None
-            course_school = None
-            if course_program and course_program.get('school_id'):
-                course_school = schools_collection.find_one({'_id': ObjectId(course_program['school_id'])})
+            course_program = course.pop('program')
+            course_school = course.pop('school')
             
             enhanced_course = course.copy()
             enhanced_course['program_name'] = course_program['name'] if course_program else 'Unknown Program'
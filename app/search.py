@@ -0,0 +1,104 @@
+from pymongo import UpdateOne
+import re
+import unicodedata
+
+# Indexed student search. Each student document carries:
+#   search_terms - normalised whole tokens of the student number, names and email
+#   search_keys  - every prefix of those tokens, and every fragment of the student
+#                  number's tokens so '017' still finds 2024017 (multikey-indexed)
+# A search term is split the same way and matched with $all on search_keys, so each
+# keystroke is an index lookup instead of an unanchored case-insensitive $regex scan,
+# and user input never reaches the regex engine. The collection is imported inside the
+# functions that query it, so scripts can load the key and pipeline builders without
+# importing (and connecting) the app.
+
+MAX_PREFIX_LENGTH = 15
+DEFAULT_PAGE_SIZE = 50
+SEARCH_SORT = {'_search_rank': -1, 'l_name': 1, 'f_name': 1, '_id': 1}
+# Fields whose tokens are also searchable from the middle, not just as prefixes
+FRAGMENT_FIELDS = ('student_number',)
+
+def normalise_text(value):
+    """Lowercase and strip accents so 'Chómba' and 'chomba' compare equal"""
+    if not value:
+        return ''
+    folded = unicodedata.normalize('NFKD', str(value))
+    return ''.join(c for c in folded if not unicodedata.combining(c)).lower()
+
+def tokenize(value):
+    """Split text into normalised alphanumeric tokens"""
+    return [token for token in re.split(r'[^0-9a-z]+', normalise_text(value)) if token]
+
+def build_search_fields(student):
+    """search_terms/search_keys for a student document (or the fields about to be written to one)"""
+    terms = []
+    keys = set()
+    for field in ('student_number', 'f_name', 'l_name', 'email'):
+        for token in tokenize(student.get(field)):
+            if token not in terms:
+                terms.append(token)
+            starts = range(len(token)) if field in FRAGMENT_FIELDS else (0,)
+            for start in starts:
+                for length in range(1, min(len(token) - start, MAX_PREFIX_LENGTH) + 1):
+                    keys.add(token[start:start + length])
+
+    return {'search_terms': terms, 'search_keys': sorted(keys)}
+
+def search_filter(term, prefix=''):
+    """Filter matching students whose search keys cover every token of the search term.
+
+    prefix allows the filter to be applied to a joined document, e.g. 'student_info.'.
+    """
+    tokens = [token[:MAX_PREFIX_LENGTH] for token in tokenize(term)]
+    if not tokens:
+        return {}
+    return {f'{prefix}search_keys': {'$all': tokens}}
+
+def search_stages(term, query=None):
+    """$match/$addFields stages selecting students for a search term and scoring them as _search_rank"""
+    match = dict(query or {})
+    match.update(search_filter(term))
+    tokens = tokenize(term)
+    return [
+        {'$match': match},
+        {'$addFields': {'_search_rank': {'$size': {'$setIntersection': [{'$ifNull': ['$search_terms', []]}, tokens]}}}}
+    ]
+
+def search_pipeline(term, query=None, page=1, per_page=DEFAULT_PAGE_SIZE, sort=None):
+    """The aggregation search_students runs: match, rank, sort, then one page (plus one row to detect more)"""
+    page = max(int(page or 1), 1)
+    return search_stages(term, query) + [
+        {'$sort': sort or SEARCH_SORT},
+        {'$skip': (page - 1) * per_page},
+        {'$limit': per_page + 1},
+        {'$project': {'_search_rank': 0, 'search_keys': 0, 'search_terms': 0}}
+    ]
+
+def search_students(term, query=None, page=1, per_page=DEFAULT_PAGE_SIZE, sort=None):
+    """Ranked, paginated student search.
+
+    Students matching more of the search tokens exactly (e.g. a full student number)
+    rank first, then results are ordered by name. Returns (students, has_more).
+    """
+    from app import students_collection
+
+    students = list(students_collection.aggregate(search_pipeline(term, query, page, per_page, sort)))
+    return students[:per_page], len(students) > per_page
+
+def rebuild_search_keys(batch_size=1000):
+    """Recompute search fields for every student; returns the number updated"""
+    from app import students_collection
+
+    updated = 0
+    operations = []
+    projection = {'student_number': 1, 'f_name': 1, 'l_name': 1, 'email': 1}
+    for student in students_collection.find({}, projection):
+        operations.append(UpdateOne({'_id': student['_id']}, {'$set': build_search_fields(student)}))
+        if len(operations) >= batch_size:
+            students_collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        students_collection.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    return updated
@@ -0,0 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+# Helpers shared by the materialised statistics (CA stats, academic standing, result
+# analytics).
+
+def median(values):
+    """Median of a list of numbers, or None if it is empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+def process_map(function, items, processes=None):
+    """list(map(function, items)) across worker processes, for full rebuilds.
+
+    function must be a module-level function: spawned workers import the app afresh and
+    open their own database connection rather than inheriting the parent's client.
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        return list(executor.map(function, items))
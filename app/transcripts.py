@@ -0,0 +1,139 @@
+from app import grades_collection, mock_grades_collection, courses_collection, transcript_versions_collection
+from app.config import SystemConfig
+from app.grading import calculate_gpa
+from bson import ObjectId
+from collections import OrderedDict
+from pymongo import UpdateOne
+import threading
+import time
+
+# Transcript read model. A student's final and mock results are assembled by one
+# aggregation ($unionWith over both grade collections, $lookup for course details) into
+# a list of semesters, each holding course code/name/credits, marks, grade, remarks and
+# the semester GPA. Transcripts are cached per student in each process (least recently
+# used evicted first). Writing grades bumps a version in `Transcript Versions` - the
+# student's own document, or the ALL_STUDENTS document for writes that touch everyone -
+# and every request reads both with one _id query, so a write in one worker process is
+# seen by all the others straight away. A transcript request is that query plus, on a
+# miss, one aggregation. Cached transcripts are shared - treat them as read-only.
+
+ALL_STUDENTS = 'all'
+
+_transcript_cache = OrderedDict()
+_transcript_lock = threading.Lock()
+
+def _transcript_pipeline(student_id):
+    return [
+        {'$match': {'student_id': student_id}},
+        {'$addFields': {'exam_type': 'final'}},
+        {'$unionWith': {
+            'coll': mock_grades_collection.name,
+            'pipeline': [
+                {'$match': {'student_id': student_id}},
+                {'$addFields': {'exam_type': 'mock'}}
+            ]
+        }},
+        {'$unwind': {'path': '$grades', 'includeArrayIndex': 'position', 'preserveNullAndEmptyArrays': True}},
+        {'$lookup': {
+            'from': courses_collection.name,
+            'let': {'course_id': {'$convert': {'input': '$grades.course_id', 'to': 'objectId', 'onError': None, 'onNull': None}}},
+            'pipeline': [
+                {'$match': {'$expr': {'$eq': ['$_id', '$$course_id']}}},
+                {'$project': {'code': 1, 'name': 1, 'credits': 1}}
+            ],
+            'as': 'course'
+        }},
+        {'$sort': {'position': 1}},
+        {'$group': {
+            '_id': {'exam_type': '$exam_type', 'academic_year': '$academic_year', 'semester': '$semester'},
+            'entered_at': {'$first': '$entered_at'},
+            'courses': {'$push': {
+                'course_id': '$grades.course_id',
+                'course': {'$first': '$course'},
+                'marks': '$grades.marks',
+                'grade': '$grades.grade',
+                'remarks': '$grades.remarks'
+            }}
+        }},
+        {'$sort': {'_id.academic_year': -1, '_id.semester': -1, '_id.exam_type': 1}}
+    ]
+
+def build_transcript(student_id):
+    """Assemble a student's final and mock results with one aggregation"""
+    return transcript_from_rows(grades_collection.aggregate(_transcript_pipeline(ObjectId(student_id))))
+
+def transcript_from_rows(rows):
+    """Shape the transcript aggregation's per-semester rows into the transcript read model"""
+    semesters = []
+    for row in rows:
+        grades = []
+        for entry in row['courses']:
+            course = entry.get('course')
+            if not course:
+                # Entries for deleted courses (or documents with no grades) are left out
+                continue
+            grades.append({
+                'course_id': str(entry['course_id']),
+                'course_code': course.get('code'),
+                'course_name': course.get('name'),
+                'credits': course.get('credits') or 0,
+                'marks': entry.get('marks'),
+                'grade': entry.get('grade'),
+                'remarks': entry.get('remarks')
+            })
+        semesters.append({
+            'exam_type': row['_id']['exam_type'],
+            'academic_year': row['_id']['academic_year'],
+            'semester': row['_id']['semester'],
+            'entered_at': row.get('entered_at'),
+            'grades': grades,
+            'credits': sum(grade['credits'] for grade in grades),
+            'gpa': calculate_gpa(grades)
+        })
+    return semesters
+
+def _stored_version(student_id):
+    """(all-students version, student's version) from one _id query"""
+    versions = {
+        row['_id']: row.get('version', 0)
+        for row in transcript_versions_collection.find({'_id': {'$in': [ALL_STUDENTS, student_id]}})
+    }
+    return versions.get(ALL_STUDENTS, 0), versions.get(student_id, 0)
+
+def get_transcript(student_id):
+    """A student's transcript from the cache, building it on a miss or when another process has written grades"""
+    student_id = str(student_id)
+    now = time.monotonic()
+    # Read before building, so grades written during the build leave the entry stale
+    version = _stored_version(student_id)
+    with _transcript_lock:
+        cached = _transcript_cache.get(student_id)
+        if cached and cached[1] > now and cached[2] == version:
+            _transcript_cache.move_to_end(student_id)
+            return cached[0]
+
+    transcript = build_transcript(student_id)
+    with _transcript_lock:
+        _transcript_cache[student_id] = (transcript, now + SystemConfig.TRANSCRIPT_CACHE_TTL, version)
+        _transcript_cache.move_to_end(student_id)
+        while len(_transcript_cache) > SystemConfig.TRANSCRIPT_CACHE_SIZE:
+            # Drop the least recently used entry
+            _transcript_cache.popitem(last=False)
+    return transcript
+
+def invalidate_transcripts(*student_ids):
+    """Forget cached transcripts after grades are written (every student's if none are given), in every process"""
+    with _transcript_lock:
+        if not student_ids:
+            _transcript_cache.clear()
+        for student_id in student_ids:
+            _transcript_cache.pop(str(student_id), None)
+
+    try:
+        transcript_versions_collection.bulk_write([
+            UpdateOne({'_id': key}, {'$inc': {'version': 1}}, upsert=True)
+            for key in (set(map(str, student_ids)) or {ALL_STUDENTS})
+        ], ordered=False)
+    except Exception as e:
+        # Other processes then pick the change up when their entries expire (TRANSCRIPT_CACHE_TTL)
+        print(f"Error recording transcript invalidation: {str(e)}")
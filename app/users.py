@@ -0,0 +1,141 @@
+from app import users_collection, students_collection, staff_collection, settings_collection
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+
+# Login identity helpers. Every users_collection document carries a normalised
+# `login_keys` array (username, email and/or student number) backed by a unique multikey
+# index, plus the display name and profile image of the person it belongs to, so a login
+# is a single indexed read. Until a full migrate-login-keys run has recorded
+# LOGIN_KEYS_MIGRATED in System Settings, a miss falls back to the old username / email /
+# student number lookup for accounts created before login_keys existed.
+
+LOGIN_KEYS_MIGRATED = 'login_keys_migrated'
+
+_login_keys_migrated = False
+
+def login_keys_migrated():
+    """Whether every account has login_keys; remembered once true, since it never becomes false again"""
+    global _login_keys_migrated
+    if not _login_keys_migrated:
+        _login_keys_migrated = settings_collection.find_one({'_id': LOGIN_KEYS_MIGRATED}) is not None
+    return _login_keys_migrated
+
+def normalise_login_key(value):
+    """Lowercase, trimmed form of a login identifier"""
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+def build_login_keys(*identifiers):
+    """Normalised, de-duplicated login keys for the given identifiers"""
+    keys = []
+    for identifier in identifiers:
+        key = normalise_login_key(identifier)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def login_profile_fields(person):
+    """Display fields copied from a student/staff document onto its user document"""
+    return {
+        'full_name': f"{person.get('f_name', '')} {person.get('l_name', '')}".strip(),
+        'profile_image': person.get('profile_image', 'profile.svg')
+    }
+
+def find_login_user(identifier):
+    """Find a user by username, email or student number with one indexed read"""
+    key = normalise_login_key(identifier)
+    if not key:
+        return None
+
+    user = users_collection.find_one({'login_keys': key})
+    if user or login_keys_migrated():
+        return user
+
+    # Accounts created before login_keys existed - find them the old way and backfill
+    user = users_collection.find_one({
+        '$or': [
+            {'username': identifier},
+            {'email': identifier},
+            {'student_number': identifier}
+        ]
+    })
+    if user:
+        migrate_login_keys({'_id': user['_id']})
+        user = users_collection.find_one({'_id': user['_id']})
+    return user
+
+def migrate_login_keys(query=None, batch_size=500):
+    """Populate login_keys and denormalised profile fields on existing users.
+
+    Returns {'updated', 'collisions'}. An account whose keys are already taken by another
+    account (identifiers differing only by case) is skipped and listed in collisions as
+    {'_id', 'login_keys'}; it stays reachable through find_login_user's fallback. A full
+    run (no query) with no collisions records LOGIN_KEYS_MIGRATED, which turns that
+    unindexed fallback off.
+    """
+    report = {'updated': 0, 'collisions': []}
+    batch = []
+
+    def flush(batch):
+        student_ids = [u['student_id'] for u in batch if u.get('student_id')]
+        staff_ids = [u['staff_id'] for u in batch if u.get('staff_id')]
+        people = {}
+        if student_ids:
+            people.update({s['_id']: s for s in students_collection.find(
+                {'_id': {'$in': student_ids}}, {'f_name': 1, 'l_name': 1, 'profile_image': 1})})
+        if staff_ids:
+            people.update({s['_id']: s for s in staff_collection.find(
+                {'_id': {'$in': staff_ids}}, {'f_name': 1, 'l_name': 1, 'profile_image': 1})})
+
+        keys = {user['_id']: build_login_keys(user.get('username'), user.get('email'), user.get('student_number'))
+                for user in batch}
+        # Who already holds each key, from one indexed query; the first account to claim a key keeps it
+        owners = {}
+        for holder in users_collection.find(
+            {'login_keys': {'$in': [key for user_keys in keys.values() for key in user_keys]}}, {'login_keys': 1}
+        ):
+            for key in holder['login_keys']:
+                owners.setdefault(key, holder['_id'])
+
+        operations = []
+        claimed = []
+        for user in batch:
+            user_keys = keys[user['_id']]
+            if any(owners.get(key, user['_id']) != user['_id'] for key in user_keys):
+                report['collisions'].append({'_id': user['_id'], 'login_keys': user_keys})
+                continue
+            owners.update(dict.fromkeys(user_keys, user['_id']))
+            update = {'login_keys': user_keys}
+            person = people.get(user.get('student_id') or user.get('staff_id'))
+            if person:
+                update.update(login_profile_fields(person))
+            elif user.get('f_name'):
+                update.update(login_profile_fields(user))
+            operations.append(UpdateOne({'_id': user['_id']}, {'$set': update}))
+            claimed.append({'_id': user['_id'], 'login_keys': user_keys})
+        if not operations:
+            return
+        try:
+            report['updated'] += users_collection.bulk_write(operations, ordered=False).matched_count
+        except BulkWriteError as e:
+            # A key claimed by an account written since the owners query above
+            report['updated'] += e.details.get('nMatched', 0)
+            for error in e.details['writeErrors']:
+                if error.get('code') != 11000:
+                    raise
+                report['collisions'].append(claimed[error['index']])
+
+    for user in users_collection.find(query or {}):
+        batch.append(user)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    if report['collisions']:
+        print(f"Login keys already taken, accounts left on the fallback lookup: {report['collisions']}")
+    elif query is None:
+        settings_collection.update_one(
+            {'_id': LOGIN_KEYS_MIGRATED}, {'$set': {'updated_at': datetime.utcnow()}}, upsert=True
+        )
+    return report
@@ -1,135 +1,158 @@
-from flask import session
-from app import students_collection, programs_collection, courses_collection, student_courses_collection, accounts_collection, staff_collection
+from flask import session, g, has_app_context
+from app import students_collection, student_courses_collection, staff_collection
 from bson import ObjectId
 from app.config import SystemConfig
-from datetime import datetime
+from app import ledger
+from app.catalog import catalog
+import threading
+import time
 
-def get_semester_fees(student_id, semester, academic_year):
-    """Calculate total semester fees for a student"""
-    try:
-        student = students_collection.find_one({'_id': ObjectId(student_id)})
+# Map program level to fee category
+LEVEL_FEE_CATEGORIES = {
+    'certificate': 'certificate',
+    'diploma': 'diploma',
+    'undergraduate': 'undergraduate',
+    'bachelor': 'undergraduate',
+    'postgraduate': 'postgraduate',
+    'masters': 'postgraduate',
+    'phd': 'postgraduate'
+}
+
+def get_base_semester_fee(program):
+    """Base semester fee for a program document, by its level"""
+    level = program.get('level', 'undergraduate').lower() if program else 'undergraduate'
+    fee_category = LEVEL_FEE_CATEGORIES.get(level, 'undergraduate')
+    return SystemConfig.DEFAULT_SEMESTER_FEES.get(fee_category, 1000.00)
+
+def get_semester_fee_statuses(student, semesters=()):
+    """Fees, payments, balance and grade-view eligibility for every semester of a student at once.
+
+    Covers each semester the student is enrolled in or has transactions for, plus any
+    (academic_year, semester) pairs passed in. Costs one enrollment aggregation and one
+    balance-summary read; programs and course fees come from the catalog cache.
+    Returns {(academic_year, semester): {...}}.
+    """
+    if not isinstance(student, dict):
+        student = students_collection.find_one({'_id': ObjectId(student)}, {'program_id': 1})
         if not student:
-            return 0
-        
-        # Get student's program level
-        program = programs_collection.find_one({'_id': ObjectId(student['program_id'])})
-        level = program.get('level', 'undergraduate').lower() if program else 'undergraduate'
-        
-        # Map level to fee category
-        level_mapping = {
-            'certificate': 'certificate',
-            'diploma': 'diploma', 
-            'undergraduate': 'undergraduate',
-            'bachelor': 'undergraduate',
-            'postgraduate': 'postgraduate',
-            'masters': 'postgraduate',
-            'phd': 'postgraduate'
+            return {}
+    student_id = student['_id']
+    
+    base_fee = get_base_semester_fee(catalog.get('programs', student.get('program_id')))
+    courses = catalog.by_id('courses')
+    
+    # Enrolled course ids grouped per semester
+    enrolled = {
+        (row['_id']['academic_year'], row['_id']['semester']): row['course_ids']
+        for row in student_courses_collection.aggregate([
+            {'$match': {'student_id': student_id}},
+            {
+                '$group': {
+                    '_id': {'academic_year': '$academic_year', 'semester': '$semester'},
+                    'course_ids': {'$push': '$course_id'}
+                }
+            }
+        ])
+    }
+    balances = ledger.get_semester_summaries(student_id)
+    
+    statuses = {}
+    for key in set(enrolled) | set(balances) | {tuple(s) for s in semesters}:
+        course_fees = sum(
+            (courses.get(str(course_id)) or {}).get('course_fee', 0) or 0
+            for course_id in enrolled.get(key, [])
+        )
+        total_fees = base_fee + course_fees
+        summary = balances.get(key, {})
+        current_balance = summary.get('balance', 0)
+        amount_paid = total_fees - current_balance
+        paid_percentage = (amount_paid / total_fees * 100) if total_fees > 0 else 100
+        
+        statuses[key] = {
+            'total_fees': total_fees,
+            'payments': summary.get('total_clearing', 0),
+            'current_balance': current_balance,
+            'amount_paid': amount_paid,
+            'paid_percentage': paid_percentage,
+            'can_view': total_fees <= 0 or paid_percentage >= SystemConfig.BALANCE_THRESHOLD_PERCENTAGE
         }
-        
-        fee_category = level_mapping.get(level, 'undergraduate')
-        base_fee = SystemConfig.DEFAULT_SEMESTER_FEES.get(fee_category, 1000.00)
-        
-        # Get additional course fees for the semester
-        enrolled_courses = list(student_courses_collection.find({
-            'student_id': ObjectId(student_id),
-            'semester': semester,
-            'academic_year': academic_year
-        }))
-        
-        course_fees = 0
-        for ec in enrolled_courses:
-            course = courses_collection.find_one({'_id': ObjectId(ec['course_id'])})
-            if course and course.get('course_fee'):
-                course_fees += course.get('course_fee', 0)
-        
-        return base_fee + course_fees
-        
-    except Exception as e:
-        print(f"Error calculating semester fees: {str(e)}")
-        return SystemConfig.DEFAULT_SEMESTER_FEES['undergraduate']
+    return statuses
 
-def get_semester_balance(student_id, semester, academic_year):
-    """Calculate balance for a specific semester"""
-    try:
-        # Get all transactions for the semester
-        transactions = list(accounts_collection.find({
-            'student_id': ObjectId(student_id),
-            'semester': semester,
-            'academic_year': academic_year
-        }).sort('created_at', 1))
-        
-        balance = 0
-        for transaction in transactions:
-            if transaction['type'] == 'Billing':
-                balance += transaction.get('debit', 0)
-            else:  # Clearing
-                balance -= transaction.get('credit', 0)
-        
-        print(f"Semester balance for {student_id}, {academic_year} Sem {semester}: {balance}")
-        return balance
-        
-    except Exception as e:
-        print(f"Error calculating semester balance: {str(e)}")
-        return 0
+def get_viewable_semesters(student_id, semesters):
+    """Decide grade visibility for many (academic_year, semester) pairs in one pass.
 
-def can_view_semester_grades(student_id, semester, academic_year, staff_id=None):
-    """Check if student or staff can view grades for a semester"""
+    The staff privilege is resolved once for the whole batch and fees/balances for all
+    semesters come from get_semester_fee_statuses; returns
+    {'<academic_year>_semester_<semester>': bool}.
+    """
+    semesters = {(academic_year, semester) for academic_year, semester in semesters}
+    if not semesters:
+        return {}
+    
+    if has_staff_privilege():
+        return {f"{academic_year}_semester_{semester}": True for academic_year, semester in semesters}
+    
     try:
-        # First check if current user has staff privileges (highest priority)
-        if has_staff_privilege():
-            print(f"Staff override: allowing grade view for {student_id}, {academic_year} Sem {semester}")
-            return True
-        
-        # If specific staff_id is provided and staff has privilege, allow access
-        if staff_id:
-            staff = staff_collection.find_one({'_id': ObjectId(staff_id)})
-            if staff and staff.get('privilege_level') in SystemConfig.GRADE_VIEW_PRIVILEGES:
-                print(f"Staff {staff_id} has privilege to view grades")
-                return True
-        
-        # Regular student balance check
-        semester_balance = get_semester_balance(student_id, semester, academic_year)
-        semester_fees = get_semester_fees(student_id, semester, academic_year)
-        
-        print(f"Checking grade view permission for {student_id}, {academic_year} Sem {semester}")
-        print(f"Semester fees: {semester_fees}, Semester balance: {semester_balance}")
-        
-        if semester_fees <= 0:
-            print("No fees configured, allowing access")
-            return True  # No fees configured, allow access
-        
-        amount_paid = semester_fees - semester_balance
-        paid_percentage = (amount_paid / semester_fees) * 100 if semester_fees > 0 else 100
-        
-        can_view = paid_percentage >= SystemConfig.BALANCE_THRESHOLD_PERCENTAGE
-        
-        print(f"Amount paid: {amount_paid}, Paid %: {paid_percentage:.2f}%, Threshold: {SystemConfig.BALANCE_THRESHOLD_PERCENTAGE}%, Can view: {can_view}")
-        
-        return can_view
-        
+        statuses = get_semester_fee_statuses(student_id, semesters)
     except Exception as e:
         print(f"Error checking grade view permission: {str(e)}")
-        return False
+        statuses = {}
+    
+    return {
+        f"{academic_year}_semester_{semester}": statuses.get((academic_year, semester), {}).get('can_view', False)
+        for academic_year, semester in semesters
+    }
+
+# Staff privilege levels cached per process for a short TTL, and per request in flask.g
+_staff_privilege_cache = {}
+_staff_privilege_lock = threading.Lock()
 
 def get_staff_privilege_level(staff_id):
-    """Get staff privilege level"""
-    try:
-        staff = staff_collection.find_one({'_id': ObjectId(staff_id)})
-        return staff.get('privilege_level') if staff else None
-    except Exception as e:
-        print(f"Error getting staff privilege: {str(e)}")
+    """Get staff privilege level, resolving it at most once per request"""
+    if not staff_id:
         return None
+    staff_id = str(staff_id)
+    
+    request_cache = None
+    if has_app_context():
+        request_cache = g.setdefault('staff_privileges', {})
+        if staff_id in request_cache:
+            return request_cache[staff_id]
+    
+    now = time.monotonic()
+    with _staff_privilege_lock:
+        cached = _staff_privilege_cache.get(staff_id)
+    if cached and cached[1] > now:
+        privilege_level = cached[0]
+    else:
+        try:
+            staff = staff_collection.find_one({'_id': ObjectId(staff_id)}, {'privilege_level': 1})
+            privilege_level = staff.get('privilege_level') if staff else None
+        except Exception as e:
+            print(f"Error getting staff privilege: {str(e)}")
+            return None
+        with _staff_privilege_lock:
+            _staff_privilege_cache[staff_id] = (privilege_level, now + SystemConfig.STAFF_PRIVILEGE_CACHE_TTL)
+    
+    if request_cache is not None:
+        request_cache[staff_id] = privilege_level
+    return privilege_level
+
+def invalidate_staff_privilege(staff_id):
+    """Forget a cached privilege level after the staff member's role changes"""
+    with _staff_privilege_lock:
+        _staff_privilege_cache.pop(str(staff_id), None)
+    if has_app_context():
+        g.setdefault('staff_privileges', {}).pop(str(staff_id), None)
 
 def has_staff_privilege():
     """Check if current user has staff viewing privileges"""
     try:
         if session.get('staff_id'):
-            staff = staff_collection.find_one({'_id': ObjectId(session['staff_id'])})
-            if staff and staff.get('privilege_level') in SystemConfig.GRADE_VIEW_PRIVILEGES:
-                print(f"Staff {session['staff_id']} has privilege level: {staff.get('privilege_level')}")
+            privilege_level = get_staff_privilege_level(session['staff_id'])
+            if privilege_level in SystemConfig.GRADE_VIEW_PRIVILEGES:
                 return True
-        print(f"No staff privilege - staff_id: {session.get('staff_id')}")
         return False
     except Exception as e:
         print(f"Error checking staff privilege: {str(e)}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,81 @@
+"""Compare per-student billing with the batch billing engine (run_billing_batch).
+
+Seeds a scratch database with students, then bills the same students with a fixed
+amount both ways and prints the time and server round trips of each:
+
+  per-student  the loop create_transaction ran before the batch engine: find_one the
+               student, scan their whole ledger for the balance, insert_one
+  batch        run_billing_batch: one $in read of the students, one read of the
+               balance summaries, one ordered insert_many and the summary updates
+
+    MONGO_URI=mongodb://localhost:27017 python scripts/benchmark_billing.py --sizes 1000 10000 50000
+"""
+import argparse
+from datetime import datetime
+
+from bson import ObjectId
+
+from benchmark_common import load_app, drop_scratch_database, measure
+
+app = load_app('Uniberg_billing_benchmark')
+
+from app.billing import run_billing_batch  # noqa: E402
+from app.ledger import rebuild_student_balances  # noqa: E402
+
+AMOUNT = 1500
+
+def seed(count, history=3):
+    """count students, each with a few earlier ledger entries so balance lookups have something to read"""
+    app.students_collection.delete_many({})
+    student_ids = app.students_collection.insert_many(
+        [{'student_number': f'2025{n:06d}', 'f_name': f'S{n}'} for n in range(count)]
+    ).inserted_ids
+    app.accounts_collection.delete_many({})
+    app.accounts_collection.insert_many([
+        {'student_id': student_id, 'type': 'Billing', 'debit': 100, 'credit': 0, 'created_at': datetime(2024, 1, n + 1)}
+        for student_id in student_ids for n in range(history)
+    ])
+    rebuild_student_balances(student_ids)
+    return [str(student_id) for student_id in student_ids]
+
+def _transaction(student_id, current_balance):
+    return {
+        'student_id': student_id, 'type': 'Billing', 'description': 'Benchmark', 'debit': AMOUNT, 'credit': 0,
+        'balance_after': current_balance + AMOUNT, 'created_at': datetime.utcnow(), 'created_by': 'benchmark'
+    }
+
+def remove_benchmark_transactions():
+    """Each engine bills the same students against the same seeded history"""
+    app.accounts_collection.delete_many({'created_by': 'benchmark'})
+
+def bill_per_student(student_ids):
+    """The pre-batch create_transaction loop"""
+    for student_id in student_ids:
+        student = app.students_collection.find_one({'_id': ObjectId(student_id)})
+        if not student:
+            continue
+        balance = 0
+        for transaction in app.accounts_collection.find({'student_id': ObjectId(student_id)}).sort('created_at', 1):
+            balance += transaction.get('debit', 0) if transaction['type'] == 'Billing' else -transaction.get('credit', 0)
+        app.accounts_collection.insert_one(_transaction(student['_id'], balance))
+
+def bill_batch(student_ids):
+    run_billing_batch(student_ids, lambda student, amount, balance: _transaction(student['_id'], balance))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    try:
+        print(f"{'students':>9} {'engine':<12} {'ms':>10} {'round trips':>12}")
+        for size in args.sizes:
+            student_ids = seed(size)
+            for name, run in (('per-student', bill_per_student), ('batch', bill_batch)):
+                ms, commands = measure(lambda: run(student_ids), setup=remove_benchmark_transactions)
+                print(f'{size:>9} {name:<12} {ms:>10.0f} {commands:>12}')
+    finally:
+        drop_scratch_database(app)
+
+if __name__ == '__main__':
+    main()
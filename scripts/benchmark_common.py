@@ -0,0 +1,63 @@
+"""Shared setup for the benchmarks that run app code against a scratch database.
+
+Importing the app package connects to MONGO_URI / MONGO_DB, builds indexes and
+bootstraps the default admin, so these benchmarks set MONGO_DB to a scratch database
+(refusing any name that does not end in _benchmark) before importing it, and drop that
+database when they finish. Round trips are counted with a pymongo command listener, so
+they are the commands the server actually received.
+"""
+import os
+import statistics
+import sys
+import time
+
+from pymongo import monitoring
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH_SUFFIX = '_benchmark'
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands sent to the server (handshakes and heartbeats excluded)"""
+    IGNORED = {'hello', 'ismaster', 'isMaster', 'endSessions', 'ping'}
+
+    def __init__(self):
+        self.commands = 0
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            self.commands += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+counter = CommandCounter()
+
+def load_app(default_database):
+    """Register the command counter and import the app against a scratch database"""
+    database = os.environ.setdefault('MONGO_DB', default_database)
+    if not database.endswith(SCRATCH_SUFFIX):
+        sys.exit(f"Refusing to benchmark against MONGO_DB={database!r}: it is dropped afterwards and must end in {SCRATCH_SUFFIX}")
+    monitoring.register(counter)
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+def drop_scratch_database(app):
+    app.client.drop_database(app.db.name)
+
+def measure(run, runs=1, setup=None):
+    """Median milliseconds and commands per run of run(); setup() runs untimed before each"""
+    timings = []
+    commands = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        before = counter.commands
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+        commands.append(counter.commands - before)
+    return statistics.median(timings), statistics.median(commands)
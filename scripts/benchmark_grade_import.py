@@ -0,0 +1,64 @@
+"""Time the streaming CSV grade import at several batch sizes.
+
+Seeds a scratch database with students and courses, generates a grades CSV (100k rows
+by default) and imports it with each batch size into an empty grades collection,
+printing the time, rows per second and server round trips of each run. The one-row
+batch stands in for writing each row as it is read; larger batches show how the
+round trips fall with IMPORT_BATCH_SIZE. Standing and result-analytics refreshes
+after the import are included in the totals.
+
+    MONGO_URI=mongodb://localhost:27017 python scripts/benchmark_grade_import.py --rows 100000 --batch-sizes 1 100 1000 5000
+"""
+import argparse
+import io
+
+from benchmark_common import load_app, drop_scratch_database, measure
+
+app = load_app('Uniberg_import_benchmark')
+
+from app.catalog import catalog  # noqa: E402
+from app.grade_import import import_grades_csv  # noqa: E402
+
+COURSES_PER_STUDENT = 5
+
+def seed(rows):
+    students = rows // COURSES_PER_STUDENT
+    app.courses_collection.insert_many(
+        [{'code': f'BEN{n:03d}', 'name': f'Benchmark {n}', 'credits': 3} for n in range(COURSES_PER_STUDENT)]
+    )
+    app.students_collection.insert_many([{'student_number': f'2025{n:06d}'} for n in range(students)])
+    catalog.invalidate()
+
+    lines = ['student_number,course_code,marks']
+    for n in range(students):
+        for course in range(COURSES_PER_STUDENT):
+            lines.append(f'2025{n:06d},BEN{course:03d},{(n * 7 + course) % 101}')
+    return '\n'.join(lines).encode('utf-8')
+
+def clear_grades():
+    for collection in (app.grades_collection, app.standing_collection, app.analytics_collection):
+        collection.delete_many({})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 1000, 5000])
+    args = parser.parse_args()
+
+    try:
+        print(f'Seeding {args.rows // COURSES_PER_STUDENT} students and a {args.rows}-row CSV...')
+        data = seed(args.rows)
+        print(f"{'batch':>6} {'ms':>10} {'rows/s':>10} {'round trips':>12} {'documents':>10}")
+        for batch_size in args.batch_sizes:
+            reports = []
+            ms, commands = measure(
+                lambda: reports.append(import_grades_csv(io.BytesIO(data), 'final', '2025/2026', '1', batch_size=batch_size)),
+                setup=clear_grades
+            )
+            report = reports[-1]
+            print(f"{batch_size:>6} {ms:>10.0f} {report['imported'] / ms * 1000:>10.0f} {commands:>12} {report['documents']:>10}")
+    finally:
+        drop_scratch_database(app)
+
+if __name__ == '__main__':
+    main()
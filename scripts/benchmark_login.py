@@ -0,0 +1,97 @@
+"""Compare the old login path with the current one (marker-guarded bootstrap, login_keys).
+
+Seeds a scratch database with student accounts and signs the same users in both ways,
+printing logins per second and server round trips per login, then what explain()
+reports for the two user lookups:
+
+  before  what /login did per request before: create_default_admin's admin find_one,
+          the $or lookup over username / email / student_number, a students_collection
+          read for the display name, and the last_login update
+  after   find_login_user (one read on login_keys) and the last_login update; the
+          admin bootstrap runs once at startup and no longer touches /login
+
+Passwords are hashed with a cheap pbkdf2 setting so the database work, not the hash, is
+what differs between the two.
+
+    MONGO_URI=mongodb://localhost:27017 python scripts/benchmark_login.py --users 50000 --logins 2000
+"""
+import argparse
+import random
+from datetime import datetime
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from benchmark_common import load_app, drop_scratch_database, measure
+
+app = load_app('Uniberg_login_benchmark')
+
+from app.users import build_login_keys, find_login_user  # noqa: E402
+
+PASSWORD = 'benchmark'
+
+def seed(count):
+    password = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    student_ids = app.students_collection.insert_many(
+        [{'f_name': f'S{n}', 'l_name': 'Banda'} for n in range(count)]
+    ).inserted_ids
+    users = []
+    for n, student_id in enumerate(student_ids):
+        username, email, student_number = f'user{n}', f'user{n}@example.edu', f'2025{n:06d}'
+        users.append({
+            'username': username, 'email': email, 'student_number': student_number, 'password': password,
+            'login_keys': build_login_keys(username, email, student_number), 'full_name': f'S{n} Banda',
+            'user_type': 'student', 'student_id': student_id, 'status': 'active'
+        })
+    app.users_collection.insert_many(users)
+
+def or_query(identifier):
+    return {'$or': [{'username': identifier}, {'email': identifier}, {'student_number': identifier}]}
+
+def login_before(identifier):
+    app.users_collection.find_one({'user_type': 'staff', 'privilege_level': 'admin'})
+    user = app.users_collection.find_one(or_query(identifier))
+    if user and check_password_hash(user['password'], PASSWORD):
+        app.students_collection.find_one({'_id': user['student_id']})
+        app.users_collection.update_one({'_id': user['_id']}, {'$set': {'last_login': datetime.utcnow()}})
+
+def login_after(identifier):
+    user = find_login_user(identifier)
+    if user and check_password_hash(user['password'], PASSWORD):
+        app.users_collection.update_one({'_id': user['_id']}, {'$set': {'last_login': datetime.utcnow()}})
+
+def explain(query):
+    stats = app.db.command(
+        'explain', {'find': app.users_collection.name, 'filter': query, 'limit': 1}, verbosity='executionStats'
+    )['executionStats']
+    return stats['totalKeysExamined'], stats['totalDocsExamined']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--logins', type=int, default=2000)
+    args = parser.parse_args()
+
+    try:
+        print(f'Seeding {args.users} users...')
+        seed(args.users)
+        identifiers = []
+        for n in random.sample(range(args.users), min(args.logins, args.users)):
+            identifiers.append(random.choice([f'user{n}', f'USER{n}@example.edu', f'2025{n:06d}']))
+
+        print(f"{'path':<8} {'logins/s':>10} {'round trips/login':>18}")
+        for name, login in (('before', login_before), ('after', login_after)):
+            # The old $or lookup was case-sensitive, so it is given the stored spelling
+            run_identifiers = [i.lower() for i in identifiers] if login is login_before else identifiers
+            ms, commands = measure(lambda: [login(identifier) for identifier in run_identifiers])
+            print(f'{name:<8} {len(identifiers) / ms * 1000:>10.0f} {commands / len(identifiers):>18.1f}')
+
+        print(f"\n{'lookup':<12} {'keys':>6} {'docs':>6}")
+        identifier = identifiers[0].lower()
+        for name, query in (('$or', or_query(identifier)), ('login_keys', {'login_keys': identifier})):
+            keys, docs = explain(query)
+            print(f'{name:<12} {keys:>6} {docs:>6}')
+    finally:
+        drop_scratch_database(app)
+
+if __name__ == '__main__':
+    main()
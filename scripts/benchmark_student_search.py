@@ -0,0 +1,118 @@
+"""Compare the old regex student search with the indexed search pipeline that ships.
+
+Seeds a scratch database with synthetic students, runs the same search terms through
+the old unanchored $regex query (which returned every match) and through the
+search_pipeline aggregation that search_students runs (match on search_keys, rank,
+sort every match, then one page), and prints the median latency and what explain()
+reports each one examined. The scratch database is dropped afterwards.
+
+    python scripts/benchmark_student_search.py --uri mongodb://localhost:27017 --students 100000 --runs 50
+"""
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import string
+import time
+
+from pymongo import MongoClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by path: importing the app package would connect to the app's database, build
+# its indexes and bootstrap the default admin there
+_spec = importlib.util.spec_from_file_location('search', os.path.join(ROOT, 'app', 'search.py'))
+search = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(search)
+
+FIRST_NAMES = ['Chomba', 'Chanda', 'Mwansa', 'Mulenga', 'Bwalya', 'Natasha', 'Joseph', 'Mary', 'Kelvin', 'Ruth']
+LAST_NAMES = ['Mwale', 'Banda', 'Phiri', 'Tembo', 'Zulu', 'Lungu', 'Sakala', 'Mumba', 'Daka', 'Ngoma']
+
+def regex_filter(term):
+    """The search the routes ran before search_keys existed"""
+    return {'status': 'active', '$or': [
+        {'student_number': {'$regex': term, '$options': 'i'}},
+        {'f_name': {'$regex': term, '$options': 'i'}},
+        {'l_name': {'$regex': term, '$options': 'i'}}
+    ]}
+
+def seed(collection, count, batch_size=5000):
+    collection.drop()
+    collection.create_index([('search_keys', 1), ('status', 1)])
+    batch = []
+    for n in range(count):
+        student = {
+            'student_number': f'{2020 + n % 6}{n:07d}',
+            'f_name': random.choice(FIRST_NAMES) + random.choice(string.ascii_lowercase),
+            'l_name': random.choice(LAST_NAMES),
+            'status': 'active'
+        }
+        student.update(search.build_search_fields(student))
+        batch.append(student)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+def _timed(run, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        rows = len(run())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), rows
+
+def _execution_stats(explain):
+    # Pipelines pushed down to the query engine report at the top level, others under $cursor
+    if 'executionStats' in explain:
+        return explain['executionStats']
+    return explain['stages'][0]['$cursor']['executionStats']
+
+def measure_regex(collection, term, runs):
+    query = regex_filter(term)
+    median, rows = _timed(lambda: list(collection.find(query, {'_id': 1})), runs)
+    stats = _execution_stats(collection.database.command(
+        'explain', {'find': collection.name, 'filter': query}, verbosity='executionStats'
+    ))
+    return median, rows, stats['totalKeysExamined'], stats['totalDocsExamined']
+
+def measure_pipeline(collection, term, runs, per_page):
+    pipeline = search.search_pipeline(term, {'status': 'active'}, per_page=per_page)
+    median, rows = _timed(lambda: list(collection.aggregate(pipeline)), runs)
+    stats = _execution_stats(collection.database.command(
+        'explain', {'aggregate': collection.name, 'pipeline': pipeline, 'cursor': {}}, verbosity='executionStats'
+    ))
+    return median, rows, stats['totalKeysExamined'], stats['totalDocsExamined']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--per-page', type=int, default=search.DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    database = client['Uniberg_search_benchmark']
+    collection = database['Student Information']
+    try:
+        print(f'Seeding {args.students} students...')
+        seed(collection, args.students)
+        # Short, broad prefixes sort many matches before the page is cut; long ones few
+        terms = ['c', 'ch', 'chom', 'Mwale', '2023000', '017', 'zulu', 'nomatch']
+        print(f"{'term':<10} {'query':<10} {'median ms':>10} {'rows':>7} {'keys':>9} {'docs':>9}")
+        for term in terms:
+            for name, result in (
+                ('regex', measure_regex(collection, term, args.runs)),
+                ('pipeline', measure_pipeline(collection, term, args.runs, args.per_page))
+            ):
+                median, rows, keys, docs = result
+                print(f'{term:<10} {name:<10} {median:>10.2f} {rows:>7} {keys:>9} {docs:>9}')
+    finally:
+        client.drop_database(database.name)
+        client.close()
+
+if __name__ == '__main__':
+    main()
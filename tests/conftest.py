@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# The app connects to MongoDB and creates its indexes at import time, so the tests run
+# against mongomock patched in before the first import. Without Flask or mongomock
+# installed the whole suite is skipped.
+pytest.importorskip('flask')
+mongomock = pytest.importorskip('mongomock')
+
+import pymongo  # noqa: E402
+
+pymongo.MongoClient = mongomock.MongoClient
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as application  # noqa: E402
+from app.catalog import catalog  # noqa: E402
+
+# mongomock cannot check a unique sparse index over array values (users.login_keys);
+# uniqueness is the database's job and none of the tests rely on it
+application.users_collection.drop_index('login_keys_1')
+
+COUNTED_METHODS = (
+    'find', 'find_one', 'aggregate', 'count_documents', 'distinct',
+    'insert_one', 'insert_many', 'update_one', 'update_many', 'replace_one',
+    'delete_one', 'delete_many', 'bulk_write', 'find_one_and_update'
+)
+
+class QueryCounter:
+    """Counts database round trips (collection method calls) made by the code under test"""
+
+    def __init__(self):
+        self.calls = []
+        self._local = threading.local()
+
+    @property
+    def count(self):
+        return len(self.calls)
+
+    def on(self, collection):
+        """Calls made on one collection"""
+        return [method for name, method in self.calls if name == collection.name]
+
+    def reset(self):
+        self.calls = []
+
+    def wrap(self, method_name, method):
+        counter = self
+
+        def counted(collection, *args, **kwargs):
+            # mongomock implements some methods on top of others; count only the outer call
+            depth = getattr(counter._local, 'depth', 0)
+            if depth == 0:
+                counter.calls.append((collection.name, method_name))
+            counter._local.depth = depth + 1
+            try:
+                return method(collection, *args, **kwargs)
+            finally:
+                counter._local.depth = depth
+        return counted
+
+@pytest.fixture
+def db():
+    """A clean mock database and a cold catalog cache"""
+    for name in application.db.list_collection_names():
+        application.db[name].delete_many({})
+    catalog.invalidate()
+    yield application.db
+    catalog.invalidate()
+
+@pytest.fixture
+def queries(monkeypatch):
+    """QueryCounter recording every collection call made while the test runs"""
+    counter = QueryCounter()
+    for name in COUNTED_METHODS:
+        method = getattr(mongomock.collection.Collection, name)
+        monkeypatch.setattr(mongomock.collection.Collection, name, counter.wrap(name, method))
+    return counter
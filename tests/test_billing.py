@@ -0,0 +1,61 @@
+from app import students_collection, programs_collection, courses_collection, student_courses_collection, accounts_collection, balances_collection
+from app.billing import run_billing_batch, get_semester_fees_for_students
+from datetime import datetime
+
+def _seed_students(count):
+    program_id = programs_collection.insert_one({'name': 'BSc', 'level': 'degree'}).inserted_id
+    course_ids = courses_collection.insert_many(
+        [{'code': f'C{n}', 'course_fee': 100} for n in range(2)]
+    ).inserted_ids
+    student_ids = students_collection.insert_many(
+        [{'f_name': f'S{n}', 'program_id': program_id} for n in range(count)]
+    ).inserted_ids
+    student_courses_collection.insert_many([
+        {'student_id': student_id, 'course_id': course_id, 'academic_year': '2025/2026', 'semester': '1'}
+        for student_id in student_ids for course_id in course_ids
+    ])
+    return [str(student_id) for student_id in student_ids]
+
+def _build_transaction(student, amount, current_balance):
+    return {
+        'student_id': student['_id'], 'type': 'Billing', 'debit': amount, 'credit': 0,
+        'semester': '1', 'academic_year': '2025/2026', 'created_at': datetime.utcnow()
+    }
+
+def _semester_fees(students):
+    return get_semester_fees_for_students(students, '1', '2025/2026')
+
+def _bill(queries, student_ids):
+    queries.reset()
+    result = run_billing_batch(student_ids, _build_transaction, amount_for=_semester_fees)
+    return result, queries.count
+
+def test_billing_query_count_does_not_grow_with_batch_size(db, queries):
+    _, few = _bill(queries, _seed_students(5))
+    _, many = _bill(queries, _seed_students(300))
+    assert few == many
+
+def test_billing_inserts_the_batch_once(db, queries):
+    student_ids = _seed_students(50)
+    result, _ = _bill(queries, student_ids)
+
+    assert result['created'] == 50
+    assert result['failures'] == []
+    assert queries.on(accounts_collection).count('insert_many') == 1
+    assert accounts_collection.count_documents({}) == 50
+
+def test_billing_running_balance_and_summaries(db, queries):
+    student_ids = _seed_students(3) + ['not-an-id']
+    result, _ = _bill(queries, student_ids)
+    fee = _semester_fees(list(students_collection.find()))[result['transactions'][0]['student_id']]
+
+    assert result['created'] == 3
+    assert result['failures'] == [{'student_id': 'not-an-id', 'error': 'Invalid student ID'}]
+    for transaction in result['transactions']:
+        assert transaction['balance_after'] == fee
+        summary = balances_collection.find_one({'student_id': transaction['student_id'], 'academic_year': None})
+        assert summary['balance'] == fee
+
+    # A second run starts from the stored balances
+    second, _ = _bill(queries, student_ids[:3])
+    assert all(transaction['balance_after'] == 2 * fee for transaction in second['transactions'])
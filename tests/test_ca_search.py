@@ -0,0 +1,41 @@
+from app import app as flask_app, students_collection, courses_collection, student_courses_collection
+from app.catalog import catalog
+
+def _seed():
+    course_ids = courses_collection.insert_many([
+        {'code': 'MAT110', 'name': 'Calculus'},
+        {'code': None, 'name': None},
+        {'name': 'Physics'}
+    ]).inserted_ids
+    student_ids = students_collection.insert_many([
+        {'student_number': f'2025000{n}', 'f_name': f_name, 'l_name': l_name, 'status': 'active'}
+        for n, (f_name, l_name) in enumerate([('Chomba', 'Mwale'), ('Chanda', 'Banda'), ('Mwansa', 'Phiri'), ('Bwalya', 'Zulu')])
+    ]).inserted_ids
+    # The last student is not enrolled this term
+    student_courses_collection.insert_many([
+        {'student_id': student_id, 'course_id': course_id, 'academic_year': '2025/2026', 'semester': '1'}
+        for student_id, courses in zip(student_ids, [course_ids, course_ids[:1], course_ids[1:]])
+        for course_id in courses
+    ])
+    catalog.invalidate()
+
+def _search(**args):
+    with flask_app.test_client() as client:
+        response = client.get('/ca/search_students', query_string=args)
+    assert response.status_code == 200, response.get_json()
+    return [(student['l_name'], student['enrolled_courses_count']) for student in response.get_json()]
+
+def test_listing_pages_before_counting_enrollments(db, queries):
+    _seed()
+
+    assert _search(per_page=2) == [('Banda', 1), ('Mwale', 3)]
+    queries.reset()
+    assert _search(per_page=2, page=2) == [('Phiri', 2)]
+    assert queries.on(student_courses_collection).count('aggregate') == 1
+    assert queries.on(students_collection).count('aggregate') == 0
+
+def test_course_filter_skips_courses_without_code_or_name(db):
+    _seed()
+
+    assert _search(course_code='mat') == [('Banda', 1), ('Mwale', 1)]
+    assert _search(course_name='phys') == [('Mwale', 1), ('Phiri', 1)]
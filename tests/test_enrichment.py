@@ -0,0 +1,60 @@
+from app import schools_collection, programs_collection, courses_collection, students_collection
+from app.enrichment import enrich_courses, enrich_programs, fetch_by_ids
+from app.catalog import catalog
+
+def _seed_courses(count):
+    school_id = schools_collection.insert_one({'name': 'School of Science'}).inserted_id
+    program_ids = programs_collection.insert_many(
+        [{'name': f'Program {n}', 'school_id': school_id} for n in range(3)]
+    ).inserted_ids
+    course_ids = courses_collection.insert_many([
+        {'name': f'Course {n}', 'code': f'C{n:03}', 'program_id': program_ids[n % 3], 'credits': 3}
+        for n in range(count)
+    ]).inserted_ids
+    return [{'course_id': course_id} for course_id in course_ids]
+
+def _queries_for(queries, records, **options):
+    catalog.invalidate()
+    queries.reset()
+    enrich_courses(records, **options)
+    return queries.count
+
+def test_enrich_courses_query_count_does_not_grow_with_courses(db, queries):
+    few = _queries_for(queries, _seed_courses(5))
+    many = _queries_for(queries, _seed_courses(200))
+
+    assert few == many
+    assert many <= 3  # one load each for courses, programs and schools
+
+def test_enrich_courses_attaches_program_and_school(db, queries):
+    records = _seed_courses(4)
+    enrich_courses(records)
+
+    for record in records:
+        assert record['course']['_id'] == record['course_id']
+        assert record['program']['_id'] == record['course']['program_id']
+        assert record['school']['name'] == 'School of Science'
+
+def test_enrich_courses_costs_nothing_on_a_warm_cache(db, queries):
+    records = _seed_courses(20)
+    enrich_courses(records)
+
+    queries.reset()
+    enrich_courses(records)
+    assert queries.count == 0
+
+def test_enrich_programs_query_count_is_constant(db, queries):
+    _seed_courses(1)
+    program_ids = [p['_id'] for p in programs_collection.find()]
+    catalog.invalidate()
+    queries.reset()
+    enrich_programs([{'program_id': program_ids[n % 3]} for n in range(100)])
+    assert queries.count <= 2
+
+def test_fetch_by_ids_is_one_query(db, queries):
+    ids = students_collection.insert_many([{'f_name': f'S{n}'} for n in range(50)]).inserted_ids
+    queries.reset()
+    documents = fetch_by_ids(students_collection, ids + ['not-an-id', None])
+
+    assert queries.count == 1
+    assert len(documents) == 50
@@ -0,0 +1,83 @@
+import io
+from app import app as flask_app, students_collection, courses_collection, grades_collection, transcript_versions_collection
+from app.grade_import import import_grades_csv
+from app.catalog import catalog
+from app.transcripts import ALL_STUDENTS
+
+COURSE_CODES = ['MAT110', 'PHY110', 'CHE110']
+
+def _seed(student_count):
+    courses_collection.insert_many([{'code': code, 'name': code, 'credits': 3} for code in COURSE_CODES])
+    students_collection.insert_many([{'student_number': f'2025{n:04d}'} for n in range(student_count)])
+
+def _csv(student_count, extra_rows=()):
+    lines = ['student_number,course_code,marks,grade']
+    for n in range(student_count):
+        for code in COURSE_CODES:
+            lines.append(f'2025{n:04d},{code},{(n * 7) % 101},')
+    lines.extend(extra_rows)
+    return io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+def _import(queries, student_count, batch_size=1000, extra_rows=()):
+    catalog.invalidate()
+    queries.reset()
+    report = import_grades_csv(_csv(student_count, extra_rows), 'final', '2025/2026', '1', batch_size=batch_size)
+    return report, queries.on(grades_collection).count('bulk_write')
+
+def test_import_writes_one_bulk_per_batch(db, queries):
+    _seed(200)
+    report, grade_writes = _import(queries, 200, batch_size=240)
+
+    assert report['imported'] == 600
+    assert report['documents'] == 200
+    assert grade_writes == 3  # 600 rows in batches of 240
+    assert grades_collection.count_documents({}) == 200
+
+def test_import_query_count_does_not_grow_with_rows(db, queries):
+    _seed(300)
+    _, few_writes = _import(queries, 10)
+    few = queries.count
+    grades_collection.delete_many({})
+    _, many_writes = _import(queries, 300)
+
+    assert few_writes == many_writes == 1
+    assert queries.count == few
+
+def test_import_reports_bad_rows_and_keeps_the_rest(db, queries):
+    _seed(2)
+    report, _ = _import(queries, 2, extra_rows=[
+        '99999999,MAT110,50,',
+        '20250000,NOPE101,50,',
+        '20250001,MAT110,abc,',
+        '20250001,PHY110,,XYZ',
+        '20250001,CHE110,,DEF'
+    ])
+
+    assert report['imported'] == 7
+    assert report['error_count'] == 4
+    assert [error['row'] for error in report['errors']] == [8, 9, 10, 11]
+    document = grades_collection.find_one({'student_id': students_collection.find_one({'student_number': '20250001'})['_id']})
+    assert 'DEF' in [entry['grade'] for entry in document['grades']]
+
+def test_documents_spanning_batches_are_counted_once(db, queries):
+    _seed(200)
+    report, grade_writes = _import(queries, 200, batch_size=100)
+
+    assert grade_writes == 6  # 100-row batches split some students' three rows across two writes
+    assert report['documents'] == 200
+
+def test_import_invalidates_only_the_students_written(db, queries):
+    _seed(3)
+    students_collection.insert_one({'student_number': '20259999'})
+    _import(queries, 3)
+
+    versions = {row['_id'] for row in transcript_versions_collection.find()}
+    assert versions == {str(student['_id']) for student in students_collection.find({'student_number': {'$ne': '20259999'}})}
+    assert ALL_STUDENTS not in versions
+
+def test_upload_rejects_unknown_exam_type(db):
+    with flask_app.test_client() as client:
+        response = client.post('/grades/upload_grades/midterm', data={'file': (_csv(1), 'grades.csv')})
+
+    assert response.status_code == 400
+    assert grades_collection.count_documents({}) == 0
@@ -0,0 +1,88 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from app import app as flask_app, users_collection, settings_collection
+from app.routes import login
+from app import users
+from app.users import build_login_keys, find_login_user, migrate_login_keys
+
+@pytest.fixture
+def client(db):
+    flask_app.config['WTF_CSRF_ENABLED'] = False
+    yield flask_app.test_client()
+    flask_app.config['WTF_CSRF_ENABLED'] = True
+
+def _seed_user(username='jbanda', email='jbanda@example.edu'):
+    return users_collection.insert_one({
+        'username': username, 'email': email, 'password': generate_password_hash('secret'),
+        'login_keys': build_login_keys(username, email), 'user_type': 'staff', 'staff_id': None,
+        'privilege_level': 'lecturer', 'status': 'active', 'full_name': 'J Banda'
+    }).inserted_id
+
+def test_login_does_not_bootstrap_the_admin(client, queries):
+    _seed_user()
+    queries.reset()
+    response = client.post('/login', data={'username': 'JBanda', 'password': 'secret'})
+
+    assert response.status_code == 302
+    # One indexed read of the user plus the last_login update; no admin or marker checks
+    assert queries.calls == [(users_collection.name, 'find_one'), (users_collection.name, 'update_one')]
+
+def test_bootstrap_is_one_read_once_marked(db, queries):
+    settings_collection.insert_one({'_id': login.DEFAULT_ADMIN_MARKER})
+    queries.reset()
+    login.bootstrap_default_admin()
+    assert queries.calls == [(settings_collection.name, 'find_one')]
+
+def test_failed_admin_creation_leaves_no_marker(db, monkeypatch):
+    monkeypatch.setattr(login, 'create_default_admin', lambda: False)
+    login.bootstrap_default_admin()
+    assert settings_collection.find_one({'_id': login.DEFAULT_ADMIN_MARKER}) is None
+
+def test_marker_written_once_an_admin_exists(db):
+    login.bootstrap_default_admin()
+
+    assert login.admin_exists()
+    assert settings_collection.find_one({'_id': login.DEFAULT_ADMIN_MARKER}) is not None
+
+def test_legacy_account_found_until_migrated(db, monkeypatch):
+    monkeypatch.setattr(users, '_login_keys_migrated', False)
+    user_id = users_collection.insert_one({'username': 'legacy', 'email': 'legacy@example.edu'}).inserted_id
+
+    assert find_login_user('legacy')['_id'] == user_id
+    assert users_collection.find_one({'_id': user_id})['login_keys'] == ['legacy', 'legacy@example.edu']
+
+def test_miss_is_one_indexed_read_once_migrated(db, queries, monkeypatch):
+    monkeypatch.setattr(users, '_login_keys_migrated', False)
+    _seed_user()
+    migrate_login_keys()
+    queries.reset()
+
+    assert find_login_user('nobody') is None
+    assert find_login_user('nobody') is None
+    # The migration marker is read once per process, then only the login_keys lookup runs
+    assert queries.calls == [
+        (users_collection.name, 'find_one'), (settings_collection.name, 'find_one'), (users_collection.name, 'find_one')
+    ]
+
+def test_case_colliding_accounts_are_skipped_not_fatal(db, monkeypatch):
+    monkeypatch.setattr(users, '_login_keys_migrated', False)
+    first = users_collection.insert_one({'username': 'JBanda', 'email': 'j.banda@example.edu'}).inserted_id
+    second = users_collection.insert_one({'username': 'jbanda', 'email': 'jbanda@example.edu'}).inserted_id
+
+    report = migrate_login_keys()
+
+    assert report['updated'] == 1
+    assert report['collisions'] == [{'_id': second, 'login_keys': ['jbanda', 'jbanda@example.edu']}]
+    assert users_collection.find_one({'_id': first})['login_keys'] == ['jbanda', 'j.banda@example.edu']
+    assert 'login_keys' not in users_collection.find_one({'_id': second})
+    # The fallback stays on, so the skipped account can still sign in by email
+    assert settings_collection.find_one({'_id': users.LOGIN_KEYS_MIGRATED}) is None
+    assert find_login_user('jbanda@example.edu')['_id'] == second
+
+def test_lazy_backfill_with_a_taken_key_still_logs_in(db, monkeypatch):
+    monkeypatch.setattr(users, '_login_keys_migrated', False)
+    _seed_user(username='jbanda', email='j.banda@example.edu')
+    legacy = users_collection.insert_one({'username': 'JBanda', 'email': 'legacy@example.edu'}).inserted_id
+
+    assert find_login_user('legacy@example.edu')['_id'] == legacy
+    assert 'login_keys' not in users_collection.find_one({'_id': legacy})
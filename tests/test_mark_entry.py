@@ -0,0 +1,50 @@
+from app import students_collection, grades_collection
+from app.mark_entry import save_semester_grades
+from pymongo.errors import BulkWriteError
+
+def _update(student_id, course_id='c1', **extra):
+    return dict({
+        'student_id': str(student_id), 'academic_year': '2025/2026', 'semester': '1', 'exam_type': 'final',
+        'grades': [{'course_id': course_id, 'marks': 70, 'grade': 'B'}]
+    }, **extra)
+
+def _students(count):
+    return students_collection.insert_many([{'student_number': f'2025{n:04d}'} for n in range(count)]).inserted_ids
+
+def test_bad_client_version_is_a_row_error(db):
+    student_id, = _students(1)
+    results = save_semester_grades([_update(student_id, version='abc'), _update(student_id, version=''),
+                                    _update(student_id, version=True)])
+
+    assert [result['success'] for result in results] == [False, False, False]
+    assert all('version must be a whole number' in result['error'] and not result['conflict'] for result in results)
+    assert grades_collection.count_documents({}) == 0
+
+def test_numeric_string_version_is_accepted(db):
+    student_id, = _students(1)
+    assert save_semester_grades([_update(student_id)])[0]['version'] == 1
+
+    result = save_semester_grades([_update(student_id, course_id='c2', version='1')])[0]
+    assert result['success'] and result['version'] == 2
+
+def test_failed_write_does_not_turn_later_documents_into_conflicts(db, monkeypatch):
+    first, broken, last = _students(3)
+    collection_type = type(grades_collection)
+    original = collection_type.bulk_write
+
+    def bulk_write(collection, operations, ordered=True, **kwargs):
+        # The server rejects the broken student's write, e.g. a document validation failure
+        for index, operation in enumerate(operations):
+            if operation._filter.get('student_id') == broken:
+                if index:
+                    original(collection, operations[:index], ordered=ordered, **kwargs)
+                raise BulkWriteError({'writeErrors': [{'index': index, 'code': 121, 'errmsg': 'Document failed validation'}]})
+        return original(collection, operations, ordered=ordered, **kwargs)
+
+    monkeypatch.setattr(collection_type, 'bulk_write', bulk_write)
+    results = save_semester_grades([_update(first), _update(broken), _update(last)])
+
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['error'] == 'Document failed validation' and not results[1]['conflict']
+    assert not results[2]['conflict']
+    assert grades_collection.count_documents({'student_id': last}) == 1
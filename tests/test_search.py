@@ -0,0 +1,44 @@
+from app import students_collection
+from app.search import build_search_fields, search_filter, search_stages, tokenize
+
+def _seed(students):
+    for student in students:
+        student = dict(student, status='active')
+        student.update(build_search_fields(student))
+        students_collection.insert_one(student)
+
+def test_search_fields_are_prefixes_of_normalised_tokens():
+    fields = build_search_fields({'student_number': 'UB-2024/017', 'f_name': 'Chómba', 'l_name': 'Mwale'})
+
+    assert fields['search_terms'] == ['ub', '2024', '017', 'chomba', 'mwale']
+    assert {'c', 'ch', 'chomba', 'mw', 'mwale', '2024', '20', '017'} <= set(fields['search_keys'])
+
+def test_search_filter_is_an_index_lookup_not_a_regex():
+    assert search_filter('Chom  Mw') == {'search_keys': {'$all': ['chom', 'mw']}}
+    assert search_filter('.*(a+)+$') == {'search_keys': {'$all': ['a']}}
+    assert search_filter('  ') == {}
+
+def test_search_stages_match_on_the_indexed_fields_first():
+    match = search_stages('chomba', {'status': 'active'})[0]['$match']
+    assert match == {'status': 'active', 'search_keys': {'$all': ['chomba']}}
+    assert '$regex' not in repr(search_stages('chomba', {'status': 'active'}))
+
+def test_prefix_search_finds_students_by_any_token(db):
+    _seed([
+        {'student_number': '2024001', 'f_name': 'Chomba', 'l_name': 'Mwale'},
+        {'student_number': '2024002', 'f_name': 'Chanda', 'l_name': 'Banda'},
+        {'student_number': '2023003', 'f_name': 'Mwansa', 'l_name': 'Phiri'}
+    ])
+
+    def names(term):
+        return sorted(s['f_name'] for s in students_collection.find(search_filter(term)))
+
+    assert names('ch') == ['Chanda', 'Chomba']
+    assert names('2024') == ['Chanda', 'Chomba']
+    assert names('mw') == ['Chomba', 'Mwansa']
+    assert names('CHOMBA mwa') == ['Chomba']
+    # Student numbers also match from the middle; names only by prefix
+    assert names('003') == ['Mwansa']
+    assert names('240') == ['Chanda', 'Chomba']
+    assert names('omba') == []
+    assert tokenize('Chómba') == ['chomba']
@@ -0,0 +1,95 @@
+from app import students_collection, transcript_versions_collection
+from app import transcripts
+from app.config import SystemConfig
+from app.grading import GRADE_POINTS
+from app.transcripts import get_transcript, invalidate_transcripts, transcript_from_rows, ALL_STUDENTS
+from datetime import datetime
+import pytest
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Count transcript builds (mongomock cannot run the $unionWith/$lookup aggregation)"""
+    calls = []
+    monkeypatch.setattr(transcripts, 'build_transcript', lambda student_id: calls.append(student_id) or [])
+    invalidate_transcripts()
+    return calls
+
+def _student():
+    return students_collection.insert_one({'student_number': '20250001'}).inserted_id
+
+def test_cache_hit_is_one_version_query(db, builds, queries):
+    student_id = _student()
+    get_transcript(student_id)
+    queries.reset()
+    get_transcript(student_id)
+
+    assert len(builds) == 1
+    assert queries.calls == [(transcript_versions_collection.name, 'find')]
+
+def test_write_in_another_process_is_seen(db, builds):
+    student_id, other_id = _student(), _student()
+    get_transcript(student_id)
+    get_transcript(other_id)
+
+    # Another worker's invalidate_transcripts only reaches this process through MongoDB
+    transcript_versions_collection.update_one({'_id': str(student_id)}, {'$inc': {'version': 1}}, upsert=True)
+    get_transcript(student_id)
+    get_transcript(other_id)
+    assert builds == [str(student_id), str(other_id), str(student_id)]
+
+    transcript_versions_collection.update_one({'_id': ALL_STUDENTS}, {'$inc': {'version': 1}}, upsert=True)
+    get_transcript(student_id)
+    get_transcript(other_id)
+    assert len(builds) == 5
+
+def test_invalidate_records_versions(db, builds):
+    student_id = _student()
+    invalidate_transcripts(student_id, str(student_id))
+    invalidate_transcripts()
+
+    assert transcript_versions_collection.find_one({'_id': str(student_id)})['version'] == 1
+    # Once here and once by the builds fixture
+    assert transcript_versions_collection.find_one({'_id': ALL_STUDENTS})['version'] == 2
+
+def test_least_recently_used_is_evicted(db, builds, monkeypatch):
+    monkeypatch.setattr(SystemConfig, 'TRANSCRIPT_CACHE_SIZE', 2)
+    first, second, third = _student(), _student(), _student()
+    get_transcript(first)
+    get_transcript(second)
+    get_transcript(first)
+    get_transcript(third)
+
+    builds.clear()
+    get_transcript(first)
+    get_transcript(second)
+    assert builds == [str(second)]
+
+def test_rows_are_shaped_into_semesters():
+    entered_at = datetime(2025, 6, 1)
+    rows = [
+        {'_id': {'exam_type': 'final', 'academic_year': '2025/2026', 'semester': '1'}, 'entered_at': entered_at,
+         'courses': [
+             {'course_id': 'c1', 'course': {'code': 'MAT110', 'name': 'Calculus', 'credits': 3},
+              'marks': 72, 'grade': 'B+', 'remarks': 'Proceed'},
+             {'course_id': 'c2', 'course': {'code': 'PHY110', 'name': 'Physics', 'credits': None},
+              'marks': None, 'grade': 'EX', 'remarks': 'Exempted'},
+             # A deleted course has no course details and is left out
+             {'course_id': 'gone', 'marks': 50, 'grade': 'C', 'remarks': 'Proceed'}
+         ]},
+        # A grade document with an empty grades array
+        {'_id': {'exam_type': 'mock', 'academic_year': '2025/2026', 'semester': '1'}, 'courses': [{}]}
+    ]
+
+    final, mock = transcript_from_rows(rows)
+
+    assert (final['exam_type'], final['academic_year'], final['semester'], final['entered_at']) == \
+        ('final', '2025/2026', '1', entered_at)
+    assert [grade['course_code'] for grade in final['grades']] == ['MAT110', 'PHY110']
+    assert final['grades'][0] == {
+        'course_id': 'c1', 'course_code': 'MAT110', 'course_name': 'Calculus', 'credits': 3,
+        'marks': 72, 'grade': 'B+', 'remarks': 'Proceed'
+    }
+    assert final['grades'][1]['credits'] == 0
+    assert final['credits'] == 3
+    assert final['gpa'] == GRADE_POINTS['B+']  # EX and zero-credit entries do not count
+    assert mock['grades'] == [] and mock['credits'] == 0